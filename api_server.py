@@ -0,0 +1,307 @@
+"""
+Headless HTTP API over the same RAG pipeline as the Streamlit app.
+
+    python api_server.py --host 0.0.0.0 --port 8000
+    uvicorn api_server:app --port 8000
+
+Endpoints: POST /query, POST /query/stream (server-sent events), POST /retrieve,
+GET /healthz (liveness), GET /readyz (resources loaded), GET /metrics (Prometheus text).
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from langchain.schema.document import Document
+from langchain_core.runnables.config import run_in_executor
+from pydantic import BaseModel, Field
+
+from config import AppConfig
+from rag_components.answer_cache import AnswerCache
+from rag_components.image_record import ImageRecord
+from rag_components.metrics import METRICS
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+
+class QueryRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    documents: Optional[List[str]] = None  # collection mode: catalog keys to search (default all)
+    include_context: bool = True
+
+
+class RetrieveRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    documents: Optional[List[str]] = None
+
+
+def serialize_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON form of a parsed context. Images are described, not inlined."""
+    images = []
+    for image in context.get("images", []):
+        if isinstance(image, ImageRecord):
+            images.append({"mime_type": image.mime_type, "width": image.width, "height": image.height, "metadata": image.metadata})
+        else:
+            images.append({"mime_type": "image/jpeg", "metadata": {}})
+    return {
+        "texts": [
+            {"page_content": doc.page_content, "metadata": doc.metadata} if isinstance(doc, Document) else {"page_content": str(doc), "metadata": {}}
+            for doc in context.get("texts", [])
+        ],
+        "images": images,
+        "doc_ids": context.get("doc_ids", []),
+        "scores": context.get("scores", []),
+        "packing": context.get("packing"),
+        "index_version": context.get("index_version"),
+    }
+
+
+class Overloaded(Exception):
+    pass
+
+
+class RAGService:
+    """
+    Owns the shared RAGChainManager. Loads it in the background so the process can
+    answer liveness probes immediately, coalesces identical in-flight questions onto one
+    chain run, and bounds concurrency: at most `max_concurrency` chain runs execute and
+    at most `max_queue` more wait, beyond which requests are rejected with 429.
+    """
+
+    def __init__(self, config: AppConfig, max_concurrency: int = 16, max_queue: int = 64, request_timeout: float = 60.0):
+        self.config = config
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.manager: Optional[RAGChainManager] = None
+        self.load_error: Optional[str] = None
+        self.started_at = time.time()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._inflight: Dict[Tuple[str, Tuple[str, ...]], asyncio.Task] = {}
+        self._load_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._load_task = asyncio.get_running_loop().create_task(self._load())
+
+    async def _load(self):
+        print("[INFO] RAGService: Loading resources...")
+        try:
+            resource_loader = ResourceLoader(self.config)
+            await run_in_executor(None, resource_loader.load_all)
+            self.manager = await run_in_executor(None, RAGChainManager, resource_loader)
+            print("[INFO] RAGService: Ready.")
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] RAGService: Loading resources failed: {self.load_error}")
+
+    @property
+    def ready(self) -> bool:
+        return self.manager is not None
+
+    def require_manager(self) -> RAGChainManager:
+        if self.manager is None:
+            raise HTTPException(status_code=503, detail=self.load_error or "Resources are still loading.")
+        return self.manager
+
+    def saturated(self) -> bool:
+        return self._semaphore.locked() and self._waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        """Admission control around one chain run."""
+        if self.saturated():
+            METRICS.inc("rag_api_rejected_total", 1, "Requests rejected because the queue was full.")
+            raise Overloaded()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _run_query(self, question: str, documents: Optional[List[str]]) -> Dict[str, Any]:
+        async with self.slot():
+            return await self.require_manager().ainvoke_with_context(question, documents)
+
+    async def query(self, question: str, documents: Optional[List[str]]) -> Tuple[Dict[str, Any], bool]:
+        """Returns (result, coalesced). Identical questions already in flight share one run."""
+        key = (AnswerCache.normalize(question), tuple(sorted(documents or [])))
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run_query(question, documents))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            METRICS.inc("rag_api_coalesced_total", 1, "Requests that joined an identical in-flight question.")
+        # shield: a caller that times out must not cancel the run other callers are waiting on.
+        result = await asyncio.wait_for(asyncio.shield(task), timeout=self.request_timeout)
+        return result, coalesced
+
+    async def retrieve(self, question: str, documents: Optional[List[str]]) -> Dict[str, Any]:
+        async with self.slot():
+            return await asyncio.wait_for(
+                self.require_manager().aretrieve_documents(question, documents), timeout=self.request_timeout
+            )
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "error": self.load_error,
+            "uptime_seconds": time.time() - self.started_at,
+            "in_flight": len(self._inflight),
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+
+def create_app(config: Optional[AppConfig] = None) -> FastAPI:
+    config = config or AppConfig()
+    service = RAGService(
+        config,
+        max_concurrency=config.API_MAX_CONCURRENCY,
+        max_queue=config.API_MAX_QUEUE,
+        request_timeout=config.API_REQUEST_TIMEOUT_SECONDS,
+    )
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI):
+        await service.start()
+        yield
+
+    app = FastAPI(title="PDF ChatBot API", lifespan=lifespan)
+    app.state.service = service
+
+    def error_response(e: Exception) -> JSONResponse:
+        if isinstance(e, Overloaded):
+            return JSONResponse({"detail": "Too many requests in flight."}, status_code=429, headers={"Retry-After": "1"})
+        if isinstance(e, asyncio.TimeoutError):
+            return JSONResponse({"detail": "Request timed out."}, status_code=504)
+        if isinstance(e, KeyError):
+            return JSONResponse({"detail": str(e).strip("'")}, status_code=404)
+        if isinstance(e, ValueError):
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        raise e
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz():
+        return JSONResponse(service.status(), status_code=200 if service.ready else 503)
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/query")
+    async def query(request: QueryRequest):
+        service.require_manager()
+        try:
+            result, coalesced = await service.query(request.question, request.documents)
+        except (Overloaded, asyncio.TimeoutError, KeyError, ValueError) as e:
+            return error_response(e)
+        body = {"answer": result["answer"], "timings": result.get("timings", {}), "coalesced": coalesced}
+        if request.include_context:
+            body["context"] = serialize_context(result["context"])
+        return body
+
+    @app.post("/retrieve")
+    async def retrieve(request: RetrieveRequest):
+        service.require_manager()
+        try:
+            context = await service.retrieve(request.question, request.documents)
+        except (Overloaded, asyncio.TimeoutError, KeyError, ValueError) as e:
+            return error_response(e)
+        return serialize_context(context)
+
+    @app.post("/query/stream")
+    async def query_stream(request: QueryRequest):
+        """
+        Server-sent events: one `context` event, `token` events, then `done`. A failure sends
+        an `error` event with an HTTP-like status before `done`; the whole stream, including
+        the wait for a slot, is bounded by API_REQUEST_TIMEOUT_SECONDS.
+        """
+        manager = service.require_manager()
+        # Reject before the 200 status line goes out; the slot itself is taken inside the stream.
+        if service.saturated():
+            return error_response(Overloaded())
+
+        def error_event(status: int, detail: str) -> str:
+            return f"event: error\ndata: {json.dumps({'status': status, 'detail': detail})}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + service.request_timeout
+
+            def remaining() -> float:
+                return max(0.0, deadline - loop.time())
+
+            stream = manager.astream(request.question, request.documents)
+            try:
+                async with AsyncExitStack() as stack:
+                    await asyncio.wait_for(stack.enter_async_context(service.slot()), remaining())
+                    while True:
+                        try:
+                            event = await asyncio.wait_for(anext(stream), remaining())
+                        except StopAsyncIteration:
+                            break
+                        if "context" in event:
+                            if request.include_context:
+                                yield f"event: context\ndata: {json.dumps(serialize_context(event['context']))}\n\n"
+                        elif "answer" in event:
+                            yield f"event: token\ndata: {json.dumps(event['answer'])}\n\n"
+            except Overloaded:
+                yield error_event(429, "Too many requests in flight.")
+            except asyncio.TimeoutError:
+                yield error_event(504, "Request timed out.")
+            except (KeyError, ValueError) as e:
+                yield error_event(400, str(e))
+            except Exception as e:
+                # The 200 status line has already gone out, so the failure can only be reported in-band.
+                print(f"[ERROR] api_server.py: Stream failed: {type(e).__name__}: {e}")
+                yield error_event(500, f"{type(e).__name__}: {e}")
+            finally:
+                await stream.aclose()
+            yield "event: done\ndata: {}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; with SHARED_INDEX_PATH set they share one memory-mapped index")
+    args = parser.parse_args()
+    if args.workers > 1:
+        if not AppConfig.SHARED_INDEX_PATH:
+            print("[WARN] api_server.py: Every worker loads its own copy of the index. Publish a snapshot and set "
+                  "SHARED_INDEX_PATH to share one.")
+        # Workers are separate processes, so uvicorn needs the import string rather than the app object.
+        uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
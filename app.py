@@ -1,53 +1,58 @@
-import streamlit as st 
+import time
+_APP_STARTED = time.perf_counter()
+
+import streamlit as st
 st.set_page_config(page_title="PDF Chatbot", layout="wide", initial_sidebar_state="auto")
 
 from config import AppConfig
-from rag_components.resource_loader import ResourceLoader
-from rag_components.retrieval_chain import RAGChainManager
+from rag_components.warmup import BackgroundLoader
 from ui.main_ui import MainUI
+# LangChain, FAISS and the OpenAI SDK are imported by the BackgroundLoader thread, not here,
+# so the first render does not wait for them.
+_SHELL_IMPORT_SECONDS = time.perf_counter() - _APP_STARTED
+
+
+@st.cache_resource
+def get_background_loader() -> BackgroundLoader:
+    """One loader per server process; every session polls the same one."""
+    print(f"[INFO] app.py: Starting background loading (shell imports took {_SHELL_IMPORT_SECONDS:.2f}s)...")
+    return BackgroundLoader(AppConfig(), shell_import_seconds=_SHELL_IMPORT_SECONDS).start()
+
+
+@st.cache_resource
+def start_metrics_endpoint(port: int):
+    from rag_components.metrics import start_metrics_server
 
+    return start_metrics_server(port)
 
-@st.cache_resource 
-def get_rag_chain_manager() -> RAGChainManager:
-
-    try:
-        print("[INFO] app.py: Attempting to load resources and initialize RAGChainManager...")
-        config = AppConfig() 
-        resource_loader = ResourceLoader(config)
-        resource_loader.load_all()
-        
-        rag_manager = RAGChainManager(resource_loader)
-        print("[INFO] app.py: RAGChainManager initialized successfully.")
-        return rag_manager
-    except (FileNotFoundError, ValueError) as e: 
-        print(f"[ERROR] app.py: Initialization failed in get_rag_chain_manager: {e}")
-        raise 
-    except Exception as e:
-        print(f"[ERROR] app.py: Unexpected initialization error in get_rag_chain_manager: {e}")
-        import traceback
-        print(traceback.format_exc())
-        raise
 
 def main():
     """
     Main function to run the Streamlit application.
     """
-    rag_manager = None
-    try:
-        rag_manager = get_rag_chain_manager()
-    except (FileNotFoundError, ValueError) as e:
-        st.error(f"Initialization Error: {e}") # 'st' is available here
-        print(f"[ERROR] app.py (main): Initialization failed: {e}")
-    except Exception as e:
-        st.error(f"An unexpected error occurred during initialization: {e}") # 'st' is available here
-        print(f"[ERROR] app.py (main): Unexpected initialization error: {e}")
-
-    if rag_manager:
-        ui = MainUI(rag_manager)
-        ui.run()
-    else:
-        print("[ERROR] app.py (main): RAG Manager is None, UI cannot start. An error should have been displayed on the page.")
+    config = AppConfig()
+    loader = get_background_loader()
+    if config.STARTUP_MODE == "blocking":
+        loader.wait()
+
+    if not loader.ready:
+        MainUI.render_startup(loader.status(), loader.report())
+        loader.mark("first_paint")
+        if loader.state == BackgroundLoader.FAILED:
+            print(f"[ERROR] app.py (main): Initialization failed: {loader.error}")
+            # Drop the failed loader so the next run (a page reload) starts a fresh one.
+            get_background_loader.clear()
+            return
+        # Re-run the script until the loader is ready; the shell is redrawn each time.
+        loader.wait(config.STARTUP_POLL_SECONDS)
+        st.rerun()
+
+    if config.METRICS_PORT:
+        start_metrics_endpoint(config.METRICS_PORT)
+    ui = MainUI(loader.manager, startup_report=loader.report())
+    ui.run()
+    loader.mark("first_paint")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
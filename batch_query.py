@@ -0,0 +1,112 @@
+"""
+Answers a JSONL file of questions in bulk (FAQ generation, report Q&A).
+
+    python batch_query.py questions.jsonl answers.jsonl --batch-size 64 --max-concurrency 8
+
+Each input line is {"question": ...} with an optional "id" and, in collection mode, an
+optional "documents" list. Each output line carries the id, question, answer, the ids
+and scores of the retrieved parents and the timings; failed generations get "error".
+Questions are answered through RAGChainManager.batch, so each batch embeds its questions
+in one call, searches FAISS once and fetches every parent from the docstore once.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import AppConfig
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Reads one {"question", "id"?, "documents"?} object per line; blank lines are skipped."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not isinstance(item, dict) or not item.get("question"):
+                raise ValueError(f"{path}:{line_number}: each line needs a 'question'")
+            item.setdefault("id", line_number)
+            items.append(item)
+    return items
+
+
+def batches(items: List[Dict[str, Any]], batch_size: int) -> Iterator[Tuple[Optional[Tuple[str, ...]], List[Dict[str, Any]]]]:
+    """Groups questions by their document filter (one batch() call covers one filter), then chunks them."""
+    groups: Dict[Optional[Tuple[str, ...]], List[Dict[str, Any]]] = {}
+    for item in items:
+        documents = tuple(sorted(item["documents"])) if item.get("documents") else None
+        groups.setdefault(documents, []).append(item)
+    for documents, group in groups.items():
+        for start in range(0, len(group), batch_size):
+            yield documents, group[start:start + batch_size]
+
+
+def output_record(item: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    context = result.get("context") or {}
+    record = {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": result.get("answer"),
+        "doc_ids": context.get("doc_ids", []),
+        "scores": context.get("scores", []),
+        "timings": result.get("timings", {}),
+    }
+    if item.get("documents"):
+        record["documents"] = item["documents"]
+    if result.get("error"):
+        record["error"] = result["error"]
+    return record
+
+
+def run(manager: RAGChainManager, items: List[Dict[str, Any]], output_path: str, batch_size: int,
+        max_concurrency: Optional[int]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    answered = failed = 0
+    # Results are written per batch, so a long job keeps what it finished; lines follow batch order.
+    with open(output_path, "w", encoding="utf-8") as out:
+        for documents, batch in batches(items, batch_size):
+            batch_started = time.perf_counter()
+            results = manager.batch([item["question"] for item in batch], documents, max_concurrency=max_concurrency)
+            for item, result in zip(batch, results):
+                out.write(json.dumps(output_record(item, result), ensure_ascii=False) + "\n")
+                failed += 1 if result.get("error") else 0
+            out.flush()
+            answered += len(batch)
+            print(f"[INFO] batch_query.py: {answered}/{len(items)} questions "
+                  f"({len(batch) / (time.perf_counter() - batch_started):.1f} q/s this batch).", file=sys.stderr)
+    wall_seconds = time.perf_counter() - started
+    return {
+        "questions": len(items),
+        "failed": failed,
+        "wall_seconds": wall_seconds,
+        "questions_per_second": len(items) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with batched retrieval and concurrent generation.")
+    parser.add_argument("input", help="JSONL file of {question, id?, documents?} lines")
+    parser.add_argument("output", help="JSONL file to write answers to")
+    parser.add_argument("--batch-size", type=int, default=AppConfig.BATCH_SIZE, help="Questions retrieved together")
+    parser.add_argument("--max-concurrency", type=int, default=AppConfig.BATCH_MAX_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Answer every question even if it is cached")
+    args = parser.parse_args()
+
+    config = AppConfig()
+    if args.no_answer_cache:
+        config.ANSWER_CACHE_ENABLED = False
+    items = read_questions(args.input)
+    resource_loader = ResourceLoader(config)
+    resource_loader.load_all()
+    manager = RAGChainManager(resource_loader)
+    summary = run(manager, items, args.output, args.batch_size, args.max_concurrency)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
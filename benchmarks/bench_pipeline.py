@@ -0,0 +1,225 @@
+"""
+Offline benchmark of the RAG pipeline's own overhead.
+
+Builds a synthetic FAISS index and docstore of configurable size, points ResourceLoader
+at it with the fake LLM and embedding providers, and times cold start, load_all,
+retrieval, DocumentParser.parse_docs, PromptBuilder.build_prompt and end-to-end invoke.
+No network access is needed. Results are printed (and optionally written) as JSON.
+
+    python benchmarks/bench_pipeline.py --parents 2000 --children-per-parent 3 --queries 50
+"""
+import argparse
+import contextlib
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from langchain.schema.document import Document
+from langchain.storage import InMemoryStore
+from langchain_community.vectorstores import FAISS
+
+from config import AppConfig
+from rag_components.bm25_index import BM25Index
+from rag_components.doc_store import MmapDocStore
+from rag_components.document_parser import DocumentParser
+from rag_components.fake_models import HashingFakeEmbeddings
+from rag_components.prompt_builder import PromptBuilder
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+VOCABULARY = (
+    "learning model data training feature label regression classification cluster kernel "
+    "gradient descent loss neural network layer activation bias variance overfitting "
+    "underfitting tree forest boosting bagging margin vector support probability bayes "
+    "likelihood prior posterior entropy information gain split node leaf distance metric "
+    "neighbor linear logistic sigmoid softmax regularization penalty validation test "
+    "accuracy precision recall hypothesis abstraction generalization evaluation algorithm"
+).split()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        rank = (len(ordered) - 1) * p / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": 1000 * sum(ordered) / len(ordered),
+        "p50_ms": 1000 * pct(50),
+        "p95_ms": 1000 * pct(95),
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def time_calls(fn: Callable[[Any], Any], inputs: List[Any]) -> List[float]:
+    samples = []
+    for item in inputs:
+        started = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choice(VOCABULARY) for _ in range(length)).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def build_synthetic_store(workdir: str, parents: int, children_per_parent: int, parent_words: int,
+                          docstore_format: str, embedding_dim: int, seed: int):
+    """Writes a FAISS index of child summaries and a docstore of parent documents under workdir."""
+    rng = random.Random(seed)
+    embeddings = HashingFakeEmbeddings(size=embedding_dim)
+    parent_items = []
+    child_texts, child_metadatas = [], []
+    for i in range(parents):
+        doc_id = f"doc-{i:06d}"
+        parent_items.append((doc_id, Document(page_content=random_text(rng, parent_words), metadata={"page": i})))
+        for _ in range(children_per_parent):
+            child_texts.append(random_text(rng, 30))
+            child_metadatas.append({"doc_id": doc_id})
+
+    vectorstore = FAISS.from_embeddings(
+        list(zip(child_texts, embeddings.embed_documents(child_texts))), embeddings, metadatas=child_metadatas
+    )
+    faiss_path = os.path.join(workdir, "db_faiss")
+    vectorstore.save_local(faiss_path)
+    bm25_path = os.path.join(workdir, "bm25_index.json")
+    BM25Index.from_vectorstore(vectorstore).save(bm25_path)
+
+    pickle_path = os.path.join(workdir, "docstore.pkl")
+    mmap_path = os.path.join(workdir, "docstore")
+    if docstore_format == "mmap":
+        MmapDocStore(mmap_path).mset(parent_items)
+    else:
+        store = InMemoryStore()
+        store.mset(parent_items)
+        with open(pickle_path, "wb") as f:
+            pickle.dump(store, f)
+    return faiss_path, pickle_path, mmap_path, bm25_path
+
+
+def measure_cold_start() -> float:
+    """Seconds for a fresh interpreter to import the app's RAG modules."""
+    code = "import rag_components.retrieval_chain, rag_components.resource_loader"
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed + 1)
+    queries = [random_text(rng, 10) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as workdir:
+        build_started = time.perf_counter()
+        faiss_path, pickle_path, mmap_path, bm25_path = build_synthetic_store(
+            workdir, args.parents, args.children_per_parent, args.parent_words,
+            args.docstore, args.embedding_dim, args.seed,
+        )
+        build_seconds = time.perf_counter() - build_started
+
+        class BenchConfig(AppConfig):
+            DB_FAISS_PATH = faiss_path
+            DOCSTORE_PATH = pickle_path
+            MMAP_DOCSTORE_PATH = mmap_path
+            BM25_INDEX_PATH = bm25_path
+            RETRIEVAL_MODE = args.retrieval_mode
+            LLM_PROVIDER = "fake"
+            EMBEDDING_PROVIDER = "fake"
+            RERANKER = "lexical"  # the cross-encoder would download a model and dominate the timings
+            FAKE_EMBEDDING_SIZE = args.embedding_dim
+            EMBEDDING_CACHE_PATH = None
+            ANSWER_CACHE_ENABLED = False
+            INDEX_RELOAD_ENABLED = False  # one watcher thread per timed load_all otherwise
+            RETRIEVER_SEARCH_KWARGS = {"k": args.k}
+
+        cold_start = [measure_cold_start() for _ in range(args.cold_start_runs)]
+
+        load_samples = []
+        for _ in range(args.load_runs):
+            loader = ResourceLoader(BenchConfig())
+            started = time.perf_counter()
+            loader.load_all()
+            load_samples.append(time.perf_counter() - started)
+        manager = RAGChainManager(loader)
+
+        retriever = loader.get_retriever()
+        raw_docs = [retriever.invoke(query) for query in queries]
+        parsed = [DocumentParser.parse_docs(docs) for docs in raw_docs]
+
+        stages = {
+            "cold_start_import": summarize(cold_start),
+            "load_all": summarize(load_samples),
+            "retrieval": summarize(time_calls(manager.retrieve_documents, queries)),
+            "parse_docs": summarize(time_calls(DocumentParser.parse_docs, raw_docs)),
+            "build_prompt": summarize(time_calls(lambda docs: PromptBuilder.build_prompt(docs, queries[0]), parsed)),
+            "invoke": summarize(time_calls(manager.invoke, queries)),
+        }
+
+    return {
+        "benchmark": "rag_pipeline",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "parameters": {
+            "parents": args.parents,
+            "children_per_parent": args.children_per_parent,
+            "parent_words": args.parent_words,
+            "embedding_dim": args.embedding_dim,
+            "docstore": args.docstore,
+            "k": args.k,
+            "retrieval_mode": args.retrieval_mode,
+            "queries": args.queries,
+            "seed": args.seed,
+        },
+        "build_seconds": build_seconds,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG pipeline with fake LLM/embeddings.")
+    parser.add_argument("--parents", type=int, default=1000, help="Parent documents in the synthetic docstore")
+    parser.add_argument("--children-per-parent", type=int, default=3, help="Child vectors per parent")
+    parser.add_argument("--parent-words", type=int, default=200, help="Words per parent document")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--docstore", choices=["mmap", "pickle"], default="mmap")
+    parser.add_argument("--k", type=int, default=10, help="Child vectors retrieved per query")
+    parser.add_argument("--retrieval-mode", choices=["hybrid", "dense"], default="hybrid")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--load-runs", type=int, default=3)
+    parser.add_argument("--cold-start-runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    # Component [INFO] logs go to stderr so stdout stays machine-readable.
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmark(args)
+    payload = json.dumps(results, indent=2)
+    print(payload)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
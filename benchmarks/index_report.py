@@ -0,0 +1,194 @@
+"""
+Recall-vs-latency report for the FAISS index types supported by vector_loader.py.
+
+Builds each index type over the same vectors, sweeps its query-time knob (nprobe for
+IVF, efSearch for HNSW) and compares the top-k against an exact flat index. Compressed
+types (fp16, sq8, pq, ivf_pq) are also measured with exact float32 re-scoring, and
+every row reports its size against float32. Vectors come from an existing index
+(--from-index vectorstore/db_faiss: its vectors.npy side file if present, otherwise the
+index itself when it is flat, IVF-Flat, HNSW or fp16) or from a synthetic clustered set.
+Queries are perturbed copies of stored vectors. Results are printed (and optionally
+written) as JSON.
+
+    python benchmarks/index_report.py --vectors 100000 --dim 1536 --queries 200
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from config import AppConfig
+from rag_components.index_factory import (
+    COMPRESSED_INDEX_TYPES, RescoringIndex, build_index, index_params_from_config, load_exact_vectors,
+    reconstruct_vectors, set_search_params,
+)
+
+NPROBE_SWEEP = [1, 4, 8, 16, 32, 64, 128]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors drawn around random centers, which is closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_vectors(faiss_path: str) -> np.ndarray:
+    index = faiss.read_index(os.path.join(faiss_path, "index.faiss"))
+    exact = load_exact_vectors(faiss_path, index.ntotal)
+    if exact is not None:
+        return np.asarray(exact, dtype=np.float32)
+    vectors = reconstruct_vectors(index)
+    if vectors is None:
+        raise ValueError(f"{faiss_path} stores compressed codes; rebuild it as flat to use it for the report.")
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    queries = picked + noise * rng.standard_normal(picked.shape).astype(np.float32)
+    return np.ascontiguousarray(queries / np.linalg.norm(queries, axis=1, keepdims=True), dtype=np.float32)
+
+
+def search_latencies(index, queries: np.ndarray, k: int):
+    """One query at a time, as the app issues them; returns (ids, per-query seconds)."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    samples = []
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        samples.append(time.perf_counter() - started)
+        ids[i] = found[0]
+    return ids, samples
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": 1000 * sum(ordered) / len(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
+
+
+def run_report(args) -> Dict[str, Any]:
+    if args.from_index:
+        vectors = load_vectors(args.from_index)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+    params = index_params_from_config(AppConfig)
+    params["min_vectors"] = 0  # always build the requested type, however small the corpus
+    if args.nlist:
+        params["nlist"] = args.nlist
+
+    results = []
+    exact = build_index(vectors, "flat", params)["index"]
+    truth, exact_samples = search_latencies(exact, queries, args.k)
+    float32_bytes = len(faiss.serialize_index(exact))
+    results.append({
+        "index_type": "flat", "factory": "Flat", "knob": None, "rescore": None, "recall": 1.0,
+        "bytes": float32_bytes, "memory_saved": 0.0, "build_seconds": 0.0, **latency_summary(exact_samples),
+    })
+
+    for index_type in args.types:
+        started = time.perf_counter()
+        built = build_index(vectors, index_type, params, seed=args.seed)
+        build_seconds = time.perf_counter() - started
+        index = built["index"]
+        size = len(faiss.serialize_index(index))
+        if index_type == "hnsw":
+            sweep = [("efSearch", ef) for ef in EF_SEARCH_SWEEP]
+        elif index_type.startswith("ivf"):
+            sweep = [("nprobe", n) for n in NPROBE_SWEEP]
+        else:
+            sweep = [(None, None)]
+        rescore_factors = [None] + ([args.rescore_factor] if index_type in COMPRESSED_INDEX_TYPES else [])
+        for knob, value in sweep:
+            if knob is not None:
+                applied = set_search_params(index, **({"ef_search": value} if knob == "efSearch" else {"nprobe": value}))
+                if applied.get(knob) != value:
+                    continue  # nprobe beyond nlist repeats the previous row
+            for factor in rescore_factors:
+                searched = RescoringIndex(index, vectors, factor) if factor else index
+                found, samples = search_latencies(searched, queries, args.k)
+                results.append({
+                    "index_type": index_type, "factory": built["meta"]["factory"],
+                    "knob": {knob: value} if knob else None, "rescore": factor,
+                    "recall": recall_at_k(found, truth), "bytes": size, "memory_saved": 1 - size / float32_bytes,
+                    "build_seconds": build_seconds, **latency_summary(samples),
+                })
+
+    return {
+        "benchmark": "faiss_index_report",
+        "timestamp": time.time(),
+        "parameters": {
+            "source": args.from_index or "synthetic",
+            "vectors": int(len(vectors)),
+            "dim": int(vectors.shape[1]),
+            "queries": int(len(queries)),
+            "k": args.k,
+            "index_params": params,
+        },
+        "results": results,
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print(f"{'index':<10} {'factory':<22} {'knob':<16} {'rescore':>7} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'MiB':>8} {'saved':>6} {'build s':>8}", file=sys.stderr)
+    for row in report["results"]:
+        knob = ", ".join(f"{key}={value}" for key, value in (row["knob"] or {}).items())
+        rescore = f"{row['rescore']}x" if row["rescore"] else "-"
+        print(f"{row['index_type']:<10} {row['factory']:<22} {knob:<16} {rescore:>7} {row['recall']:>7.3f} {row['p50_ms']:>8.3f} "
+              f"{row['p95_ms']:>8.3f} {row['bytes'] / 2**20:>8.1f} {row['memory_saved']:>6.0%} {row['build_seconds']:>8.2f}",
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of FAISS index types against exact search.")
+    parser.add_argument("--from-index", default=None, help="Use the vectors of this FAISS directory instead of synthetic ones")
+    parser.add_argument("--vectors", type=int, default=50000, help="Synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.3, help="Gaussian noise added to stored vectors to make queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="Override FAISS_NLIST")
+    parser.add_argument("--types", nargs="+", default=["ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "pq"],
+                        choices=["ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "pq"])
+    parser.add_argument("--rescore-factor", type=int, default=AppConfig.FAISS_RESCORE_FACTOR,
+                        help="Candidates per result re-scored against float32 for compressed types")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_report(args)
+    print_table(report)
+    payload = json.dumps(report, indent=2)
+    print(payload)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,189 @@ load_dotenv()
 
 
 class AppConfig:
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") 
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     DB_FAISS_PATH = 'vectorstore/db_faiss'
-    DOCSTORE_PATH = 'vectorstore/docstore.pkl'
+    DOCSTORE_PATH = 'vectorstore/docstore.pkl'  # legacy pickled InMemoryStore
+    MMAP_DOCSTORE_PATH = 'vectorstore/docstore'  # MmapDocStore directory, preferred when present
     LLM_MODEL_NAME = "gpt-4o-mini"
-    RETRIEVER_SEARCH_KWARGS = {"k": 10} 
+    THUMBNAIL_MAX_SIDE = 512  # longest side (px) of the image variant sent to the LLM and sidebar
+    EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
+    # Disk cache of embeddings shared by queries and ingestion (None disables it)
+    EMBEDDING_CACHE_PATH = 'vectorstore/embedding_cache.sqlite'
+    EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+    RETRIEVER_SEARCH_KWARGS = {"k": 10}
+    # Ingestion chunking. "structured" makes each heading-delimited section (at most
+    # CHUNK_PARENT_MAX_CHARS; sections under CHUNK_MIN_CHARS are merged with a neighbour) the
+    # parent the LLM reads, and embeds children of at most CHUNK_CHILD_MAX_CHARS without overlap,
+    # keeping paragraphs, tables and captions whole where they fit. "recursive" is the original
+    # 1000-character splitter with 200 characters of overlap, each chunk its own parent.
+    CHUNKING_STRATEGY = "structured"
+    CHUNK_CHILD_MAX_CHARS = 1000
+    CHUNK_PARENT_MAX_CHARS = 3000
+    CHUNK_MIN_CHARS = 500
+    # Optionally also embed an LLM summary of each section of at least CHUNK_SUMMARY_MIN_CHARS
+    # as one more child of it (cached by section text across runs).
+    CHUNK_SUMMARIES_ENABLED = False
+    CHUNK_SUMMARY_MIN_CHARS = 1200
+    CHUNK_SUMMARY_CACHE_PATH = 'vectorstore/section_summaries.sqlite'
+    # Multi-document mode: one FAISS/docstore shard per PDF under this directory plus catalog.json
+    # (set COLLECTION_PATH=vectorstore/collection). Unset means the single DB_FAISS_PATH index.
+    COLLECTION_PATH = os.getenv("COLLECTION_PATH")
+    COLLECTION_MAX_LOADED_SHARDS = 8
+    COLLECTION_MAX_MEMORY_MB = 2048  # in-memory FAISS + BM25 size of resident shards
+    COLLECTION_SEARCH_WORKERS = 4
+    # Multi-process serving: workers attach read-only (memory-mapped) to the snapshot named by
+    # <SHARED_INDEX_PATH>/CURRENT, published with `python -m rag_components.shared_index publish`
+    # (set SHARED_INDEX_PATH=vectorstore/serving). Unset means loading DB_FAISS_PATH directly.
+    SHARED_INDEX_PATH = os.getenv("SHARED_INDEX_PATH")
+    SHARED_INDEX_KEEP_VERSIONS = 3  # published snapshots kept on disk, CURRENT included
+    # Hot reload: a running app polls for a new index version (the manifest.json that ingestion
+    # writes next to db_faiss/, or CURRENT in shared mode), loads it in the background and swaps
+    # it in; retrievals already running finish on the old version.
+    INDEX_RELOAD_ENABLED = True
+    INDEX_RELOAD_POLL_SECONDS = 10
+    # FAISS index built by vector_loader.py: "flat" (exact), "ivf_flat", "hnsw" or "ivf_pq", or a
+    # compressed flat scan: "fp16" (half the memory), "sq8" (a quarter) or "pq" (product codes).
+    # IVF/PQ variants train on a random sample; corpora under FAISS_ANN_MIN_VECTORS stay flat.
+    FAISS_INDEX_TYPE = "flat"
+    FAISS_ANN_MIN_VECTORS = 5000
+    FAISS_TRAIN_SAMPLE_SIZE = 50_000
+    FAISS_NLIST = 1024  # clamped to ~1 centroid per 39 training vectors
+    FAISS_HNSW_M = 32
+    FAISS_EF_CONSTRUCTION = 200
+    FAISS_PQ_M = 64  # sub-quantizers; must divide the embedding dimension (1536 for ada-002)
+    FAISS_PQ_NBITS = 8
+    # Query-time knobs applied by ResourceLoader (see benchmarks/index_report.py for recall vs latency)
+    FAISS_NPROBE = 16
+    FAISS_EF_SEARCH = 64
+    # For compressed types (fp16, sq8, pq, ivf_pq) ingestion also writes the float32 vectors to
+    # db_faiss/vectors.npy; at query time it is memory-mapped and the top FAISS_RESCORE_FACTOR * k
+    # candidates are re-ranked by exact distance.
+    FAISS_RESCORE_EXACT = True
+    FAISS_RESCORE_FACTOR = 4
+    # "hybrid" fuses FAISS with a BM25 index over the same child texts (reciprocal-rank fusion); "dense" is FAISS only
+    RETRIEVAL_MODE = "hybrid"
+    BM25_INDEX_PATH = 'vectorstore/bm25_index.json'  # written by vector_loader.py, rebuilt from FAISS if missing
+    HYBRID_LEXICAL_K = 10  # parents taken from BM25 before fusion
+    HYBRID_RRF_K = 60
+    HYBRID_TOP_K = 6  # parents kept after fusion
+    # Reranking between retrieval and prompt building: RERANK_CANDIDATES parents are scored and an
+    # adaptive number kept. "cross_encoder" is opt-in: it needs the optional sentence-transformers
+    # package (see requirements.txt) and falls back to "lexical" without it.
+    RERANKER = "lexical"  # "lexical", "cross_encoder" or "none"
+    RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES = 20  # FAISS k and the hybrid fusion limit are raised to this
+    RERANK_MIN_K = 2
+    RERANK_MAX_K = 6
+    RERANK_SCORE_CUTOFF = 0.2  # beyond RERANK_MIN_K, drop parents scoring below this (scores are 0..1)
+    RERANK_RELATIVE_CUTOFF = 0.5  # ... or below this fraction of the best score
+    # Context packing before prompt building
+    CONTEXT_TOKEN_BUDGET = 4000
+    CONTEXT_MAX_IMAGES = 3
+    CONTEXT_NEAR_DUPLICATE_THRESHOLD = 0.8  # word-trigram Jaccard similarity
+    CONTEXT_IMAGE_DETAIL = "low"  # OpenAI image detail: "low", "high" or "auto"
+    # Opt-in (one vision call per new image at ingestion): images are captioned once and the caption
+    # is what FAISS indexes for them; captions are cached by image content across runs and shards.
+    # Images under IMAGE_CAPTION_MIN_SIDE pixels or stretched beyond IMAGE_CAPTION_MAX_ASPECT
+    # (rules, bullets, icons) are not captioned. Per query, IMAGE_POLICY sends a captioned image's
+    # caption ("caption"), the image ("pixels"), or decides from the question ("auto").
+    IMAGE_CAPTIONS_ENABLED = False
+    IMAGE_CAPTION_CACHE_PATH = 'vectorstore/image_captions.sqlite'
+    IMAGE_CAPTION_MAX_CONCURRENCY = 4
+    IMAGE_CAPTION_DETAIL = "auto"
+    IMAGE_CAPTION_MIN_SIDE = 32
+    IMAGE_CAPTION_MAX_ASPECT = 10.0
+    IMAGE_POLICY = "auto"
+    # Answer cache in front of RAGChainManager (exact normalized question, optionally
+    # also questions whose embedding cosine similarity is >= the threshold)
+    ANSWER_CACHE_ENABLED = True
+    ANSWER_CACHE_MAX_ENTRIES = 512
+    ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = None  # e.g. 0.97
+    # Multi-turn chat in the UI: follow-ups that only refer back reuse the previous context,
+    # others are rewritten into standalone queries: "heuristic" (no call) or "llm" (one extra
+    # LLM round trip per rewritten follow-up, before retrieval).
+    CONVERSATION_ENABLED = True
+    CONVERSATION_REWRITE_MODE = "heuristic"
+    CONVERSATION_HISTORY_TOKEN_BUDGET = 800
+    CONVERSATION_RECENT_TURNS = 3  # older turns are kept as one-line summaries
+    # "openai" or "fake" (offline FakeStreamingChatModel / HashingFakeEmbeddings for tests and benchmarks)
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+    EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+    FAKE_EMBEDDING_SIZE = 1536
+    # OpenAI client layer shared by the chat model and embeddings of one ResourceLoader: pooled
+    # connections, client-side RPM/TPM limits per model (None disables), coalescing of identical
+    # in-flight requests, jittered exponential backoff on 408/409/429/5xx and connection errors,
+    # and a circuit breaker. OPENAI_BASE_URL points it at a proxy or a local mock server.
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    OPENAI_MAX_CONNECTIONS = 32
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = 16
+    OPENAI_TIMEOUT_SECONDS = 60
+    OPENAI_RPM_LIMIT = 500
+    OPENAI_TPM_LIMIT = 200_000
+    OPENAI_COALESCE_REQUESTS = True
+    OPENAI_MAX_RETRIES = 4
+    OPENAI_BACKOFF_BASE_SECONDS = 0.5
+    OPENAI_BACKOFF_MAX_SECONDS = 20
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failures before failing fast
+    OPENAI_CIRCUIT_RESET_SECONDS = 30
+    # api_server.py: chain runs executing at once, requests allowed to wait beyond that (then 429), per-request timeout
+    API_MAX_CONCURRENCY = 16
+    API_MAX_QUEUE = 64
+    API_REQUEST_TIMEOUT_SECONDS = 60
+    # RAGChainManager.batch / batch_query.py: questions per batch and concurrent generations
+    # (failed generations are retried by the client layer, see OPENAI_MAX_RETRIES)
+    BATCH_SIZE = 64
+    BATCH_MAX_CONCURRENCY = 8
+    # Metrics: Prometheus text on :METRICS_PORT/metrics and JSON on /metrics.json (None disables the endpoint).
+    # A sampled share of requests is run under cProfile; profiles slower than the threshold are kept.
+    METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+    METRICS_PROFILE_SAMPLE_RATE = 0.0  # e.g. 0.05
+    METRICS_PROFILE_THRESHOLD_SECONDS = 2.0
+    METRICS_PROFILE_DIR = 'profiles'
+    # app.py: "background" paints the UI shell first and loads imports/resources on a thread;
+    # "blocking" loads everything before the first render.
+    STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+    STARTUP_POLL_SECONDS = 0.5  # how often the loading screen re-checks readiness
 
 
 
-    @staticmethod
-    def validate_config():
-        if not AppConfig.OPENAI_API_KEY or AppConfig.OPENAI_API_KEY == "YOUR_FALLBACK_OPENAI_KEY_IF_NOT_IN_ENV":
+    @classmethod
+    def validate_config(cls):
+        for setting in ("LLM_PROVIDER", "EMBEDDING_PROVIDER"):
+            if getattr(cls, setting) not in ("openai", "fake"):
+                raise ValueError(f"Unknown {setting} '{getattr(cls, setting)}'. Use 'openai' or 'fake'.")
+        if cls.FAISS_INDEX_TYPE not in ("flat", "ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "pq"):
+            raise ValueError(f"Unknown FAISS_INDEX_TYPE '{cls.FAISS_INDEX_TYPE}'. "
+                             "Use 'flat', 'ivf_flat', 'hnsw', 'ivf_pq', 'fp16', 'sq8' or 'pq'.")
+        if cls.CHUNKING_STRATEGY not in ("structured", "recursive"):
+            raise ValueError(f"Unknown CHUNKING_STRATEGY '{cls.CHUNKING_STRATEGY}'. Use 'structured' or 'recursive'.")
+        if cls.RETRIEVAL_MODE not in ("hybrid", "dense"):
+            raise ValueError(f"Unknown RETRIEVAL_MODE '{cls.RETRIEVAL_MODE}'. Use 'hybrid' or 'dense'.")
+        if cls.RERANKER not in ("cross_encoder", "lexical", "none"):
+            raise ValueError(f"Unknown RERANKER '{cls.RERANKER}'. Use 'cross_encoder', 'lexical' or 'none'.")
+        if cls.IMAGE_POLICY not in ("auto", "caption", "pixels"):
+            raise ValueError(f"Unknown IMAGE_POLICY '{cls.IMAGE_POLICY}'. Use 'auto', 'caption' or 'pixels'.")
+        if cls.CONVERSATION_REWRITE_MODE not in ("llm", "heuristic"):
+            raise ValueError(f"Unknown CONVERSATION_REWRITE_MODE '{cls.CONVERSATION_REWRITE_MODE}'. Use 'llm' or 'heuristic'.")
+        if cls.STARTUP_MODE not in ("background", "blocking"):
+            raise ValueError(f"Unknown STARTUP_MODE '{cls.STARTUP_MODE}'. Use 'background' or 'blocking'.")
+        needs_openai = "openai" in (cls.LLM_PROVIDER, cls.EMBEDDING_PROVIDER)
+        if needs_openai and (not cls.OPENAI_API_KEY or cls.OPENAI_API_KEY == "YOUR_FALLBACK_OPENAI_KEY_IF_NOT_IN_ENV"):
             raise ValueError("OpenAI API key not found. Please set it in the .env file or as an environment variable.")
-        if not os.path.exists(AppConfig.DB_FAISS_PATH):
-            raise FileNotFoundError(f"FAISS database not found at {AppConfig.DB_FAISS_PATH}")
-        if not os.path.exists(AppConfig.DOCSTORE_PATH):
-            raise FileNotFoundError(f"Document store not found at {AppConfig.DOCSTORE_PATH}")
+        if cls.COLLECTION_PATH and cls.SHARED_INDEX_PATH:
+            raise ValueError("COLLECTION_PATH and SHARED_INDEX_PATH cannot both be set; shared snapshots cover the single index.")
+        if cls.COLLECTION_PATH:
+            if not os.path.isfile(os.path.join(cls.COLLECTION_PATH, "catalog.json")):
+                raise FileNotFoundError(f"Collection catalog not found in {cls.COLLECTION_PATH}")
+            return
+        if cls.SHARED_INDEX_PATH:
+            if not os.path.isfile(os.path.join(cls.SHARED_INDEX_PATH, "CURRENT")):
+                raise FileNotFoundError(f"No published index in {cls.SHARED_INDEX_PATH}. "
+                                        "Run `python -m rag_components.shared_index publish`.")
+            return
+        if not os.path.exists(cls.DB_FAISS_PATH):
+            raise FileNotFoundError(f"FAISS database not found at {cls.DB_FAISS_PATH}")
+        if not os.path.exists(cls.MMAP_DOCSTORE_PATH) and not os.path.exists(cls.DOCSTORE_PATH):
+            raise FileNotFoundError(f"Document store not found at {cls.MMAP_DOCSTORE_PATH} or {cls.DOCSTORE_PATH}")
 
@@ -1,16 +1,23 @@
+import argparse
+import asyncio
+import json
 import os
 import time
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from deepeval import evaluate
 from deepeval.metrics import GEval, FaithfulnessMetric, ContextualRelevancyMetric
 from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 from config import AppConfig
+from rag_components.metrics import METRICS
 from rag_components.resource_loader import ResourceLoader
 from rag_components.retrieval_chain import RAGChainManager
 from langchain.schema.document import Document # For type hinting
 
-os.environ["OPENAI_API_KEY"] = os.env[OPENAI_API_KEY]
+load_dotenv()
+
+DEFAULT_DATASET_PATH = "eval_data/golden_dataset.jsonl"
+LATENCY_STAGES = ["retrieval", "generation", "cache_lookup", "total"]
 
 def format_retrieval_context_for_deepeval(parsed_docs: Dict[str, List[Any]]) -> List[str]:
     context_strings: List[str] = []
@@ -20,11 +27,108 @@ def format_retrieval_context_for_deepeval(parsed_docs: Dict[str, List[Any]]) ->
                 context_strings.append(doc.page_content)
             elif isinstance(doc, str): 
                 context_strings.append(doc)
-    print(len(context_strings))
     return context_strings
 
 
-def run_evaluation():
+def load_golden_dataset(path: str) -> List[Dict[str, str]]:
+    """Reads one {"input": ..., "expected_output": ...} object per line; blank lines are skipped."""
+    dataset = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "input" not in item or "expected_output" not in item:
+                raise ValueError(f"{path}:{line_number}: each line needs 'input' and 'expected_output'")
+            dataset.append(item)
+    return dataset
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0..100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def print_latency_report(stage_latencies: Dict[str, List[float]], wall_seconds: float, num_cases: int):
+    print("\n⏱️ Latency per stage (seconds):")
+    print(f"   {'stage':<12}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage in LATENCY_STAGES:
+        values = stage_latencies.get(stage, [])
+        if not values:
+            continue
+        print(f"   {stage:<12}{len(values):>5}{percentile(values, 50):>10.3f}{percentile(values, 95):>10.3f}"
+              f"{percentile(values, 99):>10.3f}{max(values):>10.3f}")
+    if wall_seconds > 0:
+        print(f"   wall clock: {wall_seconds:.2f}s for {num_cases} cases ({num_cases / wall_seconds:.2f} cases/s)")
+
+
+def build_test_case(item: Dict[str, str], result: Optional[Dict[str, Any]], error: Optional[Exception] = None) -> LLMTestCase:
+    if error is not None:
+        return LLMTestCase(
+            input=item["input"],
+            actual_output=f"Error during generation: {error}",
+            expected_output=item["expected_output"],
+            retrieval_context=[]
+        )
+    return LLMTestCase(
+        input=item["input"],
+        actual_output=result["answer"],
+        expected_output=item["expected_output"],
+        retrieval_context=format_retrieval_context_for_deepeval(result["context"]),
+    )
+
+
+def record_timings(stage_latencies: Dict[str, List[float]], result: Dict[str, Any]):
+    for stage, seconds in result.get("timings", {}).items():
+        stage_latencies.setdefault(stage, []).append(seconds)
+
+
+def generate_test_cases(rag_manager: RAGChainManager, golden_dataset: List[Dict[str, str]]):
+    test_cases: List[LLMTestCase] = []
+    stage_latencies: Dict[str, List[float]] = {}
+    for item in golden_dataset:
+        question = item["input"]
+        try:
+            # Answer and retrieved context come from the same chain run:
+            # {"answer": str, "context": {"images": ..., "texts": ..., "doc_ids": ..., "scores": ...}, "timings": ...}
+            result = rag_manager.invoke_with_context(question)
+            record_timings(stage_latencies, result)
+            test_cases.append(build_test_case(item, result))
+            print(f"    ⏱️ Latency: {result['timings']['total']:.2f}s")
+        except Exception as e:
+            print(f"    🔴 Error processing test case '{question}': {e}")
+            test_cases.append(build_test_case(item, None, e))
+    return test_cases, stage_latencies
+
+
+async def generate_test_cases_async(rag_manager: RAGChainManager, golden_dataset: List[Dict[str, str]], concurrency: int):
+    """Runs the chain via ainvoke for many cases at once, with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    stage_latencies: Dict[str, List[float]] = {}
+
+    async def run_case(item: Dict[str, str]) -> LLMTestCase:
+        async with semaphore:
+            try:
+                result = await rag_manager.ainvoke_with_context(item["input"])
+            except Exception as e:
+                print(f"    🔴 Error processing test case '{item['input']}': {e}")
+                return build_test_case(item, None, e)
+        record_timings(stage_latencies, result)
+        return build_test_case(item, result)
+
+    # gather keeps dataset order, so test case i still matches line i of the dataset.
+    test_cases = await asyncio.gather(*(run_case(item) for item in golden_dataset))
+    return list(test_cases), stage_latencies
+
+
+def run_evaluation(dataset_path: str = DEFAULT_DATASET_PATH, use_async: bool = False, concurrency: int = 8,
+                   use_answer_cache: bool = False, latency_only: bool = False, metrics_output: Optional[str] = None):
     load_dotenv()
     print("☑️ Environment variables loaded.")
 
@@ -35,6 +139,8 @@ def run_evaluation():
     print("\n🔄 Initializing RAG system...")
     try:
         config = AppConfig()
+        # Cached answers would hide the pipeline's real latency, so evaluation bypasses them by default.
+        config.ANSWER_CACHE_ENABLED = use_answer_cache
         resource_loader = ResourceLoader(config)
         resource_loader.load_all()  # Explicitly load all resources
         rag_manager = RAGChainManager(resource_loader)
@@ -45,47 +151,27 @@ def run_evaluation():
         traceback.print_exc()
         return
 
-    print("\n📚 Defining test dataset...")
-
-    golden_dataset = [
- 
-  
-{
-    "input": "What is machine learning according to the document?",
-    "expected_output": "Machine learning is programming computers to optimize a performance criterion using example data or past experience. [cite: 1545, 1546] It is the field of study that gives computers the ability to learn without being explicitly programmed. [cite: 1549]"
-  },
- 
-  {
-    "input": "Explain the concept of abstraction in the learning process.",
-    "expected_output": "Abstraction is the process of extracting knowledge about stored data by creating general concepts about the data as a whole. [cite: 1561, 1562] This involves applying known models and creating new ones, with fitting a model to a dataset being known as training. [cite: 1563, 1564]"
-  },
-
-  {
-    "input": "How is evaluation defined in the learning process?",
-    "expected_output": "Evaluation is the process of providing feedback to the user to measure the usefulness of the learned knowledge, which is then used to improve the overall learning process. [cite: 1570, 1571]"
-  },
-  {
-    "input": "What are the three main categories of learning models discussed in the document?",
-    "expected_output": "The three main categories of learning models are Logical models, Geometric models, and Probabilistic models. [cite: 1587, 1588, 1589]"
-  },
-
-  {
-    "input": "How do Geometric models define similarity?",
-    "expected_output": "Geometric models define similarity by considering the geometry of the instance space, where features can be described as points in a multi-dimensional space. [cite: 1616, 1617] Similarity can be imposed using geometric concepts like lines or planes to segment the space (Linear models) or using the geometric notion of distance (Distance-based models). [cite: 1620, 1621, 1622, 1623]"
-  },
-  {
-    "input": "Explain Linear models.",
-    "expected_output": "Linear models are a type of Geometric model where the function is represented as a linear combination of its inputs. [cite: 1624, 1625] They are parametric models with a fixed form and a small number of numeric parameters to be learned from data, unlike tree or rule models where the structure is not fixed. [cite: 1628, 1629, 1630] Linear models are stable and less likely to overfit but more likely to underfit. [cite: 1631, 1633, 1634]"
-  },
-
-   
-]
-
-    if not golden_dataset or not golden_dataset[0]["input"].startswith("What is the main topic"):
-        print("⚠️ WARNING: Please replace the placeholder golden_dataset with questions and answers relevant to YOUR PDF content for meaningful evaluation!")
-   
+    print(f"\n📚 Loading test dataset from {dataset_path}...")
+    golden_dataset = load_golden_dataset(dataset_path)
+    print(f"✅ Loaded {len(golden_dataset)} test cases.")
 
+    # 4. Generate LLMTestCases by running the RAG system for each item in the golden dataset
+    mode = f"async, concurrency={concurrency}" if use_async else "serial"
+    print(f"\n⚙️ Generating LLMTestCases by querying the RAG system ({mode})...")
+    wall_start = time.perf_counter()
+    if use_async:
+        test_cases, stage_latencies = asyncio.run(generate_test_cases_async(rag_manager, golden_dataset, concurrency))
+    else:
+        test_cases, stage_latencies = generate_test_cases(rag_manager, golden_dataset)
+    wall_seconds = time.perf_counter() - wall_start
+    print(f"✅ LLMTestCases generated ({len(test_cases)} total).")
+    print_latency_report(stage_latencies, wall_seconds, len(test_cases))
+    if metrics_output:
+        METRICS.dump_json(metrics_output)
+        print(f"📈 Per-stage metrics written to {metrics_output}")
 
+    if latency_only:
+        return
 
     print("\n📊 Initializing DeepEval metrics...")
   
@@ -119,46 +205,6 @@ def run_evaluation():
     all_metrics = [correctness_metric, faithfulness_metric, contextual_relevancy_metric]
     print("✅ DeepEval metrics initialized.")
 
-    # 4. Generate LLMTestCases by running the RAG system for each item in the golden dataset
-    print("\n⚙️ Generating LLMTestCases by querying the RAG system...")
-    test_cases: List[LLMTestCase] = []
-    for i, item in enumerate(golden_dataset):
-        question = item["input"]
-        expected_answer = item["expected_output"]
-        
-        
-        try:
-            start_time = time.time()
-            # Get actual output from the RAG chain
-            actual_answer = rag_manager.invoke(question)
-            latency = time.time() - start_time
-
-            # Get retrieved context
-            # retrieve_documents() from our RAGChainManager returns a dict: {"images": ..., "texts": ...}
-            parsed_retrieved_docs = rag_manager.retrieve_documents(question)
-            retrieval_context_str_list = format_retrieval_context_for_deepeval(parsed_retrieved_docs)
-
-            test_case = LLMTestCase(
-                input=question,
-                actual_output=actual_answer,
-                expected_output=expected_answer,
-                retrieval_context=retrieval_context_str_list,
-
-            )
-            test_cases.append(test_case)
-            print(f"    ⏱️ Latency: {latency:.2f}s")
-
-        except Exception as e:
-            print(f"    🔴 Error processing test case '{question}': {e}")
-            # Create a failed test case or skip
-            test_cases.append(LLMTestCase(
-                input=question,
-                actual_output=f"Error during generation: {e}",
-                expected_output=expected_answer,
-                retrieval_context=[] 
-            ))
-    print(f"✅ LLMTestCases generated ({len(test_cases)} total).")
-
     # 5. Run Evaluation using DeepEval
     if not test_cases:
         print("\n🔴 No test cases were successfully generated. Skipping DeepEval evaluation.")
@@ -181,4 +227,13 @@ def run_evaluation():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline with DeepEval.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH, help="JSONL file of {input, expected_output} lines")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run test cases concurrently via ainvoke")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max test cases in flight in --async mode")
+    parser.add_argument("--use-answer-cache", action="store_true", help="Allow answers to come from the answer cache")
+    parser.add_argument("--latency-only", action="store_true", help="Skip DeepEval metrics; only report latency")
+    parser.add_argument("--metrics-output", default=None, help="Write per-stage histograms and token counts as JSON")
+    args = parser.parse_args()
+    run_evaluation(args.dataset, args.use_async, args.concurrency, args.use_answer_cache, args.latency_only,
+                   args.metrics_output)
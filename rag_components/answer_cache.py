@@ -0,0 +1,115 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of chain results ({"answer", "context"}) keyed by the normalized
+    question. With a similarity threshold and an embedding model, a question whose
+    embedding is close enough to a cached one is also served from the cache.
+    Everything is dropped when the index version changes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: Optional[float] = 3600,
+        similarity_threshold: Optional[float] = None,
+        embedding_model=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model if similarity_threshold is not None else None
+        self.index_version: Optional[str] = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        question = re.sub(r"\s+", " ", question.strip().lower())
+        return question.rstrip("?!. ")
+
+    def _embed(self, normalized: str) -> Optional[np.ndarray]:
+        if self.embedding_model is None:
+            return None
+        vector = np.asarray(self.embedding_model.embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version_locked(self, index_version: Optional[str]):
+        if index_version != self.index_version:
+            self._entries.clear()
+            self.index_version = index_version
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry["created_at"] > self.ttl_seconds
+
+    def get(self, question: str, index_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        key = self.normalize(question)
+        now = time.time()
+        with self._lock:
+            self._check_version_locked(index_version)
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["result"]
+            if entry is not None:
+                del self._entries[key]
+            if self.embedding_model is None:
+                self.misses += 1
+                return None
+
+        # Embedding happens outside the lock; the embedding cache makes repeats cheap.
+        vector = self._embed(key)
+        with self._lock:
+            candidates = [
+                (cached_key, cached) for cached_key, cached in self._entries.items()
+                if cached["vector"] is not None and not self._expired(cached, now)
+            ]
+            if candidates:
+                similarities = np.stack([cached["vector"] for _, cached in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return best_entry["result"]
+            self.misses += 1
+            return None
+
+    def put(self, question: str, result: Dict[str, Any], index_version: Optional[str] = None):
+        key = self.normalize(question)
+        vector = self._embed(key)
+        with self._lock:
+            self._check_version_locked(index_version)
+            self._entries[key] = {"result": result, "created_at": time.time(), "vector": vector}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "index_version": self.index_version,
+            }
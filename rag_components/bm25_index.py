@@ -0,0 +1,143 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+FORMAT_VERSION = 1
+# Keeps hyphenated / dotted terms ("k-means", "l2.norm") whole and also indexes their parts.
+_TOKEN = re.compile(r"\w+(?:[-.]\w+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which "
+    "with how why when who does do can".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        if "-" in token or "." in token:
+            tokens.extend(part for part in re.split(r"[-.]", token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60, limit: Optional[int] = None) -> Tuple[List[str], List[float]]:
+    """
+    Fuses ranked doc_id lists: each id scores sum(1 / (k + rank)) over the lists it appears
+    in (rank starting at 1), so ids found by both retrievers rise to the top.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [doc_id for doc_id, _ in ordered], [score for _, score in ordered]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the child texts in the FAISS index. Each child maps to its parent
+    doc_id, and search returns parents ranked by their best child, like the dense path.
+    Persisted as JSON next to the FAISS index; querying needs no embedding call.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._idf: Dict[str, float] = {}
+        self._length_norm: List[float] = []
+
+    @classmethod
+    def build(cls, children: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """children: (parent doc_id, child text) pairs."""
+        index = cls(k1=k1, b=b)
+        for doc_id, text in children:
+            position = len(index.doc_ids)
+            counts = Counter(tokenize(text))
+            index.doc_ids.append(doc_id)
+            index.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                index.postings.setdefault(term, []).append((position, tf))
+        index._prepare()
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, id_key: str = "doc_id", **kwargs) -> "BM25Index":
+        """Indexes the child documents held in a FAISS vectorstore's docstore."""
+        children = []
+        for child_id in vectorstore.index_to_docstore_id.values():
+            child = vectorstore.docstore.search(child_id)
+            metadata = getattr(child, "metadata", None) or {}
+            if metadata.get(id_key) is not None:
+                children.append((metadata[id_key], child.page_content))
+        return cls.build(children, **kwargs)
+
+    def _prepare(self):
+        n = len(self.doc_ids)
+        average_length = sum(self.doc_lengths) / n if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        self._length_norm = [
+            self.k1 * (1 - self.b + self.b * length / average_length) if average_length else self.k1
+            for length in self.doc_lengths
+        ]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k parent doc_ids as (doc_id, score), best first."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for position, tf in postings:
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + self._length_norm[position])
+        best: Dict[str, float] = {}
+        for position, score in scores.items():
+            doc_id = self.doc_ids[position]
+            if score > best.get(doc_id, 0.0):
+                best[doc_id] = score
+        return heapq.nlargest(k, best.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        payload = {
+            "version": FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        print(f"[INFO] BM25Index: Saved {len(self)} children, {len(self.postings)} terms to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {payload.get('version')} in {path}")
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.doc_ids = payload["doc_ids"]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in payload["postings"].items()}
+        index._prepare()
+        return index
@@ -0,0 +1,369 @@
+"""
+Ingestion chunking: turns extracted pages into parent documents (what the LLM reads) and
+child documents (what FAISS and BM25 index), linked by the parent's `doc_id`.
+
+StructuredChunker follows the document's layout. Headings open sections, and sections
+become the parents, with paragraphs, lists, tables and formulas kept whole. Children are
+cut from a parent without overlap. Prose is packed sentence by sentence. Tables are
+embedded on their own; a long one is split between rows, with its header row repeated.
+Figure and table captions are children of their own. RecursiveChunker is the original
+fixed-size splitter, where each chunk is both parent and child.
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.output_parsers import StrOutputParser
+
+from .image_captions import SQLiteCaptionCache
+from .prompt.prompts import section_summary_template
+
+CHUNKING_STRATEGIES = ("structured", "recursive")
+
+_PAGE_NUMBER = re.compile(r"^(page\s+)?\d{1,4}$", re.IGNORECASE)
+_PART_HEADING = re.compile(r"^(unit|chapter|part|section|module|appendix)\s+([ivxlc]+|\d+|[a-z])\b", re.IGNORECASE)
+_NUMBERED_HEADING = re.compile(r"^(\d{1,2}(?:\.\d{1,2})*)\.?\s+([A-Z].*)$")
+_CAPTION = re.compile(r"^(fig(ure)?|table|tab)\.?\s*\d+([.\-]\d+)*\s*[:.\-–]?(\s|$)", re.IGNORECASE)
+_LIST_ITEM = re.compile(r"^([•▪◦●■○➢\-\*–]|\(?([a-z]|[ivx]{1,4}|\d{1,2})[.)])\s+", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"“(\[A-Z0-9])")
+_CELL_GAP = re.compile(r"\s{2,}|\t|\|")
+_NUMBER = re.compile(r"^[-+]?[\d.,%]+$")
+_MATH_CHARS = set("=+−*/^∑∏∫√≤≥≠≈∈∀∃∂αβγδεθλμσπφωΣΠ()[]{}<>|_")
+
+
+def content_hash(kind: str, source: str, content: Any) -> str:
+    """Stable doc_id for a chunk or image: identical content in the same source always maps to the same id."""
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    return hashlib.sha256(f"{kind}\x00{source}\x00".encode("utf-8") + data).hexdigest()[:32]
+
+
+def heading_level(line: str) -> Optional[int]:
+    """1 for unit/chapter headings, 2 for "1." or ALL CAPS headings, 3+ for "1.1", "1.1.1"...; None for body text."""
+    words = line.split()
+    if len(line) > 90 or not words or line.endswith((".", ",", ";")):
+        return None
+    if _PART_HEADING.match(line) and len(words) <= 8:
+        return 1
+    match = _NUMBERED_HEADING.match(line)
+    if match:
+        depth = match.group(1).count(".") + 1
+        title = match.group(2)
+        # "1. Introduction" is a heading; "3. Apply supervised methods to problems" or
+        # "1. Task T: To play checkers" are list items.
+        if not any(c in title for c in ",:") and len(title.split()) <= (5 if depth == 1 else 10):
+            return 1 + depth
+        return None
+    letters = [c for c in line if c.isalpha()]
+    # Numbers make an upper-case line a table row ("CART  0.84  0.80"), not a heading.
+    if len(letters) >= 4 and all(c.isupper() for c in letters) and len(words) <= 8 \
+            and not any(_NUMBER.match(word) for word in words):
+        return 2
+    return None
+
+
+def _is_table_row(line: str) -> bool:
+    cells = [cell for cell in _CELL_GAP.split(line.strip()) if cell.strip()]
+    if len(cells) >= 3 and sum(len(cell) for cell in cells) / len(cells) <= 24:
+        return True
+    tokens = line.split()
+    numbers = sum(1 for token in tokens if _NUMBER.match(token))
+    return len(tokens) >= 3 and numbers >= 3 and numbers / len(tokens) >= 0.5
+
+
+def _is_formula(line: str) -> bool:
+    chars = [c for c in line if not c.isspace()]
+    if not chars or len(line) > 160:
+        return False
+    return sum(1 for c in chars if c in _MATH_CHARS) / len(chars) >= 0.2 and any(c in line for c in "=≤≥≈∑∏∫")
+
+
+class StructuredChunker:
+    """
+    Layout-aware chunking. Each parent is one section (or a window of a long section cut
+    between blocks), at most `parent_max_chars`. Sections shorter than `min_chars` merge
+    with a neighbouring parent. Children pack sentences up to `child_max_chars`, each
+    prefixed with the innermost headings of its section.
+    """
+
+    def __init__(self, child_max_chars: int = 1000, parent_max_chars: int = 3000, min_chars: int = 500):
+        self.child_max_chars = child_max_chars
+        self.parent_max_chars = parent_max_chars
+        self.min_chars = min_chars
+
+    @classmethod
+    def from_config(cls, config) -> "StructuredChunker":
+        return cls(config.CHUNK_CHILD_MAX_CHARS, config.CHUNK_PARENT_MAX_CHARS, config.CHUNK_MIN_CHARS)
+
+    def blocks(self, pages: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Classifies page lines into heading, text, list, table, caption and formula blocks."""
+        blocks: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+
+        def flush():
+            nonlocal current
+            if current is not None:
+                if current["type"] == "table" and len(current["lines"]) < 2:
+                    current["type"] = "text"  # one aligned line is not a table
+                blocks.append(current)
+            current = None
+
+        for page in pages:
+            # A page break ends the current block; the section carries on.
+            for raw in page["text"].splitlines() + [""]:
+                line = " ".join(raw.split())
+                if not line or _PAGE_NUMBER.match(line):
+                    flush()
+                    continue
+                level = heading_level(line)
+                if level is not None:
+                    flush()
+                    blocks.append({"type": "heading", "level": level, "lines": [line], "page": page["page"]})
+                    continue
+                if _CAPTION.match(line):
+                    kind = "caption"
+                elif _LIST_ITEM.match(line):
+                    kind = "list"
+                elif _is_table_row(raw):
+                    kind = "table"
+                elif _is_formula(line):
+                    kind = "formula"
+                else:
+                    kind = "text"
+                if current is not None and (
+                    kind == current["type"] != "caption"
+                    # Wrapped continuation lines stay with their list item or unfinished caption.
+                    or (kind == "text" and current["type"] == "list")
+                    or (kind == "text" and current["type"] == "caption" and not current["lines"][-1].endswith((".", "!", "?"))
+                        and sum(map(len, current["lines"])) < 300)
+                ):
+                    current["lines"].append(line)
+                    continue
+                flush()
+                current = {"type": kind, "lines": [line], "page": page["page"]}
+        flush()
+        return blocks
+
+    def sections(self, blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Groups blocks under their heading path; headings with no body fold into the next
+        section's path. A numbered heading also closes numbered headings it does not extend,
+        so "1.3 Models" is not filed under a stray "4. Evaluation".
+        """
+        sections: List[Dict[str, Any]] = []
+        stack: List[Tuple[int, str, str]] = []
+        current = {"path": [], "blocks": []}
+        for block in blocks:
+            if block["type"] != "heading":
+                current["blocks"].append(block)
+                continue
+            if current["blocks"]:
+                sections.append(current)
+            match = _NUMBERED_HEADING.match(block["lines"][0])
+            number = match.group(1) if match else ""
+            while stack and (stack[-1][0] >= block["level"]
+                             or (number and stack[-1][2] and not number.startswith(stack[-1][2] + "."))):
+                stack.pop()
+            stack.append((block["level"], block["lines"][0], number))
+            current = {"path": [title for _, title, _ in stack], "blocks": []}
+        if current["blocks"]:
+            sections.append(current)
+        return sections
+
+    @staticmethod
+    def _block_text(block: Dict[str, Any]) -> str:
+        separator = " " if block["type"] in ("text", "caption") else "\n"
+        return separator.join(block["lines"])
+
+    def _units(self, block: Dict[str, Any]) -> List[str]:
+        """Text cut between sentences and lists between lines, none longer than child_max_chars; formulas stay whole."""
+        if block["type"] == "formula":
+            return [self._block_text(block)]
+        units = block["lines"] if block["type"] == "list" else _SENTENCE_END.split(self._block_text(block))
+        words_split = []
+        for unit in units:
+            while len(unit) > self.child_max_chars:  # one run-on sentence: cut between words
+                cut = unit.rfind(" ", 0, self.child_max_chars)
+                cut = cut if cut > 0 else self.child_max_chars
+                words_split.append(unit[:cut])
+                unit = unit[cut:].strip()
+            words_split.append(unit)
+        return words_split
+
+    def _pieces(self, block: Dict[str, Any]) -> List[str]:
+        """A table cut into parts of at most child_max_chars between rows, each with the header row."""
+        text = self._block_text(block)
+        if len(text) <= self.child_max_chars:
+            return [text]
+        header, rows = block["lines"][0], block["lines"][1:]
+        return [f"{header}\n{part}" for part in self._pack(rows, self.child_max_chars - len(header) - 1, "\n")]
+
+    @staticmethod
+    def _pack(parts: Sequence[str], limit: int, separator: str) -> List[str]:
+        packed: List[str] = []
+        for part in parts:
+            if packed and len(packed[-1]) + len(separator) + len(part) <= limit:
+                packed[-1] += separator + part
+            else:
+                packed.append(part)
+        return packed
+
+    def _parents(self, sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Windows of whole blocks per section. A short section joins the window before it
+        (and a short window takes the next section) while the two fit in one parent; the
+        merged window is titled by the heading path the sections share.
+        """
+        parents: List[Dict[str, Any]] = []
+        for section in sections:
+            size = sum(len(self._block_text(block)) for block in section["blocks"])
+            previous = parents[-1] if parents else None
+            if (
+                previous is not None
+                and previous["size"] + size <= self.parent_max_chars
+                and min(size, previous["size"]) < self.min_chars
+            ):
+                if section["path"]:
+                    heading = {"type": "heading", "lines": [section["path"][-1]], "page": section["blocks"][0]["page"]}
+                    previous["blocks"].append(heading)
+                shared = 0
+                while shared < min(len(previous["path"]), len(section["path"])) and previous["path"][shared] == section["path"][shared]:
+                    shared += 1
+                previous["path"] = previous["path"][:shared]
+                previous["blocks"] += section["blocks"]
+                previous["size"] += size
+                continue
+            window = None
+            for block in section["blocks"]:
+                block_size = len(self._block_text(block))
+                if window is None or (window["size"] + block_size > self.parent_max_chars and window["blocks"]):
+                    window = {"path": list(section["path"]), "blocks": [], "size": 0}
+                    parents.append(window)
+                window["blocks"].append(block)
+                window["size"] += block_size
+        for window in parents:
+            window["title"] = " > ".join(window["path"])
+        return parents
+
+    def split(self, pages: Sequence[Dict[str, Any]], source: str) -> Tuple[Dict[str, Document], Dict[str, Document]]:
+        """({parent doc_id: section Document}, {child id: child Document with metadata["doc_id"]})."""
+        parents: Dict[str, Document] = {}
+        children: Dict[str, Document] = {}
+        for window in self._parents(self.sections(self.blocks(pages))):
+            header = window["title"]
+            body = "\n\n".join(self._block_text(block) for block in window["blocks"])
+            parent_text = f"{header}\n\n{body}" if header else body
+            first_page, last_page = window["blocks"][0]["page"], window["blocks"][-1]["page"]
+            doc_id = content_hash("section", source, parent_text)
+            parents[doc_id] = Document(page_content=parent_text, metadata={
+                "source": source, "page": first_page, "pages": [first_page, last_page], "section": window["title"],
+            })
+            pending: Optional[Dict[str, Any]] = None
+            chunks: List[Dict[str, Any]] = []
+            caption = None
+            for block in window["blocks"]:
+                if block["type"] == "caption":
+                    # Captions are their own child and also introduce the table that follows them.
+                    caption = self._block_text(block)
+                    chunks.append({"text": caption, "page": block["page"], "type": "caption"})
+                    pending = None
+                    continue
+                if block["type"] != "table":
+                    # Prose packs sentence by sentence, so a child fills up across paragraphs.
+                    separator = " " if block["type"] == "text" else "\n"
+                    for index, unit in enumerate(self._units(block)):
+                        joiner = separator if index else "\n"
+                        if pending is not None and pending["type"] == "text" \
+                                and len(pending["text"]) + len(joiner) + len(unit) <= self.child_max_chars:
+                            pending["text"] += joiner + unit
+                            continue
+                        pending = {"text": unit, "page": block["page"], "type": "text"}
+                        chunks.append(pending)
+                    caption = None
+                    continue
+                # Tables are never packed with prose, so their rows are embedded together.
+                for piece in self._pieces(block):
+                    chunks.append({"text": f"{caption}\n{piece}" if caption else piece, "page": block["page"], "type": "table"})
+                pending = caption = None
+            # Children carry only the innermost two headings; the parent has the full path.
+            child_header = " > ".join(window["path"][-2:])
+            for chunk in chunks:
+                child_text = f"{child_header}\n{chunk['text']}" if child_header else chunk["text"]
+                child_id = content_hash("chunk", source, f"{doc_id}\x00{child_text}")
+                children[child_id] = Document(page_content=child_text, metadata={
+                    "doc_id": doc_id, "source": source, "page": chunk["page"], "type": chunk["type"],
+                })
+        return parents, children
+
+
+class RecursiveChunker:
+    """The original splitter: fixed-size overlapping chunks per page, each chunk its own parent."""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def split(self, pages: Sequence[Dict[str, Any]], source: str) -> Tuple[Dict[str, Document], Dict[str, Document]]:
+        parents: Dict[str, Document] = {}
+        children: Dict[str, Document] = {}
+        for page in pages:
+            for chunk in self.text_splitter.split_text(page["text"]):
+                doc_id = content_hash("text", source, chunk)
+                metadata = {"source": source, "page": page["page"]}
+                parents[doc_id] = Document(page_content=chunk, metadata=metadata)
+                children[doc_id] = Document(page_content=chunk, metadata={"doc_id": doc_id, **metadata})
+        return parents, children
+
+
+def build_chunker(config, chunk_size: int = 1000, chunk_overlap: int = 200):
+    if config.CHUNKING_STRATEGY == "recursive":
+        return RecursiveChunker(chunk_size, chunk_overlap)
+    return StructuredChunker.from_config(config)
+
+
+class SectionSummarizer:
+    """
+    Optional extra child per long parent section: a short LLM summary, so broad questions
+    match a section as a whole. Summaries are cached by model and section text (in the
+    same kind of SQLite cache as image captions), so re-ingestion does not regenerate them.
+    """
+
+    def __init__(self, llm, model_name: str, cache: Optional[SQLiteCaptionCache] = None, max_concurrency: int = 4,
+                 min_chars: int = 1200):
+        self.model_name = model_name
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.min_chars = min_chars
+        self._chain = llm | StrOutputParser()
+
+    @classmethod
+    def from_config(cls, config, llm) -> Optional["SectionSummarizer"]:
+        if not config.CHUNK_SUMMARIES_ENABLED:
+            return None
+        model_name = config.LLM_MODEL_NAME if config.LLM_PROVIDER == "openai" else config.LLM_PROVIDER
+        cache = SQLiteCaptionCache(config.CHUNK_SUMMARY_CACHE_PATH) if config.CHUNK_SUMMARY_CACHE_PATH else None
+        return cls(llm, model_name, cache, config.IMAGE_CAPTION_MAX_CONCURRENCY, config.CHUNK_SUMMARY_MIN_CHARS)
+
+    def summarize(self, parents: Dict[str, Document]) -> Dict[str, str]:
+        """{parent doc_id: summary} for the text parents of at least min_chars; failures are skipped."""
+        eligible = {doc_id: parent for doc_id, parent in parents.items()
+                    if isinstance(parent, Document) and len(parent.page_content) >= self.min_chars}
+        keys = {doc_id: SQLiteCaptionCache.make_key(self.model_name, parent.page_content.encode("utf-8"))
+                for doc_id, parent in eligible.items()}
+        cached = dict(zip(keys.values(), self.cache.get_many(list(keys.values())))) if self.cache is not None else {}
+        missing = [doc_id for doc_id in eligible if cached.get(keys[doc_id]) is None]
+        if missing:
+            print(f"[INFO] SectionSummarizer: Summarizing {len(missing)} section(s) ({len(eligible) - len(missing)} cached)...")
+            prompts = [section_summary_template.format(section=eligible[doc_id].metadata.get("section", ""),
+                                                       text=eligible[doc_id].page_content) for doc_id in missing]
+            results = self._chain.batch(prompts, config={"max_concurrency": self.max_concurrency}, return_exceptions=True)
+            fresh = {}
+            for doc_id, result in zip(missing, results):
+                if isinstance(result, Exception) or not result.strip():
+                    print(f"[WARN] SectionSummarizer: Could not summarize a section: {result!r}")
+                    continue
+                fresh[keys[doc_id]] = " ".join(result.split())
+            cached.update(fresh)
+            if self.cache is not None and fresh:
+                self.cache.put_many(list(fresh), list(fresh.values()))
+        return {doc_id: cached[keys[doc_id]] for doc_id in eligible if cached.get(keys[doc_id])}
@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .doc_store import MmapDocStore
+from .index_factory import COMPRESSED_INDEX_TYPES, EXACT_VECTORS_FILE, RescoringIndex, index_type_of, load_exact_vectors, set_search_params
+from .index_manifest import MANIFEST_FILE, read_manifest
+from .metrics import METRICS
+
+
+def document_key(pdf_path: str) -> str:
+    """Catalog key for a PDF: its lower-cased file stem with runs of other characters turned into '-'."""
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "document"
+
+
+class Shard:
+    """
+    One document's FAISS index, memory-mapped docstore and optional BM25 index. Searches
+    hold it while they use it; once it has been evicted or replaced, its docstore is
+    closed after the last of them releases it.
+    """
+
+    def __init__(self, key: str, vectorstore: FAISS, docstore: MmapDocStore, lexical_index: Optional[BM25Index], size_bytes: int,
+                 version: Optional[str] = None):
+        self.key = key
+        self.vectorstore = vectorstore
+        self.docstore = docstore
+        self.lexical_index = lexical_index
+        self.size_bytes = size_bytes
+        self.version = version  # manifest version of the shard when it was loaded
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._retired = False
+        self.closed = False
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            close = self._in_flight == 0 and self._retired
+        if close:
+            self.close()
+
+    def retire(self):
+        """Marks the shard dropped from the collection; it closes now if idle, else on its last release."""
+        with self._lock:
+            self._retired = True
+            idle = self._in_flight == 0
+        if idle:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        # FAISS and BM25 are plain memory, freed with the last reference; the mmap'd docstore is closed here.
+        self.docstore.close()
+
+
+class CollectionManager:
+    """
+    Serves many documents from one process with one shard per document:
+    <root>/shards/<key>/{db_faiss, docstore, bm25_index.json}, listed in <root>/catalog.json.
+
+    Shards load on first use and are kept in an LRU. When more than `max_loaded_shards`
+    are resident, or their in-memory index size exceeds `max_memory_mb`, the least
+    recently used shards are dropped. Docstores are memory-mapped and do not count;
+    a dropped shard's docstore is closed once no search holds it (see use_shards).
+    A query embeds the question once, searches the selected shards in parallel and
+    merges the results into one ranking.
+    """
+
+    CATALOG_FILE = "catalog.json"
+    SHARDS_DIR = "shards"
+
+    def __init__(
+        self,
+        root: str,
+        embedding_model=None,
+        max_loaded_shards: int = 8,
+        max_memory_mb: Optional[float] = None,
+        max_workers: int = 4,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        use_lexical: bool = True,
+        rescore_factor: Optional[int] = None,
+    ):
+        self.root = root
+        self.embedding_model = embedding_model
+        self.max_loaded_shards = max_loaded_shards
+        self.max_memory_bytes = max_memory_mb * 2**20 if max_memory_mb else None
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.use_lexical = use_lexical
+        self.rescore_factor = rescore_factor
+        self.catalog_path = os.path.join(root, self.CATALOG_FILE)
+        self._catalog: Dict[str, Dict[str, Any]] = {}
+        self._shards: "OrderedDict[str, Shard]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-search")
+        self.reload_catalog()
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.isfile(os.path.join(root, CollectionManager.CATALOG_FILE))
+
+    # Catalog
+
+    def reload_catalog(self) -> List[str]:
+        """
+        Re-reads catalog.json. Loaded shards that were removed, re-registered or rebuilt
+        (their manifest version moved on) are dropped and load again on next use; searches
+        in flight keep their reference. Returns the keys that were dropped.
+        """
+        catalog = {}
+        if os.path.exists(self.catalog_path):
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                catalog = json.load(f).get("documents", {})
+        with self._lock:
+            previous, self._catalog = self._catalog, catalog
+            stale = [
+                key for key, shard in self._shards.items()
+                if catalog.get(key) != previous.get(key) or self.shard_version(key) != shard.version
+            ]
+            for key in stale:
+                self._drop_locked(key)
+        return stale
+
+    def shard_version(self, key: str) -> Optional[str]:
+        manifest = read_manifest(os.path.join(self.shard_path(key), MANIFEST_FILE))
+        return manifest["version"] if manifest else None
+
+    def manifest_paths(self) -> List[str]:
+        with self._lock:
+            keys = sorted(self._catalog)
+        return [os.path.join(self.shard_path(key), MANIFEST_FILE) for key in keys]
+
+    def _write_catalog(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self._catalog}, f, indent=2)
+        os.replace(tmp_path, self.catalog_path)
+
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._catalog.items()}
+
+    def shard_path(self, key: str) -> str:
+        return os.path.join(self.root, self.SHARDS_DIR, key)
+
+    def shard_config(self, base_config, key: str):
+        """A config class whose index and docstore paths point into the shard directory (used for ingestion)."""
+        path = self.shard_path(key)
+        return type(f"{key}ShardConfig", (base_config if isinstance(base_config, type) else type(base_config),), {
+            "DB_FAISS_PATH": os.path.join(path, "db_faiss"),
+            "MMAP_DOCSTORE_PATH": os.path.join(path, "docstore"),
+            "DOCSTORE_PATH": os.path.join(path, "docstore.pkl"),  # never written; keeps the legacy fallback inside the shard
+            "BM25_INDEX_PATH": os.path.join(path, "bm25_index.json"),
+        })
+
+    def register(self, key: str, source: str, stats: Optional[Dict[str, Any]] = None):
+        """Adds or updates a document after its shard was (re)built; a loaded copy of the shard is dropped."""
+        with self._lock:
+            self._catalog[key] = {
+                "source": source,
+                "path": os.path.relpath(self.shard_path(key), self.root),
+                "updated_at": time.time(),
+                **({"chunks": stats.get("chunks"), "pages": stats.get("pages"), "version": stats.get("version")} if stats else {}),
+            }
+            self._write_catalog()
+            self._drop_locked(key)
+        print(f"[INFO] CollectionManager: Registered '{key}' ({source}).")
+
+    def remove(self, key: str):
+        with self._lock:
+            if key not in self._catalog:
+                raise KeyError(f"Unknown document '{key}'")
+            del self._catalog[key]
+            self._write_catalog()
+            self._drop_locked(key)
+        shutil.rmtree(self.shard_path(key), ignore_errors=True)
+        print(f"[INFO] CollectionManager: Removed '{key}'.")
+
+    # Shard loading
+
+    def _drop_locked(self, key: str):
+        shard = self._shards.pop(key, None)
+        if shard is not None:
+            shard.retire()
+
+    def _resident_bytes(self) -> int:
+        return sum(shard.size_bytes for shard in self._shards.values())
+
+    def _evict_locked(self, keep: str):
+        while len(self._shards) > 1 and (
+            len(self._shards) > self.max_loaded_shards
+            or (self.max_memory_bytes is not None and self._resident_bytes() > self.max_memory_bytes)
+        ):
+            key = next(iter(self._shards))
+            if key == keep:
+                self._shards.move_to_end(key)
+                key = next(iter(self._shards))
+            # Searches holding the shard keep it open; it closes when the last one releases it.
+            self._drop_locked(key)
+            print(f"[INFO] CollectionManager: Evicted shard '{key}'.")
+
+    def _load_shard(self, key: str) -> Shard:
+        path = self.shard_path(key)
+        version = self.shard_version(key)
+        faiss_path = os.path.join(path, "db_faiss")
+        vectorstore = FAISS.load_local(faiss_path, self.embedding_model, allow_dangerous_deserialization=True)
+        set_search_params(vectorstore.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        if self.rescore_factor and index_type_of(vectorstore.index) in COMPRESSED_INDEX_TYPES:
+            exact_vectors = load_exact_vectors(faiss_path, vectorstore.index.ntotal)
+            if exact_vectors is not None:
+                vectorstore.index = RescoringIndex(vectorstore.index, exact_vectors, self.rescore_factor)
+        bm25_path = os.path.join(path, "bm25_index.json")
+        lexical_index = None
+        if self.use_lexical:
+            lexical_index = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else BM25Index.from_vectorstore(vectorstore)
+        # The float32 side file is memory-mapped, like the docstore, and does not count.
+        size_bytes = sum(os.path.getsize(os.path.join(faiss_path, name)) for name in os.listdir(faiss_path) if name != EXACT_VECTORS_FILE)
+        if lexical_index is not None and os.path.exists(bm25_path):
+            size_bytes += os.path.getsize(bm25_path)
+        print(f"[INFO] CollectionManager: Loaded shard '{key}' ({vectorstore.index.ntotal} vectors).")
+        return Shard(key, vectorstore, MmapDocStore(os.path.join(path, "docstore")), lexical_index, size_bytes, version)
+
+    @staticmethod
+    def _hold_locked(shard: Shard, held: Optional[List[Shard]]) -> Shard:
+        # Acquired under the collection lock, so an eviction cannot close the shard first.
+        if held is not None:
+            shard.acquire()
+            held.append(shard)
+        return shard
+
+    def get_shard(self, key: str, held: Optional[List[Shard]] = None) -> Shard:
+        """The loaded shard for `key`, loading it if needed; acquired and added to `held` when given."""
+        with self._lock:
+            if key not in self._catalog:
+                raise KeyError(f"Unknown document '{key}'")
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                return self._hold_locked(shard, held)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        # Loading happens outside the collection lock so other shards stay searchable;
+        # the per-key lock stops two threads from loading the same shard.
+        with load_lock:
+            with self._lock:
+                shard = self._shards.get(key)
+                if shard is not None:
+                    return self._hold_locked(shard, held)
+            shard = self._load_shard(key)
+            with self._lock:
+                self._shards[key] = shard
+                self._hold_locked(shard, held)
+                self._evict_locked(keep=key)
+            return shard
+
+    @contextmanager
+    def use_shards(self) -> Iterator[List[Shard]]:
+        """
+        A list to pass as `held` to search/get_shard: the shards acquired through it stay
+        open until the block ends, even if they are evicted or reloaded meanwhile, so the
+        hits can still be fetched with mget.
+        """
+        held: List[Shard] = []
+        try:
+            yield held
+        finally:
+            for shard in held:
+                shard.release()
+
+    def loaded_keys(self) -> List[str]:
+        with self._lock:
+            return list(self._shards)
+
+    # Search
+
+    def _targets(self, documents: Optional[Sequence[str]]) -> List[str]:
+        with self._lock:
+            if documents is None:
+                return list(self._catalog)
+            unknown = [key for key in documents if key not in self._catalog]
+        if unknown:
+            raise KeyError(f"Unknown document(s): {', '.join(unknown)}")
+        return list(documents)
+
+    @staticmethod
+    def _search_shard(shard: Shard, query_vector: List[float], question: str, k: int, lexical_k: int):
+        relevance_score_fn = shard.vectorstore._select_relevance_score_fn()
+        dense = [
+            (doc.metadata.get("doc_id"), relevance_score_fn(distance))
+            for doc, distance in shard.vectorstore.similarity_search_with_score_by_vector(query_vector, k=k)
+        ]
+        lexical = shard.lexical_index.search(question, k=lexical_k) if shard.lexical_index is not None else []
+        return dense, lexical
+
+    def search(self, question: str, documents: Optional[Sequence[str]] = None, k: int = 10,
+               lexical_k: int = 10, rrf_k: int = 60, top_k: Optional[int] = None,
+               query_vector: Optional[List[float]] = None, held: Optional[List[Shard]] = None) -> List[Tuple[Shard, str, float]]:
+        """
+        Ranked (shard, parent doc_id, score) across the selected documents (all by default).
+        Dense hits from every shard are merged by relevance score. With BM25 enabled, shard
+        lexical hits are merged by BM25 score and fused with the dense ranking by RRF.
+        Pass `query_vector` when the question was already embedded (batch queries), and
+        `held` from use_shards() to keep the hits' shards open for mget.
+        """
+        if held is None:
+            with self.use_shards() as held:
+                return self.search(question, documents, k=k, lexical_k=lexical_k, rrf_k=rrf_k, top_k=top_k,
+                                   query_vector=query_vector, held=held)
+        targets = self._targets(documents)
+        if not targets:
+            return []
+        if query_vector is None:
+            with METRICS.stage("embed_query"):
+                query_vector = self.embedding_model.embed_query(question)
+        with METRICS.stage("shard_search"):
+            shards = list(self._executor.map(lambda key: self.get_shard(key, held), targets))
+            per_shard = list(self._executor.map(
+                lambda shard: self._search_shard(shard, query_vector, question, k, lexical_k), shards
+            ))
+
+        by_key = {shard.key: shard for shard in shards}
+        dense: Dict[Tuple[str, str], float] = {}
+        lexical: Dict[Tuple[str, str], float] = {}
+        for shard, (shard_dense, shard_lexical) in zip(shards, per_shard):
+            for doc_id, score in shard_dense:
+                if doc_id is not None:
+                    dense[(shard.key, doc_id)] = max(dense.get((shard.key, doc_id), float("-inf")), float(score))
+            for doc_id, score in shard_lexical:
+                lexical[(shard.key, doc_id)] = float(score)
+        # Each shard returned its own top-k children; keep the k best parents overall.
+        dense_ranking = sorted(dense, key=dense.get, reverse=True)[:k]
+        if not lexical:
+            return [(by_key[key], doc_id, dense[(key, doc_id)]) for key, doc_id in dense_ranking[:top_k]]
+        lexical_ranking = sorted(lexical, key=lexical.get, reverse=True)[:lexical_k]
+        fused_ids, fused_scores = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=rrf_k, limit=top_k)
+        return [(by_key[key], doc_id, score) for (key, doc_id), score in zip(fused_ids, fused_scores)]
+
+    @staticmethod
+    def mget(hits: Sequence[Tuple[Shard, str, float]]) -> List[Optional[Any]]:
+        """
+        Parent documents for search() hits, fetched from each hit's own shard. Search within
+        use_shards() so that a shard evicted since the search is still open here.
+        """
+        by_shard: Dict[str, List[int]] = {}
+        shards: Dict[str, Shard] = {}
+        for i, (shard, _, _) in enumerate(hits):
+            by_shard.setdefault(shard.key, []).append(i)
+            shards[shard.key] = shard
+        docs: List[Optional[Any]] = [None] * len(hits)
+        for key, positions in by_shard.items():
+            values = shards[key].docstore.mget([hits[i][1] for i in positions])
+            for i, value in zip(positions, values):
+                docs[i] = value
+        return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or remove documents in a shard collection.")
+    parser.add_argument("command", choices=["list", "remove"])
+    parser.add_argument("key", nargs="?", help="Document key (for remove)")
+    parser.add_argument("--root", default="vectorstore/collection")
+    args = parser.parse_args()
+    manager = CollectionManager(args.root)
+    if args.command == "list":
+        for key, entry in manager.documents().items():
+            print(f"{key}\t{entry.get('source')}\t{entry.get('chunks')} chunks")
+    else:
+        manager.remove(args.key)
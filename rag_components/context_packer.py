@@ -0,0 +1,191 @@
+import re
+from typing import Any, Dict, Optional, Set
+
+from langchain.schema.document import Document
+
+from .image_record import ImageRecord
+
+# gpt-4o / gpt-4o-mini bill a "low" detail image at a flat 85 tokens. "high" and "auto" depend
+# on the image size, so they are charged as a 1024x1024 image (85 + 4 tiles of 170 tokens).
+LOW_DETAIL_IMAGE_TOKENS = 85
+HIGH_DETAIL_IMAGE_TOKENS = 765
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class TokenCounter:
+    """
+    tiktoken counts for the configured model; falls back to ~4 characters per token if
+    unavailable. With estimate_only (the fake provider), tiktoken is never loaded, so no
+    encoding is downloaded.
+    """
+
+    def __init__(self, model_name: str, estimate_only: bool = False):
+        self.model_name = model_name
+        self._encoding = None
+        self._loaded = estimate_only
+
+    def _load(self):
+        self._loaded = True
+        try:
+            import tiktoken
+            self._encoding = tiktoken.encoding_for_model(self.model_name)
+        except Exception as e:
+            print(f"[WARN] context_packer.py: tiktoken unavailable for {self.model_name} ({e}); estimating tokens from length.")
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            self._load()
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+
+def _shingles(text: str, size: int = 3) -> Set[tuple]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _score_of(item: Any) -> float:
+    metadata = getattr(item, "metadata", None) or {}
+    score = metadata.get("score")
+    return score if score is not None else float("-inf")
+
+
+class ContextPacker:
+    """
+    Fits parsed retrieval context into a token budget before prompt building. Texts and
+    images are taken together in descending retrieval score; near-duplicate texts are
+    dropped, and a text that overflows the budget is cut at a sentence boundary. Images
+    are capped in number and charged for the configured detail; with image_mode "caption", captioned
+    images go in as their caption text instead (bounded by the token budget, not the image
+    cap). doc_ids and scores are filtered to what was kept. The returned context carries a
+    "packing" report and the image_mode.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4000,
+        max_images: int = 3,
+        near_duplicate_threshold: float = 0.8,
+        image_detail: str = "low",
+        model_name: str = "gpt-4o-mini",
+        min_trimmed_tokens: int = 40,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        self.token_budget = token_budget
+        self.max_images = max_images
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.image_detail = image_detail
+        self.min_trimmed_tokens = min_trimmed_tokens
+        self.token_counter = token_counter or TokenCounter(model_name)
+
+    def _trim_to_sentences(self, text: str, budget: int) -> Optional[str]:
+        kept = []
+        used = 0
+        for sentence in _SENTENCE_END.split(text):
+            tokens = self.token_counter.count(sentence + " ")
+            if used + tokens > budget:
+                break
+            kept.append(sentence)
+            used += tokens
+        if used < self.min_trimmed_tokens:
+            return None
+        return " ".join(kept)
+
+    def pack(self, context: Dict[str, Any], image_mode: str = "pixels") -> Dict[str, Any]:
+        texts = [doc if isinstance(doc, Document) else Document(page_content=str(doc)) for doc in context.get("texts", [])]
+        images = list(context.get("images", []))
+        report = {
+            "token_budget": self.token_budget,
+            "tokens_used": 0,
+            "tokens_dropped": 0,
+            "texts_kept": 0,
+            "texts_trimmed": 0,
+            "texts_dropped": 0,
+            "duplicates_dropped": 0,
+            "images_kept": 0,
+            "images_dropped": 0,
+            "images_as_captions": 0,
+            "image_detail": self.image_detail,
+        }
+
+        # Texts and images compete for the budget in one ranking by retrieval score; ties keep
+        # texts first. doc_ids/scores line up with texts + images (see DocumentParser.parse_docs).
+        doc_ids = list(context.get("doc_ids") or [])
+        scores = list(context.get("scores") or [])
+        items = [("text", doc) for doc in texts] + [("image", image) for image in images]
+        ranked = []
+        for position, (kind, item) in enumerate(items):
+            doc_id = doc_ids[position] if position < len(doc_ids) else None
+            score = scores[position] if position < len(scores) else None
+            ranked.append((kind, item, doc_id, score))
+        ranked.sort(key=lambda entry: entry[3] if entry[3] is not None else _score_of(entry[1]), reverse=True)
+
+        image_cost = LOW_DETAIL_IMAGE_TOKENS if self.image_detail == "low" else HIGH_DETAIL_IMAGE_TOKENS
+        kept_texts, kept_text_ids, kept_text_scores = [], [], []
+        kept_images, kept_image_ids, kept_image_scores = [], [], []
+        kept_shingles = []
+        pixel_images = 0
+        for kind, item, doc_id, score in ranked:
+            remaining = self.token_budget - report["tokens_used"]
+            if kind == "image":
+                caption = item.caption_text() if image_mode == "caption" and isinstance(item, ImageRecord) else None
+                if caption is not None:
+                    tokens = self.token_counter.count(caption)
+                    if tokens > remaining:
+                        report["images_dropped"] += 1
+                        continue
+                    report["images_as_captions"] += 1
+                else:
+                    tokens = image_cost
+                    if pixel_images >= self.max_images or tokens > remaining:
+                        report["images_dropped"] += 1
+                        continue
+                    pixel_images += 1
+                kept_images.append(item)
+                kept_image_ids.append(doc_id)
+                kept_image_scores.append(score)
+                report["tokens_used"] += tokens
+                continue
+
+            tokens = self.token_counter.count(item.page_content)
+            shingles = _shingles(item.page_content)
+            if any(_jaccard(shingles, other) >= self.near_duplicate_threshold for other in kept_shingles):
+                report["duplicates_dropped"] += 1
+                report["tokens_dropped"] += tokens
+                continue
+            if tokens > remaining:
+                trimmed = self._trim_to_sentences(item.page_content, remaining) if remaining > 0 else None
+                if trimmed is None:
+                    report["texts_dropped"] += 1
+                    report["tokens_dropped"] += tokens
+                    continue
+                trimmed_tokens = self.token_counter.count(trimmed)
+                report["texts_trimmed"] += 1
+                report["tokens_dropped"] += tokens - trimmed_tokens
+                item, tokens = Document(page_content=trimmed, metadata={**item.metadata, "trimmed": True}), trimmed_tokens
+            kept_texts.append(item)
+            kept_text_ids.append(doc_id)
+            kept_text_scores.append(score)
+            kept_shingles.append(shingles)
+            report["tokens_used"] += tokens
+        report["images_kept"] = len(kept_images)
+        report["texts_kept"] = len(kept_texts)
+
+        return {
+            **context,
+            "texts": kept_texts,
+            "images": kept_images,
+            "doc_ids": kept_text_ids + kept_image_ids,
+            "scores": kept_text_scores + kept_image_scores,
+            "image_mode": image_mode,
+            "packing": report,
+        }
@@ -0,0 +1,209 @@
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.output_parsers import StrOutputParser
+
+from .bm25_index import tokenize
+from .context_packer import TokenCounter
+from .prompt.prompts import condense_question_template
+
+# Words that point back at the previous turn rather than at new content.
+_REFERENCES = frozenset(
+    "it its itself that this these those they them their above previous earlier former latter same one ones "
+    "he she his her".split()
+)
+# Requests to say more about what was already answered; on their own they add nothing to search for.
+_ELABORATIONS = frozenset(
+    "explain elaborate further more detail details detailed example examples again simpler simply summarize "
+    "summarise summary clarify expand mean means meant why continue go tell me please give show another "
+    "rephrase shorter longer briefly brief step steps you could would can say about intuition".split()
+)
+_CONTINUATION_PREFIXES = ("and ", "also ", "but ", "what about ", "how about ", "then ", "so ")
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+REUSE, REWRITE, STANDALONE = "reuse", "rewrite", "standalone"
+
+
+class Turn:
+    """One answered question: what the user asked, what was searched for, the answer and its context."""
+
+    def __init__(self, question: str, query: str, answer: str, context: Optional[Dict[str, Any]],
+                 documents: Optional[Sequence[str]] = None):
+        self.question = question
+        self.query = query
+        self.answer = answer
+        self.context = context
+        self.documents = tuple(sorted(documents)) if documents else None
+
+
+class ConversationMemory:
+    """
+    Bounded chat history for one session. The last `recent_turns` turns are kept
+    verbatim; older ones are folded into one-line summaries (question and the first
+    sentence of the answer), oldest dropped first. `render()` never exceeds
+    `token_budget` tokens. Only the latest turn keeps its retrieved context.
+    """
+
+    def __init__(self, token_budget: int = 800, recent_turns: int = 3, model_name: str = "gpt-4o-mini",
+                 token_counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.recent_turns = max(1, recent_turns)
+        self.token_counter = token_counter or TokenCounter(model_name)
+        self.turns: List[Turn] = []
+        self.summary: List[str] = []
+
+    @property
+    def last_turn(self) -> Optional[Turn]:
+        return self.turns[-1] if self.turns else None
+
+    def add_turn(self, turn: Turn):
+        for previous in self.turns:
+            previous.context = None
+        self.turns.append(turn)
+        while len(self.turns) > self.recent_turns:
+            self.summary.append(self._summarize(self.turns.pop(0)))
+        # Summaries get at most a third of the budget.
+        while self.summary and self.token_counter.count("\n".join(self.summary)) > self.token_budget // 3:
+            self.summary.pop(0)
+
+    def clear(self):
+        self.turns = []
+        self.summary = []
+
+    @staticmethod
+    def _summarize(turn: Turn) -> str:
+        first_sentence = _SENTENCE_END.split(turn.answer.strip(), maxsplit=1)[0] if turn.answer else ""
+        return f"- Q: {turn.query[:200]} A: {first_sentence[:200]}"
+
+    def _trim(self, text: str, budget: int) -> str:
+        if self.token_counter.count(text) <= budget:
+            return text
+        # ~4 characters per token, shrunk until it fits.
+        limit = budget * 4
+        while limit > 0 and self.token_counter.count(text[:limit]) > budget:
+            limit = int(limit * 0.8)
+        return text[:limit].rstrip() + " …"
+
+    def render(self) -> str:
+        """History text for prompts: summaries of older turns, then the recent turns, within token_budget."""
+        if not self.turns:
+            return ""
+        parts = []
+        if self.summary:
+            parts.append("Earlier:\n" + "\n".join(self.summary))
+        remaining = self.token_budget - sum(self.token_counter.count(part) for part in parts)
+        # Newer turns are rendered first so they get the budget when it runs short.
+        recent = []
+        for turn in reversed(self.turns):
+            per_turn = max(0, remaining) // max(1, len(self.turns) - len(recent))
+            text = self._trim(f"User: {turn.question}\nAssistant: {turn.answer}", per_turn)
+            remaining -= self.token_counter.count(text)
+            recent.insert(0, text)
+        return "\n\n".join(parts + recent)
+
+
+class FollowUpRouter:
+    """
+    Decides how a question relates to the previous turn, without an LLM call:
+    - reuse: it only points back ("explain that further", "why?") and adds no new terms,
+      so the previous turn's context is answered from again and retrieval is skipped;
+    - rewrite: it refers back but asks about something new ("what about its variance?"),
+      so it is rewritten into a standalone query before retrieval;
+    - standalone: anything else, including every first question.
+    """
+
+    @staticmethod
+    def route(question: str, memory: ConversationMemory, documents: Optional[Sequence[str]] = None) -> str:
+        last = memory.last_turn
+        if last is None:
+            return STANDALONE
+        lowered = question.strip().lower()
+        words = _WORD.findall(lowered)
+        refers_back = bool(_REFERENCES.intersection(words)) or lowered.startswith(_CONTINUATION_PREFIXES)
+        elaborates = bool(_ELABORATIONS.intersection(words))
+        known = set(tokenize(f"{last.question} {last.query} {last.answer}"))
+        new_terms = [term for term in tokenize(question) if term not in _REFERENCES | _ELABORATIONS | known]
+        same_documents = last.documents == (tuple(sorted(documents)) if documents else None)
+        if not new_terms and (refers_back or elaborates or not words) and last.context is not None and same_documents:
+            return REUSE
+        if refers_back or (elaborates and not new_terms):
+            return REWRITE
+        return STANDALONE
+
+
+class ConversationalRAG:
+    """
+    Multi-turn front end for RAGChainManager. Follow-ups are routed by FollowUpRouter:
+    reused turns are answered from the previous context, rewritten ones are searched as
+    standalone queries, and every turn is added to the ConversationMemory. The bounded
+    history goes into the prompt on every route; answers with history skip the answer cache.
+    rewrite_mode "heuristic" (the default) appends the previous query to the follow-up,
+    which needs no LLM call; "llm" asks the chat model to rewrite, at one extra round trip.
+    """
+
+    def __init__(self, manager, memory: ConversationMemory, rewrite_mode: str = "heuristic"):
+        self.manager = manager
+        self.memory = memory
+        self.rewrite_mode = rewrite_mode
+        self.metrics = manager.metrics
+
+    def rewrite(self, question: str) -> str:
+        last = self.memory.last_turn
+        if self.rewrite_mode != "llm":
+            return f"{question} ({last.query})"
+        with self.metrics.stage("query_rewrite"):
+            prompt = condense_question_template.format(history=self.memory.render(), question=question)
+            rewritten = (self.manager.llm | StrOutputParser()).invoke(prompt).strip().strip('"')
+        # A rewrite that comes back empty or rambling is worse than the heuristic.
+        if not rewritten or len(rewritten) > 4 * len(f"{question} {last.query}"):
+            return f"{question} ({last.query})"
+        return rewritten
+
+    def plan(self, question: str, documents: Optional[Sequence[str]] = None) -> Dict[str, str]:
+        """{"route", "query"}: how the question will be answered and what, if anything, is searched for."""
+        route = FollowUpRouter.route(question, self.memory, documents)
+        self.metrics.inc("rag_conversation_turns_total", 1, "Questions by follow-up route.", route=route)
+        if route == REWRITE:
+            return {"route": route, "query": self.rewrite(question)}
+        if route == REUSE:
+            return {"route": route, "query": self.memory.last_turn.query}
+        return {"route": route, "query": question}
+
+    def stream(self, question: str, documents: Optional[Sequence[str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Same events as RAGChainManager.stream ({"context"} then {"answer"} tokens), preceded
+        by {"conversation": {"route", "query"}}.
+        """
+        plan = self.plan(question, documents)
+        yield {"conversation": plan}
+        answer, context, history = "", None, self.memory.render()
+        if plan["route"] == REUSE:
+            context = self.memory.last_turn.context
+            yield {"context": context}
+            for token in self.manager.stream_from_context(question, context, history):
+                answer += token
+                yield {"answer": token}
+        else:
+            for event in self.manager.stream(plan["query"], documents, history):
+                if "context" in event:
+                    context = event["context"]
+                elif "answer" in event:
+                    answer += event["answer"]
+                yield event
+        self.memory.add_turn(Turn(question, plan["query"], answer, context, documents))
+
+    def invoke_with_context(self, question: str, documents: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """invoke_with_context for a conversation turn, with the plan under "conversation"."""
+        started = time.perf_counter()
+        plan = self.plan(question, documents)
+        history = self.memory.render()
+        if plan["route"] == REUSE:
+            context = self.memory.last_turn.context
+            answer = "".join(self.manager.stream_from_context(question, context, history))
+            result = {"answer": answer, "context": context, "timings": {"total": time.perf_counter() - started}}
+        else:
+            result = self.manager.invoke_with_context(plan["query"], documents, history)
+        self.memory.add_turn(Turn(question, plan["query"], result["answer"], result["context"], documents))
+        return {**result, "conversation": plan}
@@ -0,0 +1,154 @@
+import argparse
+import json
+import mmap
+import os
+import pickle
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.stores import BaseStore
+
+from .image_record import ImageRecord, looks_like_base64_image
+
+
+class MmapDocStore(BaseStore[str, Any]):
+    """
+    Docstore for MultiVectorRetriever that keeps parent documents on disk.
+
+    The store is a directory with two files: `values.bin` holds the pickled records
+    back to back, and `index.json` maps each key to its (offset, length) in that file.
+    Opening the store only reads the index; `values.bin` is memory-mapped and a record
+    is unpickled only when `mget` asks for its key. Writes append to `values.bin` and
+    atomically replace `index.json`. Deleted records leave dead space until `compact()`.
+    """
+
+    VALUES_FILE = "values.bin"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+        os.makedirs(path, exist_ok=True)
+        self._values_path = os.path.join(path, self.VALUES_FILE)
+        self._index_path = os.path.join(path, self.INDEX_FILE)
+        if not os.path.exists(self._values_path):
+            open(self._values_path, "wb").close()
+        self._index: Dict[str, Tuple[int, int]] = {}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                self._index = {key: tuple(location) for key, location in json.load(f).items()}
+        self._remap()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, MmapDocStore.INDEX_FILE))
+
+    def _remap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._values_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses zero-length files; an empty store simply has nothing to map.
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def _write_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _decode(self, key: str) -> Any:
+        location = self._index.get(key)
+        if location is None or self._mmap is None:
+            return None
+        offset, length = location
+        return pickle.loads(self._mmap[offset:offset + length])
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        with self._lock:
+            return [self._decode(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, Any]]) -> None:
+        if not key_value_pairs:
+            return
+        with self._lock:
+            with open(self._values_path, "ab") as f:
+                offset = f.tell()
+                for key, value in key_value_pairs:
+                    record = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                    f.write(record)
+                    self._index[key] = (offset, len(record))
+                    offset += len(record)
+            self._write_index()
+            self._remap()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            removed = [self._index.pop(key, None) for key in keys]
+            if any(location is not None for location in removed):
+                self._write_index()
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            keys = list(self._index)
+        for key in keys:
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def compact(self):
+        """Rewrites values.bin without the space left behind by deleted or overwritten records."""
+        with self._lock:
+            tmp_path = self._values_path + ".tmp"
+            new_index = {}
+            with open(tmp_path, "wb") as f:
+                for key, (offset, length) in self._index.items():
+                    new_index[key] = (f.tell(), length)
+                    f.write(self._mmap[offset:offset + length])
+            self.close()
+            os.replace(tmp_path, self._values_path)
+            self._index = new_index
+            self._write_index()
+            self._remap()
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def convert_pickle_docstore(pkl_path: str, out_path: str, thumbnail_max_side: int = 512) -> MmapDocStore:
+    """
+    One-shot conversion of a pickled InMemoryStore (vectorstore/docstore.pkl) into an
+    MmapDocStore. Base64 image strings are upgraded to ImageRecords on the way.
+    """
+    with open(pkl_path, "rb") as f:
+        legacy_store = pickle.load(f)
+    store = MmapDocStore(out_path)
+    keys = list(legacy_store.yield_keys())
+    values = [
+        ImageRecord.from_base64(value, max_side=thumbnail_max_side)
+        if isinstance(value, str) and looks_like_base64_image(value) else value
+        for value in legacy_store.mget(keys)
+    ]
+    store.mset(list(zip(keys, values)))
+    print(f"[INFO] doc_store.py: Converted {len(keys)} documents from {pkl_path} to {out_path}.")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a pickled docstore into a memory-mapped MmapDocStore.")
+    parser.add_argument("pkl_path", nargs="?", default="vectorstore/docstore.pkl")
+    parser.add_argument("out_path", nargs="?", default="vectorstore/docstore")
+    args = parser.parse_args()
+    convert_pickle_docstore(args.pkl_path, args.out_path)
@@ -1,26 +1,62 @@
-from base64 import b64decode
 from langchain.schema.document import Document
-from typing import List, Dict, Union, Any
+from typing import List, Dict, Union, Any, Optional
+from .image_record import ImageRecord, looks_like_base64_image
 
 class DocumentParser:
     @staticmethod
-    def parse_docs(docs: List[Union[str, Document, Any]]) -> Dict[str, List[Union[str, Document]]]:
-        b64_images = []
+    def parse_docs(
+        docs: List[Union[str, Document, Any]],
+        doc_ids: Optional[List[str]] = None,
+        scores: Optional[List[float]] = None,
+    ) -> Dict[str, List[Any]]:
+        """
+        Splits retrieved docs into images and texts. ImageRecords are images by type;
+        plain strings from legacy docstores count as images only if they start like a
+        base64 JPEG/PNG/GIF/WEBP. When doc_ids/scores are given (aligned with docs),
+        they are copied onto each item's metadata and returned aligned with
+        texts + images: the texts' ids and scores first, then the images'.
+        """
+        images = []
         text_documents = []
+        text_ids, text_scores = [], []
+        image_ids, image_scores = [], []
         for i, doc in enumerate(docs):
-            if isinstance(doc, str):
-                try:
-                    b64decode(doc, validate=True)
-                    b64_images.append(doc)
-                except Exception:
-                    text_documents.append(Document(page_content=doc))
-            elif isinstance(doc, Document):
-                text_documents.append(doc)
+            doc_id = doc_ids[i] if doc_ids is not None else None
+            score = scores[i] if scores is not None else None
+            if isinstance(doc, ImageRecord):
+                images.append(doc.with_metadata(**DocumentParser._retrieval_metadata(doc_id, score)))
+            elif isinstance(doc, str) and looks_like_base64_image(doc):
+                images.append(doc)
             else:
-                try:
-                    content = str(doc) 
-                    text_documents.append(Document(page_content=content))
-                except Exception as e:
-                    print(f"[WARN] document_parser.py: Could not parse doc {i} of type {type(doc)}: {e}")
-                    continue
-        return {"images": b64_images, "texts": text_documents}
\ No newline at end of file
+                if isinstance(doc, Document):
+                    text = doc
+                else:
+                    try:
+                        text = Document(page_content=doc if isinstance(doc, str) else str(doc))
+                    except Exception as e:
+                        print(f"[WARN] document_parser.py: Could not parse doc {i} of type {type(doc)}: {e}")
+                        continue
+                text_documents.append(DocumentParser._with_retrieval_metadata(text, doc_id, score))
+                text_ids.append(doc_id)
+                text_scores.append(score)
+                continue
+            image_ids.append(doc_id)
+            image_scores.append(score)
+        return {"images": images, "texts": text_documents, "doc_ids": text_ids + image_ids, "scores": text_scores + image_scores}
+
+    @staticmethod
+    def _retrieval_metadata(doc_id: Optional[str], score: Optional[float]) -> Dict[str, Any]:
+        metadata = {}
+        if doc_id is not None:
+            metadata["doc_id"] = doc_id
+        if score is not None:
+            metadata["score"] = score
+        return metadata
+
+    @staticmethod
+    def _with_retrieval_metadata(doc: Document, doc_id: Optional[str], score: Optional[float]) -> Document:
+        # Copy rather than mutate: the instance may be shared with the docstore.
+        extra = DocumentParser._retrieval_metadata(doc_id, score)
+        if not extra:
+            return doc
+        return Document(page_content=doc.page_content, metadata={**doc.metadata, **extra})
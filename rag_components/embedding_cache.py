@@ -0,0 +1,166 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+
+def _as_float32(vectors: List[List[float]]) -> List[List[float]]:
+    # Round fresh vectors the same way cached ones are stored, so a hit and a miss agree exactly.
+    return np.asarray(vectors, dtype=np.float32).tolist()
+
+
+class SQLiteEmbeddingCache:
+    """
+    Disk-backed embedding cache. Rows are keyed by sha256(model name + text) and hold
+    the vector as a raw float32 blob. When `max_entries` is set, the least recently
+    used rows are evicted once the table grows past it. Lookups only read: access
+    times are buffered and written with the next put_many, or at most every
+    `flush_seconds`, so a hit costs no commit.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, flush_seconds: float = 30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self.make_key(model_name, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # SQLite caps bound parameters per statement, so look keys up in slices.
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            self._pending_access.update((key, now) for key in found)
+            if time.monotonic() - self._last_flush >= self.flush_seconds:
+                self._flush_locked()
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return [
+            np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            # Buffered access times go first so eviction sees them.
+            self._flush_locked()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict_locked()
+            self._conn.commit()
+
+    def flush(self):
+        """Writes buffered access times."""
+        with self._lock:
+            if self._pending_access:
+                self._flush_locked()
+                self._conn.commit()
+
+    def _flush_locked(self):
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()],
+            )
+            self._pending_access.clear()
+        self._last_flush = time.monotonic()
+
+    def _evict_locked(self):
+        if not self.max_entries:
+            return
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model so repeated texts (queries or chunks) are served from the cache."""
+
+    def __init__(self, underlying: Embeddings, cache: SQLiteEmbeddingCache, model_name: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Duplicate texts inside one call are only sent once.
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique_texts, _as_float32(self.underlying.embed_documents(unique_texts))))
+            self.cache.put_many(self.model_name, unique_texts, [computed[text] for text in unique_texts])
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many(self.model_name, [text])[0]
+        if vector is None:
+            vector = _as_float32([self.underlying.embed_query(text)])[0]
+            self.cache.put_many(self.model_name, [text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await run_in_executor(None, self.embed_query, text)
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI. Answers deterministically from the prompt it is
+    given and streams the answer word by word, optionally sleeping between tokens
+    to imitate network latency.
+    """
+
+    answer_prefix: str = "Based on the provided context:"
+    max_context_words: int = 40
+    token_delay: float = 0.0
+    first_token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _answer_for(self, messages: List[BaseMessage]) -> str:
+        prompt_text = ""
+        for message in messages:
+            if isinstance(message.content, str):
+                prompt_text += message.content
+            else:
+                for part in message.content:
+                    if isinstance(part, dict) and part.get("type") == "text":
+                        prompt_text += part["text"]
+        context = prompt_text.split("Context:")[-1].split("Question:")[0]
+        words = context.split()[: self.max_context_words]
+        if not words:
+            return "I cannot answer the question based on the provided context."
+        return f"{self.answer_prefix} {' '.join(words)}"
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], answer: str) -> dict:
+        """Whitespace word counts in the shape of usage_metadata, so token metrics work offline."""
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        output_tokens = len(answer.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return [token for token in re.split(r"(\s)", text) if token]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        answer = self._answer_for(messages)
+        if self.first_token_delay or self.token_delay:
+            time.sleep(self.first_token_delay + self.token_delay * len(self._tokens(answer)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer, usage_metadata=self._usage(messages, answer)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.first_token_delay:
+            time.sleep(self.first_token_delay)
+        for token in self._tokens(self._answer_for(messages)):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if self.first_token_delay:
+            await asyncio.sleep(self.first_token_delay)
+        for token in self._tokens(self._answer_for(messages)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class HashingFakeEmbeddings(Embeddings):
+    """
+    Offline stand-in for OpenAIEmbeddings. Each word is hashed to a signed dimension, so
+    texts sharing words get similar unit vectors; results are identical across processes.
+    """
+
+    def __init__(self, size: int = 1536, delay: float = 0.0):
+        self.size = size
+        self.delay = delay
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.delay:
+            time.sleep(self.delay)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
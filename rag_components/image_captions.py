@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from .image_record import ImageRecord
+from .prompt.prompts import image_caption_template
+
+IMAGE_POLICIES = ("auto", "caption", "pixels")
+
+# Questions about how something looks: the caption cannot be trusted to have recorded it.
+_APPEARANCE = re.compile(
+    r"\b(look(s|ed)? like|colou?rs?|colou?red|shapes?|axis|axes|legend|pixels?|visual(ly)?|draw(n|ing)?|"
+    r"layout|arrows?|shaded|dashed|dotted|marker|scale)\b"
+)
+_VISUAL_NOUNS = re.compile(r"\b(figures?|fig\.?|plots?|charts?|graphs?|diagrams?|images?|pictures?|illustrations?|screenshots?)\b")
+# Combined with a visual noun: asks for what can only be read off the figure itself.
+_DETAIL = re.compile(
+    r"\b(values?|numbers?|read|exact(ly)?|labels?|labell?ed|trends?|curves?|points?|peaks?|slopes?|describe|details?|"
+    r"compare|where|position|highest|lowest|between)\b"
+)
+
+
+class SQLiteCaptionCache:
+    """
+    Captions shared by every ingestion run and collection shard. Rows are keyed by
+    sha256(model name + image bytes), so a figure that reappears (re-ingestion, a
+    --rebuild, the same image in another PDF) is never sent to the model again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions (key TEXT PRIMARY KEY, caption TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, data: bytes) -> str:
+        return hashlib.sha256(model_name.encode("utf-8") + b"\x00" + data).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = list(keys[i:i + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, caption FROM captions WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys: Sequence[str], captions: Sequence[str]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO captions VALUES (?, ?, ?)",
+                                   [(key, caption, now) for key, caption in zip(keys, captions)])
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+
+class ImageCaptioner:
+    """
+    Describes images once at ingestion with the chat model, so queries can use the text
+    instead of sending the image. Distinct images are captioned concurrently; cached
+    captions are reused. Images too small (shorter side under `min_side` pixels) or too
+    stretched (aspect ratio beyond `max_aspect`) to carry content are skipped, as is any
+    image whose caption fails; those stay uncaptioned.
+    """
+
+    def __init__(self, llm, model_name: str, cache: Optional[SQLiteCaptionCache] = None, max_concurrency: int = 4,
+                 detail: str = "auto", min_side: int = 0, max_aspect: Optional[float] = None):
+        self.llm = llm
+        self.model_name = model_name
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.detail = detail
+        self.min_side = min_side
+        self.max_aspect = max_aspect
+        self._chain = llm | StrOutputParser()
+
+    @classmethod
+    def from_config(cls, config, llm) -> Optional["ImageCaptioner"]:
+        if not config.IMAGE_CAPTIONS_ENABLED:
+            return None
+        model_name = config.LLM_MODEL_NAME if config.LLM_PROVIDER == "openai" else config.LLM_PROVIDER
+        cache = SQLiteCaptionCache(config.IMAGE_CAPTION_CACHE_PATH) if config.IMAGE_CAPTION_CACHE_PATH else None
+        return cls(llm, model_name, cache, config.IMAGE_CAPTION_MAX_CONCURRENCY, config.IMAGE_CAPTION_DETAIL,
+                   min_side=config.IMAGE_CAPTION_MIN_SIDE, max_aspect=config.IMAGE_CAPTION_MAX_ASPECT)
+
+    def worth_captioning(self, record: ImageRecord) -> bool:
+        """False for decorations: images under min_side pixels or beyond max_aspect. Unknown sizes are captioned."""
+        if not record.width or not record.height:
+            return True
+        short_side, long_side = sorted((record.width, record.height))
+        if short_side < self.min_side:
+            return False
+        return self.max_aspect is None or long_side / short_side <= self.max_aspect
+
+    def _message(self, record: ImageRecord) -> List[HumanMessage]:
+        return [HumanMessage(content=[
+            {"type": "text", "text": image_caption_template},
+            {"type": "image_url", "image_url": {"url": record.thumbnail_data_url(), "detail": self.detail}},
+        ])]
+
+    def caption(self, records: Sequence[ImageRecord]) -> List[Optional[str]]:
+        """One caption (or None) per record, in order."""
+        keys = [SQLiteCaptionCache.make_key(self.model_name, record.data) for record in records]
+        captions = dict(zip(keys, self.cache.get_many(keys))) if self.cache is not None else {}
+        missing = {key: record for key, record in zip(keys, records) if captions.get(key) is None}
+        skipped = [key for key, record in missing.items() if not self.worth_captioning(record)]
+        for key in skipped:
+            del missing[key]
+        if missing:
+            print(f"[INFO] ImageCaptioner: Captioning {len(missing)} image(s) "
+                  f"({len(records) - len(missing) - len(skipped)} cached or repeated, {len(skipped)} too small or narrow)...")
+            results = self._chain.batch([self._message(record) for record in missing.values()],
+                                        config={"max_concurrency": self.max_concurrency}, return_exceptions=True)
+            fresh = {}
+            for key, result in zip(missing, results):
+                if isinstance(result, Exception) or not result.strip():
+                    print(f"[WARN] ImageCaptioner: Could not caption an image: {result!r}")
+                    continue
+                fresh[key] = " ".join(result.split())
+            captions.update(fresh)
+            if self.cache is not None and fresh:
+                self.cache.put_many(list(fresh), list(fresh.values()))
+        return [captions.get(key) for key in keys]
+
+
+class ImagePolicy:
+    """
+    Per-query choice between an image's caption and its pixels. "auto" sends pixels only
+    when the question is about appearance (colours, axes, shapes) or asks to read details
+    off a figure, plot or diagram; "caption" and "pixels" always do the one thing.
+    Images without a caption are always sent as pixels.
+    """
+
+    CAPTION, PIXELS = "caption", "pixels"
+
+    def __init__(self, mode: str = "auto"):
+        self.mode = mode
+
+    def decide(self, question: str) -> str:
+        if self.mode != "auto":
+            return self.mode
+        lowered = question.lower()
+        if _APPEARANCE.search(lowered) or (_VISUAL_NOUNS.search(lowered) and _DETAIL.search(lowered)):
+            return self.PIXELS
+        return self.CAPTION
@@ -0,0 +1,110 @@
+import base64
+import io
+from typing import Any, Dict, Optional
+
+# Leading characters of base64-encoded JPEG/PNG/GIF/WEBP files. Used to recognise images in
+# legacy docstores (which hold plain base64 strings) without decoding them.
+_BASE64_IMAGE_PREFIXES = ("/9j/", "iVBORw0KGgo", "R0lGOD", "UklGR")
+
+
+def detect_mime_type(data: bytes) -> str:
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def looks_like_base64_image(value: str) -> bool:
+    return value.startswith(_BASE64_IMAGE_PREFIXES)
+
+
+def make_thumbnail(data: bytes, max_side: int) -> Optional[tuple]:
+    """Returns (jpeg_bytes, width, height, original_width, original_height), or None without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        original_size = image.size
+        image.thumbnail((max_side, max_side))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=85)
+        return output.getvalue(), image.size[0], image.size[1], original_size[0], original_size[1]
+
+
+class ImageRecord:
+    """
+    Image parent document: the original bytes with their MIME type, plus a downscaled
+    JPEG used for the LLM prompt and the sidebar. Stored as-is (no base64) in the docstore.
+    A caption written at ingestion lives in metadata["caption"].
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        mime_type: str,
+        thumbnail: Optional[bytes] = None,
+        thumbnail_mime_type: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        self.data = data
+        self.mime_type = mime_type
+        self.thumbnail = thumbnail if thumbnail is not None else data
+        self.thumbnail_mime_type = thumbnail_mime_type or mime_type
+        self.width = width
+        self.height = height
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_side: int = 512, metadata: Optional[Dict[str, Any]] = None) -> "ImageRecord":
+        mime_type = detect_mime_type(data)
+        try:
+            thumbnail = make_thumbnail(data, max_side)
+        except Exception as e:
+            print(f"[WARN] image_record.py: Could not build thumbnail ({mime_type}): {e}")
+            thumbnail = None
+        if thumbnail is None:
+            return cls(data, mime_type, metadata=metadata)
+        thumbnail_bytes, _, _, width, height = thumbnail
+        if max(width, height) <= max_side and mime_type in ("image/jpeg", "image/png"):
+            # Already small enough: re-encoding would not save pixels, only add artefacts.
+            return cls(data, mime_type, width=width, height=height, metadata=metadata)
+        return cls(data, mime_type, thumbnail_bytes, "image/jpeg", width, height, metadata)
+
+    @classmethod
+    def from_base64(cls, value: str, max_side: int = 512, metadata: Optional[Dict[str, Any]] = None) -> "ImageRecord":
+        return cls.from_bytes(base64.b64decode(value), max_side=max_side, metadata=metadata)
+
+    def with_metadata(self, **metadata) -> "ImageRecord":
+        """Copy with extra metadata; the byte buffers are shared, not duplicated."""
+        return ImageRecord(self.data, self.mime_type, self.thumbnail, self.thumbnail_mime_type,
+                           self.width, self.height, {**self.metadata, **metadata})
+
+    @property
+    def caption(self) -> Optional[str]:
+        return self.metadata.get("caption")
+
+    def caption_text(self) -> Optional[str]:
+        """The caption as it is indexed and put into prompts, with where the image came from."""
+        if not self.caption:
+            return None
+        page, source = self.metadata.get("page"), self.metadata.get("source")
+        where = f" on page {page} of {source}" if page and source else ""
+        return f"[Image{where}] {self.caption}"
+
+    def thumbnail_data_url(self) -> str:
+        encoded = base64.b64encode(self.thumbnail).decode("ascii")
+        return f"data:{self.thumbnail_mime_type};base64,{encoded}"
+
+    def __repr__(self) -> str:
+        return (f"ImageRecord(mime_type={self.mime_type!r}, bytes={len(self.data)}, "
+                f"thumbnail_bytes={len(self.thumbnail)}, size={self.width}x{self.height})")
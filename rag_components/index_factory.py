@@ -0,0 +1,259 @@
+import json
+import math
+import os
+import time
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "pq")
+# Types that need a training set; below min_vectors they fall back to flat.
+ANN_INDEX_TYPES = ("ivf_flat", "hnsw", "ivf_pq", "pq")
+# Types whose stored codes are lossy, so results can be re-scored against exact float32 vectors.
+COMPRESSED_INDEX_TYPES = ("fp16", "sq8", "pq", "ivf_pq")
+INDEX_META_FILE = "index_meta.json"
+EXACT_VECTORS_FILE = "vectors.npy"  # float32 copy in index position order, memory-mapped at query time
+# FAISS warns below ~39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_params_from_config(config) -> Dict[str, Any]:
+    return {
+        "nlist": config.FAISS_NLIST,
+        "hnsw_m": config.FAISS_HNSW_M,
+        "ef_construction": config.FAISS_EF_CONSTRUCTION,
+        "pq_m": config.FAISS_PQ_M,
+        "pq_nbits": config.FAISS_PQ_NBITS,
+        "train_sample_size": config.FAISS_TRAIN_SAMPLE_SIZE,
+        "min_vectors": config.FAISS_ANN_MIN_VECTORS,
+    }
+
+
+def _largest_divisor_at_most(dim: int, limit: int) -> int:
+    for candidate in range(min(limit, dim), 0, -1):
+        if dim % candidate == 0:
+            return candidate
+    return 1
+
+
+def factory_string(index_type: str, dim: int, n_train: int, params: Dict[str, Any]) -> str:
+    """
+    faiss.index_factory description for the requested type, with nlist and PQ bits
+    clamped so that small corpora still train.
+    """
+    nlist = max(1, min(params.get("nlist", 1024), n_train // MIN_POINTS_PER_CENTROID))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{params.get('hnsw_m', 32)},Flat"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type in ("ivf_pq", "pq"):
+        pq_m = _largest_divisor_at_most(dim, params.get("pq_m", 64))
+        pq_nbits = max(1, min(params.get("pq_nbits", 8), int(math.log2(max(2, n_train // MIN_POINTS_PER_CENTROID)))))
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}" if index_type == "ivf_pq" else f"PQ{pq_m}x{pq_nbits}"
+    raise ValueError(f"Unknown FAISS index type '{index_type}'. Use one of {', '.join(INDEX_TYPES)}.")
+
+
+def build_index(vectors: np.ndarray, index_type: str, params: Dict[str, Any], seed: int = 0) -> Dict[str, Any]:
+    """
+    Builds and fills an L2 index of the given type. IVF variants are trained on a random
+    sample of at most train_sample_size vectors. Corpora smaller than min_vectors get a
+    flat index, since exact search is already fast there.
+    Returns {"index", "meta"}; meta is what write_index_meta persists.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    requested = index_type
+    if index_type in ANN_INDEX_TYPES and n < params.get("min_vectors", 0):
+        print(f"[INFO] index_factory.py: {n} vectors is below FAISS_ANN_MIN_VECTORS; using a flat index instead of {index_type}.")
+        index_type = "flat"
+
+    sample_size = min(n, params.get("train_sample_size", n))
+    description = factory_string(index_type, dim, sample_size, params)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    started = time.perf_counter()
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = params.get("ef_construction", 200)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=sample_size, replace=False)] if sample_size < n else vectors
+        index.train(sample)
+    trained = time.perf_counter()
+    index.add(vectors)
+    finished = time.perf_counter()
+    print(f"[INFO] index_factory.py: Built {description} over {n} vectors "
+          f"(train {trained - started:.2f}s on {sample_size}, add {finished - trained:.2f}s).")
+    meta = {
+        "index_type": index_type,
+        "requested_index_type": requested,
+        "factory": description,
+        "dim": dim,
+        "ntotal": int(index.ntotal),
+        "trained_on": sample_size if description != "Flat" else 0,
+        "params": params,
+        "built_at": time.time(),
+    }
+    return {"index": index, "meta": meta}
+
+
+def _unwrap(index):
+    return index.index if isinstance(index, RescoringIndex) else index
+
+
+def index_type_of(index) -> str:
+    """Maps a loaded FAISS index back onto INDEX_TYPES."""
+    concrete = faiss.downcast_index(_unwrap(index))
+    if isinstance(concrete, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(concrete, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(concrete, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(concrete, faiss.IndexPQ):
+        return "pq"
+    if isinstance(concrete, faiss.IndexScalarQuantizer):
+        return "fp16" if concrete.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Dict[str, Any]:
+    """Applies query-time knobs (IVF nprobe, HNSW efSearch) where the index supports them."""
+    concrete = faiss.downcast_index(_unwrap(index))
+    applied = {}
+    if nprobe is not None and isinstance(concrete, faiss.IndexIVF):
+        concrete.nprobe = min(nprobe, concrete.nlist)
+        applied["nprobe"] = concrete.nprobe
+    if ef_search is not None and isinstance(concrete, faiss.IndexHNSW):
+        concrete.hnsw.efSearch = ef_search
+        applied["efSearch"] = ef_search
+    return applied
+
+
+def reconstruct_vectors(index) -> Optional[np.ndarray]:
+    """
+    All stored vectors in position order, or None when the index only keeps lossy codes
+    (PQ, SQ8) and the originals have to come from the exact side file or be re-embedded.
+    fp16 decodes closely enough to be reused.
+    """
+    index = _unwrap(index)
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    concrete = faiss.downcast_index(index)
+    if index_type_of(concrete) in ("pq", "ivf_pq", "sq8"):
+        return None
+    if isinstance(concrete, faiss.IndexIVF):
+        concrete.make_direct_map()
+    return concrete.reconstruct_n(0, concrete.ntotal)
+
+
+def write_index_meta(faiss_path: str, meta: Dict[str, Any]):
+    with open(os.path.join(faiss_path, INDEX_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def read_index_meta(faiss_path: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(faiss_path, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_exact_vectors(faiss_path: str, vectors: np.ndarray):
+    """Writes the float32 side file used for exact re-scoring (atomically, as a .npy file)."""
+    path = os.path.join(faiss_path, EXACT_VECTORS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def remove_exact_vectors(faiss_path: str):
+    path = os.path.join(faiss_path, EXACT_VECTORS_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_exact_vectors(faiss_path: str, ntotal: Optional[int] = None) -> Optional[np.ndarray]:
+    """The side file memory-mapped read-only, or None if missing or out of step with the index."""
+    path = os.path.join(faiss_path, EXACT_VECTORS_FILE)
+    if not os.path.exists(path):
+        return None
+    vectors = np.load(path, mmap_mode="r")
+    if ntotal is not None and vectors.shape[0] != ntotal:
+        print(f"[WARN] index_factory.py: {path} has {vectors.shape[0]} vectors but the index has {ntotal}; ignoring it.")
+        return None
+    return vectors
+
+
+class RescoringIndex:
+    """
+    Wraps a compressed FAISS index: each search fetches `factor` times more candidates
+    from the codes, then re-ranks them by exact L2 distance against float32 vectors read
+    from the memory-mapped side file. Only the candidates' rows are paged in. Everything
+    else is delegated to the wrapped index.
+    """
+
+    def __init__(self, index, vectors: np.ndarray, factor: int = 4):
+        self.index = index
+        self.vectors = vectors
+        self.factor = max(1, factor)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, x: np.ndarray, k: int):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        fetch = max(k, min(self.index.ntotal, k * self.factor))
+        _, candidates = self.index.search(x, fetch)
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, ids in enumerate(candidates):
+            ids = np.sort(ids[ids >= 0])  # ascending positions read the side file front to back
+            if not len(ids):
+                continue
+            exact = np.asarray(self.vectors[ids], dtype=np.float32)
+            exact_distances = ((exact - x[row]) ** 2).sum(axis=1)
+            best = np.argsort(exact_distances, kind="stable")[:k]
+            labels[row, :len(best)] = ids[best]
+            distances[row, :len(best)] = exact_distances[best]
+        return distances, labels
+
+
+def compression_report(index, vectors: np.ndarray, k: int = 10, queries: int = 100, rescore_factor: Optional[int] = None,
+                       seed: int = 0) -> Dict[str, Any]:
+    """
+    Memory saved and recall@k lost by a compressed index, measured against exact search
+    over `vectors` with a sample of stored vectors as queries (plus re-scored recall when
+    rescore_factor is given).
+    """
+    n, dim = vectors.shape
+    float32_bytes = n * dim * 4
+    index_bytes = len(faiss.serialize_index(_unwrap(index)))
+    report = {
+        "float32_bytes": float32_bytes,
+        "index_bytes": index_bytes,
+        "memory_saved": 1 - index_bytes / float32_bytes if float32_bytes else 0.0,
+    }
+    if n == 0:
+        return report
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    sample = np.ascontiguousarray(vectors[rng.choice(n, size=min(queries, n), replace=False)], dtype=np.float32)
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    _, truth = exact.search(sample, k)
+
+    def recall(found: np.ndarray) -> float:
+        return sum(len(set(a) & set(b)) for a, b in zip(found.tolist(), truth.tolist())) / truth.size
+
+    report[f"recall@{k}"] = recall(_unwrap(index).search(sample, k)[1])
+    if rescore_factor:
+        report[f"rescored_recall@{k}"] = recall(RescoringIndex(_unwrap(index), vectors, rescore_factor).search(sample, k)[1])
+    return report
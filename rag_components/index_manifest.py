@@ -0,0 +1,95 @@
+"""
+Versioned vectorstores. manifest.json sits next to db_faiss/ and names the version of the
+index, docstore and BM25 files beside it, plus what the index was built with. Ingestion
+writes it last, so a reader that sees a new version sees a complete build.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+
+from .doc_store import MmapDocStore
+from .index_factory import index_type_of
+
+MANIFEST_FILE = "manifest.json"
+
+
+def manifest_path(config) -> str:
+    return os.path.join(os.path.dirname(os.path.normpath(config.DB_FAISS_PATH)), MANIFEST_FILE)
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_digest(paths: List[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(config) -> str:
+    """
+    Content hash of the index, docstore index and BM25 file. index.pkl is left out: it does
+    not pickle byte-identically across identical rebuilds, and every child text change
+    already shows in the vectors and the BM25 file.
+    """
+    return file_digest([
+        os.path.join(config.DB_FAISS_PATH, "index.faiss"),
+        os.path.join(config.MMAP_DOCSTORE_PATH, MmapDocStore.INDEX_FILE),
+        config.DOCSTORE_PATH,
+        config.BM25_INDEX_PATH,
+    ])
+
+
+def embedding_model_name(config) -> str:
+    if config.EMBEDDING_PROVIDER == "fake":
+        return f"hashing-fake-{config.FAKE_EMBEDDING_SIZE}"
+    return config.EMBEDDING_MODEL_NAME
+
+
+def update_manifest(config) -> Dict[str, Any]:
+    """
+    Writes a new manifest if the vectorstore's content changed since the last one and
+    returns the current manifest. Rebuilding identical content keeps the version.
+    """
+    path = manifest_path(config)
+    fingerprint = source_fingerprint(config)
+    existing = read_manifest(path)
+    if existing is not None and existing.get("source_fingerprint") == fingerprint:
+        return existing
+    index_file = os.path.join(config.DB_FAISS_PATH, "index.faiss")
+    index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP_IFC)
+    built_at = time.time()
+    manifest = {
+        "version": f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(built_at))}-{fingerprint[:8]}",
+        "built_at": built_at,
+        "source_fingerprint": fingerprint,
+        "index_sha256": file_digest([index_file]),
+        "index_type": index_type_of(index),
+        "ntotal": int(index.ntotal),
+        "dim": int(index.d),
+        "embedding_model": embedding_model_name(config),
+    }
+    write_manifest(path, manifest)
+    print(f"[INFO] index_manifest.py: Vectorstore version is now {manifest['version']}.")
+    return manifest
@@ -0,0 +1,329 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram plus a bounded window of recent samples for percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return 0.0
+        rank = (len(ordered) - 1) * pct / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms, counters and gauges. Gauges may be callbacks so cache hit
+    rates are read at scrape time. Renders Prometheus text format or a JSON dict.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels):
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, help_text: str = "", **labels):
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float], help_text: str = ""):
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            self._gauge_callbacks[name] = callback
+
+    @contextmanager
+    def timer(self, name: str, help_text: str = "", **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, help_text, **labels)
+
+    def stage(self, stage: str):
+        """Times one pipeline stage into rag_stage_duration_seconds{stage=...}."""
+        return self.timer("rag_stage_duration_seconds", "Duration of each RAG pipeline stage.", stage=stage)
+
+    def _gauge_values(self) -> Dict[str, Dict[LabelKey, float]]:
+        gauges = {name: dict(series) for name, series in self._gauges.items()}
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                gauges[name] = {(): float(callback())}
+            except Exception as e:
+                print(f"[WARN] metrics.py: Gauge callback {name} failed: {e}")
+        return gauges
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    for upper, count in zip(histogram.buckets, histogram.bucket_counts):
+                        lines.append(f"{name}_bucket{_format_labels(labels, {'le': repr(upper)})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._gauge_values().items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, Any]:
+        def series_name(name: str, labels: LabelKey) -> str:
+            return name + _format_labels(labels)
+
+        with self._lock:
+            histograms = {
+                series_name(name, labels): {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.percentile(50),
+                    "p95": h.percentile(95),
+                    "p99": h.percentile(99),
+                }
+                for name, series in self._histograms.items() for labels, h in series.items()
+            }
+            counters = {series_name(name, labels): value
+                        for name, series in self._counters.items() for labels, value in series.items()}
+            gauges = {series_name(name, labels): value
+                      for name, series in self._gauge_values().items() for labels, value in series.items()}
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def dump_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that records LLM latency, time to first token and token
+    usage, plus the duration of named chain steps (e.g. StrOutputParser).
+    """
+
+    def __init__(self, registry: MetricsRegistry = METRICS, timed_chains: Optional[Dict[str, str]] = None):
+        self.registry = registry
+        self.timed_chains = timed_chains or {"StrOutputParser": "output_parsing"}
+        self._llm_runs: Dict[UUID, Dict[str, Any]] = {}
+        self._chain_runs: Dict[UUID, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        with self._lock:
+            self._llm_runs[run_id] = {"started": time.perf_counter(), "first_token": None}
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        with self._lock:
+            self._llm_runs[run_id] = {"started": time.perf_counter(), "first_token": None}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._llm_runs.get(run_id)
+            if run is None or run["first_token"] is not None:
+                return
+            run["first_token"] = time.perf_counter()
+        self.registry.observe("rag_llm_time_to_first_token_seconds", run["first_token"] - run["started"],
+                              "Time from LLM request to first streamed token.")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._llm_runs.pop(run_id, None)
+        if run is not None:
+            self.registry.observe("rag_stage_duration_seconds", time.perf_counter() - run["started"],
+                                  "Duration of each RAG pipeline stage.", stage="llm")
+        prompt_tokens, completion_tokens = self._usage(response)
+        if prompt_tokens:
+            self.registry.inc("rag_llm_prompt_tokens_total", prompt_tokens, "Prompt tokens sent to the LLM.")
+        if completion_tokens:
+            self.registry.inc("rag_llm_completion_tokens_total", completion_tokens, "Completion tokens returned by the LLM.")
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        with self._lock:
+            self._llm_runs.pop(run_id, None)
+        self.registry.inc("rag_llm_errors_total", 1, "LLM calls that raised.", error=type(error).__name__)
+
+    @staticmethod
+    def _usage(response) -> Tuple[int, int]:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+        return 0, 0
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, **kwargs):
+        stage = self.timed_chains.get(kwargs.get("name") or (serialized or {}).get("name", ""))
+        if stage:
+            with self._lock:
+                self._chain_runs[run_id] = (stage, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._chain_runs.pop(run_id, None)
+        if run is not None:
+            stage, started = run
+            self.registry.observe("rag_stage_duration_seconds", time.perf_counter() - started,
+                                  "Duration of each RAG pipeline stage.", stage=stage)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        with self._lock:
+            self._chain_runs.pop(run_id, None)
+
+
+class SlowRequestProfiler:
+    """
+    Runs cProfile on a random sample of requests and keeps the profile (as a .prof file
+    plus a text summary) only when the request turned out slower than the threshold.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, threshold_seconds: float = 2.0, output_dir: str = "profiles",
+                 registry: MetricsRegistry = METRICS):
+        self.sample_rate = sample_rate
+        self.threshold_seconds = threshold_seconds
+        self.output_dir = output_dir
+        self.registry = registry
+        # cProfile allows one active profiler per thread group; concurrent requests skip profiling.
+        self._active = threading.Lock()
+
+    @contextmanager
+    def profile(self, label: str = "request"):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            yield
+            return
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._active.release()
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold_seconds:
+                self._save(profiler, label, elapsed)
+
+    def _save(self, profiler: cProfile.Profile, label: str, elapsed: float):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{elapsed:.2f}s")
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        self.registry.inc("rag_slow_request_profiles_total", 1, "Slow requests captured by cProfile.")
+        print(f"[INFO] SlowRequestProfiler: Saved profile of {elapsed:.2f}s {label} to {base}.prof")
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = METRICS
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(self.registry.to_dict(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = self.registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, registry: MetricsRegistry = METRICS, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"[INFO] metrics.py: Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,573 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .metrics import METRICS, MetricsRegistry
+
+# Completion tokens reserved against the TPM limit when a chat request sets no max_tokens.
+DEFAULT_COMPLETION_TOKENS = 512
+# gpt-4o / gpt-4o-mini bill a "low" detail image at a flat 85 tokens; other details are estimated higher.
+IMAGE_TOKENS = {"low": 85, "auto": 765, "high": 765}
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while the circuit breaker is open (the SDK reports it as APIConnectionError)."""
+
+
+class TokenBucket:
+    """
+    Continuous-refill bucket holding `per_minute` units. `reserve` takes the units at once,
+    letting the balance go negative, and returns how long the caller must wait for the
+    debt to refill. That keeps waiting outside the lock, for threads and coroutines alike.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill_locked()
+            # A request larger than the bucket only waits for a full bucket, not forever.
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Gives back (or, when negative, takes) units once the real cost is known."""
+        with self._lock:
+            self._refill_locked()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Client-side RPM and TPM limits, one pair of buckets per model (OpenAI limits are per model)."""
+
+    def __init__(self, rpm: Optional[int], tpm: Optional[int]):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._buckets: Dict[str, Tuple[Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model: str):
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = (TokenBucket(self.rpm) if self.rpm else None, TokenBucket(self.tpm) if self.tpm else None)
+            return self._buckets[model]
+
+    def reserve(self, model: str, tokens: int) -> float:
+        requests, token_bucket = self._buckets_for(model)
+        waits = [requests.reserve(1) if requests else 0.0, token_bucket.reserve(tokens) if token_bucket else 0.0]
+        return max(waits)
+
+    def refund(self, model: str, tokens: int):
+        _, token_bucket = self._buckets_for(model)
+        if token_bucket is not None and tokens:
+            token_bucket.refund(tokens)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures (5xx, timeouts, connection errors)
+    and fails requests fast for `reset_seconds`. Then one trial request is let through
+    (half-open): success closes the circuit, failure opens it again, and any other outcome
+    (a 429, a cancelled or otherwise failed call) lets the next request be the trial.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_in_flight):
+                remaining = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+                raise CircuitOpenError(f"OpenAI circuit open after {self.failures} consecutive failures; "
+                                       f"retrying in {remaining:.0f}s")
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Settles a half-open trial that said nothing about the service's health."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"[WARN] CircuitBreaker: Opening the OpenAI circuit after {self.failures} consecutive failures.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                return None
+    return None
+
+
+def _text_tokens(value: Any) -> int:
+    """~4 characters per token for text; token-id lists (as OpenAIEmbeddings sends) count exactly."""
+    if isinstance(value, str):
+        return (len(value) + 3) // 4
+    if isinstance(value, list):
+        if value and all(isinstance(item, int) for item in value):
+            return len(value)
+        return sum(_text_tokens(item) for item in value)
+    return 0
+
+
+def estimate_request(body: bytes) -> Dict[str, Any]:
+    """{"model", "tokens", "stream"} for a JSON request body: what it will count against the TPM limit."""
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    tokens = 0
+    for message in payload.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            tokens += _text_tokens(content)
+        for part in content if isinstance(content, list) else []:
+            if part.get("type") == "text":
+                tokens += _text_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS.get((part.get("image_url") or {}).get("detail", "auto"), IMAGE_TOKENS["auto"])
+    if "messages" in payload:
+        tokens += payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    tokens += _text_tokens(payload.get("input"))
+    return {"model": str(payload.get("model", "default")), "tokens": tokens, "stream": bool(payload.get("stream"))}
+
+
+def _endpoint(request: httpx.Request) -> str:
+    path = request.url.path
+    for name in ("chat/completions", "embeddings", "completions", "models"):
+        if path.endswith(name):
+            return name
+    return path.rsplit("/", 1)[-1] or "other"
+
+
+def _raw_content(response: httpx.Response) -> bytes:
+    """The still-encoded body, so each waiter's client decodes its own copy; in-process responses are already read."""
+    try:
+        return b"".join(response.iter_raw())
+    except (httpx.StreamConsumed, RuntimeError):
+        return response.content
+
+
+async def _araw_content(response: httpx.Response) -> bytes:
+    try:
+        return b"".join([chunk async for chunk in response.aiter_raw()])
+    except (httpx.StreamConsumed, RuntimeError):
+        return response.content
+
+
+class _InFlight:
+    """The shared outcome of one coalesced request: the raw response, or the error it raised."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.status_code = None
+        self.headers = None
+        self.content = b""
+        self.error: Optional[BaseException] = None
+
+    def response(self, request: httpx.Request) -> httpx.Response:
+        if self.error is not None:
+            raise self.error
+        return httpx.Response(self.status_code, headers=self.headers, content=self.content, request=request)
+
+
+class _RequestPolicy:
+    """What the sync and async transports share: limiting, retry decisions, breaker and accounting."""
+
+    def __init__(self, limiter: RateLimiter, breaker: CircuitBreaker, metrics: MetricsRegistry, max_retries: int,
+                 backoff_base: float, backoff_max: float, coalesce: bool):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self.counts = {"requests": 0, "retries": 0, "coalesced": 0, "failures": 0, "rate_limit_wait_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str, value: float = 1):
+        with self._lock:
+            self.counts[key] += value
+
+    def coalesce_key(self, request: httpx.Request, estimate: Dict[str, Any]) -> Optional[str]:
+        if not self.coalesce or estimate["stream"] or request.method != "POST":
+            return None
+        digest = hashlib.sha256(request.content)
+        digest.update(str(request.url).encode("utf-8"))
+        return digest.hexdigest()
+
+    def admit(self, endpoint: str, estimate: Dict[str, Any]) -> float:
+        """Checks the breaker and reserves rate-limit capacity; returns the seconds to wait first."""
+        self.breaker.before_request()
+        wait = self.limiter.reserve(estimate["model"], estimate["tokens"])
+        if wait > 0:
+            self.count("rate_limit_wait_seconds", wait)
+            self.metrics.observe("rag_openai_rate_limit_wait_seconds", wait,
+                                 "Time OpenAI calls waited for the client-side RPM/TPM limiter.", endpoint=endpoint)
+        return wait
+
+    def record(self, endpoint: str, status: str, started: float):
+        self.count("requests")
+        self.metrics.observe("rag_openai_request_duration_seconds", time.perf_counter() - started,
+                             "Latency of each OpenAI HTTP attempt (to response headers for streams).",
+                             endpoint=endpoint, status=status)
+        self.metrics.inc("rag_openai_requests_total", 1, "OpenAI HTTP attempts by endpoint and status.",
+                         endpoint=endpoint, status=status)
+
+    def after_response(self, endpoint: str, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Updates the breaker; returns the delay before a retry, or None to hand the response back."""
+        status = response.status_code
+        if status >= 500 or status == 408:
+            self.breaker.record_failure()
+        elif status == 429:
+            # A 429 says nothing about the service's health.
+            self.breaker.release_trial()
+        else:
+            self.breaker.record_success()
+        if status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+            if status >= 500:
+                self.count("failures")
+            return None
+        return self._retry(endpoint, str(status), attempt, retry_after_seconds(response))
+
+    def after_error(self, endpoint: str, error: Exception, attempt: int) -> Optional[float]:
+        if isinstance(error, CircuitOpenError):
+            return None
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            self.count("failures")
+            return None
+        return self._retry(endpoint, type(error).__name__, attempt, None)
+
+    def _retry(self, endpoint: str, reason: str, attempt: int, retry_after: Optional[float]) -> float:
+        self.count("retries")
+        self.metrics.inc("rag_openai_retries_total", 1, "OpenAI HTTP attempts retried, by reason.",
+                         endpoint=endpoint, reason=reason)
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+
+    def settle_tokens(self, estimate: Dict[str, Any], response: httpx.Response, content: bytes):
+        """Replaces the reserved token estimate with the usage the response reports."""
+        try:
+            usage = httpx.Response(response.status_code, headers=response.headers, content=content).json().get("usage") or {}
+        except Exception:
+            return
+        if usage.get("total_tokens"):
+            self.limiter.refund(estimate["model"], estimate["tokens"] - usage["total_tokens"])
+
+
+class ManagedTransport(httpx.BaseTransport):
+    """httpx transport for the shared sync client: every OpenAI call goes through _RequestPolicy."""
+
+    def __init__(self, inner: httpx.BaseTransport, policy: _RequestPolicy):
+        self.inner = inner
+        self.policy = policy
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        estimate = estimate_request(request.content)
+        key = self.policy.coalesce_key(request, estimate)
+        if key is None:
+            response = self._send(request, estimate)
+            if estimate["stream"]:
+                return response
+            content = _raw_content(response)
+            response.close()
+            self.policy.settle_tokens(estimate, response, content)
+            return httpx.Response(response.status_code, headers=response.headers, content=content, request=request)
+        with self._lock:
+            shared = self._in_flight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._in_flight[key] = _InFlight()
+        if not leader:
+            self.policy.count("coalesced")
+            self.policy.metrics.inc("rag_openai_coalesced_total", 1, "OpenAI requests answered by an identical one in flight.",
+                                    endpoint=_endpoint(request))
+            shared.event.wait()
+            return shared.response(request)
+        try:
+            response = self._send(request, estimate)
+            shared.content = _raw_content(response)
+            response.close()
+            shared.status_code, shared.headers = response.status_code, response.headers
+            self.policy.settle_tokens(estimate, response, shared.content)
+        except BaseException as e:
+            shared.error = e
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            shared.event.set()
+        return shared.response(request)
+
+    def _send(self, request: httpx.Request, estimate: Dict[str, Any]) -> httpx.Response:
+        endpoint = _endpoint(request)
+        attempt = 0
+        while True:
+            wait = self.policy.admit(endpoint, estimate)
+            try:
+                if wait:
+                    time.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    response = self.inner.handle_request(request)
+                except (httpx.TimeoutException, httpx.NetworkError) as e:
+                    self.policy.record(endpoint, "error", started)
+                    delay = self.policy.after_error(endpoint, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.policy.record(endpoint, str(response.status_code), started)
+                    delay = self.policy.after_response(endpoint, response, attempt)
+                    if delay is None:
+                        return response
+                    response.close()
+            except BaseException:
+                # Whatever ended this attempt, a half-open trial must not stay in flight forever.
+                self.policy.breaker.release_trial()
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncManagedTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of ManagedTransport, sharing its limiter, breaker and accounting.
+    Pooled connections belong to the event loop that opened them, so without an injected
+    transport each loop (e.g. successive asyncio.run calls) gets its own pool.
+    """
+
+    def __init__(self, inner: Optional[httpx.AsyncBaseTransport], policy: _RequestPolicy, limits: Optional[httpx.Limits] = None):
+        self.inner = inner
+        self.policy = policy
+        self.limits = limits or httpx.Limits()
+        self._pools: Dict[int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport]] = {}
+        self._lock = threading.Lock()
+        # Futures belong to one event loop, so requests only coalesce within their own loop.
+        self._in_flight: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        if self.inner is not None:
+            return self.inner
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._pools.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                # Pools of closed loops are dropped; their sockets went with the loop.
+                self._pools = {key: value for key, value in self._pools.items() if not value[0].is_closed()}
+                entry = self._pools[id(loop)] = (loop, httpx.AsyncHTTPTransport(limits=self.limits))
+            return entry[1]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        estimate = estimate_request(request.content)
+        key = self.policy.coalesce_key(request, estimate)
+        if key is None:
+            response = await self._send(request, estimate)
+            if estimate["stream"]:
+                return response
+            content = await _araw_content(response)
+            await response.aclose()
+            self.policy.settle_tokens(estimate, response, content)
+            return httpx.Response(response.status_code, headers=response.headers, content=content, request=request)
+        loop = asyncio.get_running_loop()
+        key = (id(loop), key)
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            self.policy.count("coalesced")
+            self.policy.metrics.inc("rag_openai_coalesced_total", 1, "OpenAI requests answered by an identical one in flight.",
+                                    endpoint=_endpoint(request))
+            status_code, headers, content = await asyncio.shield(shared)
+            return httpx.Response(status_code, headers=headers, content=content, request=request)
+        shared = self._in_flight[key] = loop.create_future()
+        try:
+            response = await self._send(request, estimate)
+            content = await _araw_content(response)
+            await response.aclose()
+            self.policy.settle_tokens(estimate, response, content)
+            shared.set_result((response.status_code, response.headers, content))
+        except BaseException as e:
+            shared.set_exception(e)
+            # Retrieve it here so an unawaited future does not log "exception was never retrieved".
+            shared.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        return httpx.Response(response.status_code, headers=response.headers, content=content, request=request)
+
+    async def _send(self, request: httpx.Request, estimate: Dict[str, Any]) -> httpx.Response:
+        endpoint = _endpoint(request)
+        attempt = 0
+        while True:
+            wait = self.policy.admit(endpoint, estimate)
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                try:
+                    response = await self._transport().handle_async_request(request)
+                except (httpx.TimeoutException, httpx.NetworkError) as e:
+                    self.policy.record(endpoint, "error", started)
+                    delay = self.policy.after_error(endpoint, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.policy.record(endpoint, str(response.status_code), started)
+                    delay = self.policy.after_response(endpoint, response, attempt)
+                    if delay is None:
+                        return response
+                    await response.aclose()
+            except BaseException:
+                self.policy.breaker.release_trial()
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport().aclose()
+
+
+class OpenAIClientLayer:
+    """
+    HTTP clients shared by every ChatOpenAI / OpenAIEmbeddings that a ResourceLoader builds:
+    one bounded connection pool (sync and async), a per-model RPM/TPM limiter, identical
+    in-flight requests coalesced, retries with jittered exponential backoff (honouring
+    Retry-After), a circuit breaker, and per-attempt latency metrics. The SDK's own
+    retries are turned off so attempts are not multiplied. Pass `transport` /
+    `async_transport` (e.g. httpx.MockTransport) to run against a fake server.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        timeout_seconds: float = 60.0,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_retries: int = 4,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 20.0,
+        circuit_failure_threshold: int = 5,
+        circuit_reset_seconds: float = 30.0,
+        coalesce: bool = True,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.base_url = base_url
+        self.timeout_seconds = timeout_seconds
+        self.limiter = RateLimiter(rpm, tpm)
+        self.breaker = CircuitBreaker(circuit_failure_threshold, circuit_reset_seconds)
+        self.metrics = metrics or METRICS
+        self.policy = _RequestPolicy(self.limiter, self.breaker, self.metrics, max_retries,
+                                     backoff_base_seconds, backoff_max_seconds, coalesce)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        timeout = httpx.Timeout(timeout_seconds, connect=min(10.0, timeout_seconds))
+        self.http_client = httpx.Client(
+            transport=ManagedTransport(transport or httpx.HTTPTransport(limits=limits), self.policy), timeout=timeout,
+        )
+        self.http_async_client = httpx.AsyncClient(
+            transport=AsyncManagedTransport(async_transport, self.policy, limits),
+            timeout=timeout,
+        )
+        self.metrics.register_gauge("rag_openai_circuit_open", lambda: float(self.breaker.state != CircuitBreaker.CLOSED),
+                                    "1 while the OpenAI circuit breaker is open or half-open.")
+
+    @classmethod
+    def from_config(cls, config, **overrides) -> "OpenAIClientLayer":
+        settings = dict(
+            max_connections=config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            timeout_seconds=config.OPENAI_TIMEOUT_SECONDS,
+            rpm=config.OPENAI_RPM_LIMIT,
+            tpm=config.OPENAI_TPM_LIMIT,
+            max_retries=config.OPENAI_MAX_RETRIES,
+            backoff_base_seconds=config.OPENAI_BACKOFF_BASE_SECONDS,
+            backoff_max_seconds=config.OPENAI_BACKOFF_MAX_SECONDS,
+            circuit_failure_threshold=config.OPENAI_CIRCUIT_FAILURE_THRESHOLD,
+            circuit_reset_seconds=config.OPENAI_CIRCUIT_RESET_SECONDS,
+            coalesce=config.OPENAI_COALESCE_REQUESTS,
+            base_url=config.OPENAI_BASE_URL,
+        )
+        settings.update(overrides)
+        return cls(**settings)
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for ChatOpenAI / OpenAIEmbeddings to route their calls through this layer."""
+        kwargs = {
+            "http_client": self.http_client,
+            "http_async_client": self.http_async_client,
+            "max_retries": 0,
+            "timeout": self.timeout_seconds,
+        }
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        return kwargs
+
+    def stats(self) -> Dict[str, Any]:
+        with self.policy._lock:
+            counts = dict(self.policy.counts)
+        return {**counts, "circuit": self.breaker.state}
+
+    def close(self):
+        self.http_client.close()
@@ -102,4 +102,25 @@ Context:
 
 Question: {user_question}
 
-"""
\ No newline at end of file
+"""
+condense_question_template = """Rewrite the follow-up question as a standalone question that can be understood without the conversation. Resolve pronouns and references ("it", "that", "the second one") to what they mean in the conversation. Keep the user's wording otherwise. Return only the rewritten question.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+
+conversation_question_template = """Conversation so far (use it only to resolve what the question refers to):
+{history}
+
+Follow-up question: {question}"""
+
+image_caption_template = """Describe this image from a machine-learning document so that the description can stand in for the image when answering questions about it. State what kind of image it is (plot, diagram, table, formula, photo), then its content: axes and their ranges, legend entries, labels, the main trends or structure, and any numbers or text that are visible. Be factual and concise (at most 120 words). Return only the description."""
+
+section_summary_template = """Summarize this section of a machine-learning document in 2-3 sentences so that the summary can be matched against questions about it. Name the concepts, methods and definitions it covers. Return only the summary.
+
+Section: {section}
+
+{text}"""
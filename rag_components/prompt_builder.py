@@ -1,12 +1,15 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
-from typing import Dict, List, Union
+from typing import Any, Dict, Optional
 from langchain.schema.document import Document
-from .prompt.prompts import generation_template
+from .image_record import ImageRecord
+from .prompt.prompts import conversation_question_template, generation_template
 
 class PromptBuilder:
     @staticmethod
-    def build_prompt(context_docs: Dict[str, List[Union[str, Document]]], user_question: str) -> ChatPromptTemplate:
+    def build_prompt(context_docs: Dict[str, Any], user_question: str, history: Optional[str] = None) -> ChatPromptTemplate:
+        if history:
+            user_question = conversation_question_template.format(history=history, question=user_question)
 
         context_text = ""
         if context_docs.get("texts"):
@@ -16,6 +19,16 @@ class PromptBuilder:
                 else: 
                     context_text += str(text_element) + "\n\n"
 
+        # Captioned images stand in as text unless the image policy asked for pixels.
+        send_captions = context_docs.get("image_mode") == "caption"
+        pixel_images = []
+        for image in context_docs.get("images") or []:
+            caption = image.caption_text() if send_captions and isinstance(image, ImageRecord) else None
+            if caption is not None:
+                context_text += caption + "\n\n"
+            else:
+                pixel_images.append(image)
+
         prompt_template_text = generation_template.format(
             context_placeholder=context_text.strip(), 
             user_question=user_question
@@ -23,14 +36,23 @@ class PromptBuilder:
 
         prompt_content = [{"type": "text", "text": prompt_template_text}]
 
-        if context_docs.get("images"):
-            for image_b64 in context_docs["images"]:
-                prompt_content.append(
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
-                    }
-                )
+        image_detail = context_docs.get("packing", {}).get("image_detail")
+
+        for image in pixel_images:
+            if isinstance(image, ImageRecord):
+                # Only the downscaled variant is encoded, and only here at the API boundary.
+                url = image.thumbnail_data_url()
+            else:
+                url = f"data:image/jpeg;base64,{image}"
+            image_url = {"url": url}
+            if image_detail:
+                image_url["detail"] = image_detail
+            prompt_content.append(
+                {
+                    "type": "image_url",
+                    "image_url": image_url,
+                }
+            )
         
         return ChatPromptTemplate.from_messages(
             [
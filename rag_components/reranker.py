@@ -0,0 +1,132 @@
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema.document import Document
+
+from .bm25_index import tokenize
+from .image_record import ImageRecord, looks_like_base64_image
+
+RERANKERS = ("cross_encoder", "lexical", "none")
+
+Candidate = Tuple[str, float, Any]  # (doc_id, retrieval score, parent document)
+
+
+class LexicalOverlapScorer:
+    """
+    Share of the question's terms that a candidate contains, each term weighted by how
+    rare it is among the candidates (0..1). Needs no model; the fallback reranker.
+    """
+
+    name = "lexical"
+
+    def score(self, question: str, texts: Sequence[str]) -> List[float]:
+        query_terms = set(tokenize(question))
+        if not query_terms or not texts:
+            return [0.0] * len(texts)
+        doc_terms = [set(tokenize(text)) for text in texts]
+        n = len(doc_terms)
+        weights = {
+            term: math.log(1 + (n + 1) / (1 + sum(term in terms for terms in doc_terms)))
+            for term in query_terms
+        }
+        total = sum(weights.values())
+        return [sum(weight for term, weight in weights.items() if term in terms) / total for terms in doc_terms]
+
+
+class CrossEncoderScorer:
+    """
+    sentence-transformers CrossEncoder run on CPU. Single-label models such as
+    cross-encoder/ms-marco-MiniLM-L-6-v2 return sigmoid scores in 0..1.
+    """
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str, max_length: int = 512, batch_size: int = 32):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, question: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        scores = self.model.predict([(question, text) for text in texts], batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
+
+
+def candidate_text(doc: Any) -> Optional[str]:
+    """The text a reranker scores for a parent, or None for images without a caption."""
+    if isinstance(doc, Document):
+        return doc.page_content
+    if isinstance(doc, ImageRecord):
+        return doc.metadata.get("caption")
+    if isinstance(doc, str):
+        return None if looks_like_base64_image(doc) else doc
+    return str(doc)
+
+
+class Reranker:
+    """
+    Re-scores the retrieved parents against the question and keeps an adaptive number of
+    them: the best `min_k` always, then any further ones (up to `max_k`) that score at
+    least `score_cutoff` and at least `relative_cutoff` times the best score. Candidates
+    with no text (uncaptioned images) are not scored; they keep their retrieval score and
+    stay if their retrieval rank is within `max_k`.
+    """
+
+    def __init__(self, scorer, min_k: int = 2, max_k: int = 6, score_cutoff: float = 0.2, relative_cutoff: float = 0.5):
+        self.scorer = scorer
+        self.min_k = min_k
+        self.max_k = max_k
+        self.score_cutoff = score_cutoff
+        self.relative_cutoff = relative_cutoff
+
+    @classmethod
+    def from_config(cls, config) -> Optional["Reranker"]:
+        if config.RERANKER == "none":
+            return None
+        scorer = None
+        if config.RERANKER == "cross_encoder":
+            try:
+                scorer = CrossEncoderScorer(config.RERANKER_MODEL)
+                print(f"[INFO] Reranker: Loaded cross-encoder {config.RERANKER_MODEL}.")
+            except Exception as e:
+                print(f"[WARN] Reranker: Cross-encoder {config.RERANKER_MODEL} unavailable ({e}); using lexical overlap. "
+                      "Install sentence-transformers to enable it.")
+        return cls(
+            scorer or LexicalOverlapScorer(),
+            min_k=config.RERANK_MIN_K,
+            max_k=config.RERANK_MAX_K,
+            score_cutoff=config.RERANK_SCORE_CUTOFF,
+            relative_cutoff=config.RERANK_RELATIVE_CUTOFF,
+        )
+
+    def rerank(self, question: str, candidates: Sequence[Candidate]) -> Tuple[List[Candidate], Dict[str, Any]]:
+        """Returns the kept candidates, best first with reranker scores, and a report for the context."""
+        scored, unscored = [], []
+        for rank, (doc_id, score, doc) in enumerate(candidates):
+            text = candidate_text(doc)
+            if text is None:
+                if rank < self.max_k:
+                    unscored.append((doc_id, score, doc))
+            else:
+                scored.append((doc_id, doc, text))
+
+        rerank_scores = self.scorer.score(question, [text for _, _, text in scored])
+        ranked = sorted(zip(rerank_scores, scored), key=lambda item: item[0], reverse=True)
+        best = ranked[0][0] if ranked else 0.0
+        kept = []
+        for i, (score, (doc_id, doc, _)) in enumerate(ranked):
+            if i >= self.max_k:
+                break
+            if i >= self.min_k and (score < self.score_cutoff or score < self.relative_cutoff * best):
+                break
+            kept.append((doc_id, score, doc))
+        report = {
+            "scorer": self.scorer.name,
+            "candidates": len(candidates),
+            "kept": len(kept) + len(unscored),
+            "top_score": best,
+            "cutoff_score": kept[-1][1] if kept else None,
+        }
+        return kept + unscored, report
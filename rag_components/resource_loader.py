@@ -1,60 +1,476 @@
+import hashlib
+import os
 import pickle
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.vectorstores import FAISS
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from langchain_community.vectorstores import FAISS
 from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain.storage import InMemoryStore # Or other stores like LocalFileStore
 
 from config import AppConfig 
+from .bm25_index import BM25Index
+from .collection_manager import CollectionManager
+from .doc_store import MmapDocStore
+from .index_factory import (
+    COMPRESSED_INDEX_TYPES, EXACT_VECTORS_FILE, RescoringIndex, index_type_of, load_exact_vectors, read_index_meta,
+    set_search_params,
+)
+from .embedding_cache import CachedEmbeddings, SQLiteEmbeddingCache
+from .fake_models import FakeStreamingChatModel, HashingFakeEmbeddings
+from .index_manifest import MANIFEST_FILE, embedding_model_name, manifest_path, read_manifest
+from .metrics import METRICS
+
+
+class IndexGeneration:
+    """
+    One loaded version of the single index: its retriever (vectorstore + docstore), BM25
+    index and version. Retrievals hold it while they run; once a reload has replaced it,
+    it is closed after the last of them finishes.
+    """
+
+    def __init__(self, version: str, retriever: MultiVectorRetriever, lexical_index: Optional[BM25Index], config,
+                 manifest: Optional[Dict[str, Any]] = None, snapshot: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.retriever = retriever
+        self.lexical_index = lexical_index
+        self.config = config
+        self.manifest = manifest
+        self.snapshot = snapshot  # ResourceLoader.shared_snapshot when attached to a published snapshot
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._retired = False
+        self.closed = False
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            drained = self._in_flight == 0
+            if drained:
+                self._condition.notify_all()
+            close = drained and self._retired
+        if close:
+            self.close()
+
+    def retire(self):
+        """Marks the generation replaced; it closes now if idle, else when its last retrieval releases it."""
+        with self._condition:
+            self._retired = True
+            idle = self._in_flight == 0
+        if idle:
+            self.close()
+
+    def wait_drained(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def close(self):
+        with self._condition:
+            if self.closed:
+                return
+            self.closed = True
+        # FAISS and BM25 are plain memory, freed with the last reference; open files are closed here.
+        for store in (self.retriever.docstore, getattr(self.retriever.vectorstore.docstore, "store", None)):
+            if isinstance(store, MmapDocStore):
+                store.close()
+        print(f"[INFO] IndexGeneration: Closed index version {self.version}.")
+
 
 class ResourceLoader:
-    def __init__(self, config: AppConfig):
+    def __init__(self, config: AppConfig, openai_client=None):
         self.config = config
+        self.source_config = config  # self.config is repointed at the attached snapshot in shared mode
+        self.openai_client = openai_client  # OpenAIClientLayer, built on first use unless injected
         self.embedding_model = None
         self.vectorstore = None
         self.docstore = None
         self.retriever = None
         self.llm = None
+        self.lexical_index = None
+        self.collection = None
+        self.index_version = None
+        self.shared_snapshot = None  # {"version", "path", "manifest"} when attached to a published snapshot
+        self.generation: Optional[IndexGeneration] = None  # swapped as a whole by hot reloads
+        self._generation_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+        self._settling_version: Optional[str] = None
+        self._failed_version: Optional[str] = None
+        self.load_timings: Dict[str, float] = {}  # seconds per load_all step, for the startup report
+
+    @contextmanager
+    def _timed(self, step: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.load_timings[step] = time.perf_counter() - started
 
     def load_all(self):
         """Loads all necessary resources."""
         print("[INFO] ResourceLoader: Validating configuration...")
-        self.config.validate_config() # Validate paths and API key presence
+        with self._timed("validate"):
+            self.config.validate_config() # Validate paths and API key presence
 
         print("[INFO] ResourceLoader: Loading embedding model...")
-        self.embedding_model = OpenAIEmbeddings(openai_api_key=self.config.OPENAI_API_KEY)
+        with self._timed("embeddings"):
+            self.embedding_model = self.build_embedding_model()
         
+        if self.config.COLLECTION_PATH:
+            print(f"[INFO] ResourceLoader: Opening document collection at {self.config.COLLECTION_PATH}...")
+            with self._timed("collection"):
+                self.collection = CollectionManager(
+                    self.config.COLLECTION_PATH,
+                    self.embedding_model,
+                    max_loaded_shards=self.config.COLLECTION_MAX_LOADED_SHARDS,
+                    max_memory_mb=self.config.COLLECTION_MAX_MEMORY_MB,
+                    max_workers=self.config.COLLECTION_SEARCH_WORKERS,
+                    nprobe=self.config.FAISS_NPROBE,
+                    ef_search=self.config.FAISS_EF_SEARCH,
+                    use_lexical=self.config.RETRIEVAL_MODE == "hybrid",
+                    rescore_factor=self.config.FAISS_RESCORE_FACTOR if self.config.FAISS_RESCORE_EXACT else None,
+                )
+            print(f"[INFO] ResourceLoader: Collection has {len(self.collection.documents())} document(s); shards load on first use.")
+            self.index_version = self.compute_index_version()
+        else:
+            self.load_index()
+        if self.config.INDEX_RELOAD_ENABLED:
+            self.start_index_watcher()
+
+        with self._timed("llm"):
+            self.llm = self.build_llm()
+        print("[INFO] ResourceLoader: All resources loaded successfully.")
+
+    def load_index(self):
+        if self.source_config.SHARED_INDEX_PATH:
+            self.attach_shared_index()
+        else:
+            self.load_single_index()
+
+    def build_llm(self):
+        if self.config.LLM_PROVIDER == "fake":
+            print("[INFO] ResourceLoader: Initializing offline FakeStreamingChatModel...")
+            return FakeStreamingChatModel()
+        # Imported here: the OpenAI SDK is the slowest import of the app and fake providers never need it.
+        from langchain_openai import ChatOpenAI
+
+        print(f"[INFO] ResourceLoader: Initializing LLM ({self.config.LLM_MODEL_NAME})...")
+        return ChatOpenAI(
+            model=self.config.LLM_MODEL_NAME, 
+            temperature=0, 
+            openai_api_key=self.config.OPENAI_API_KEY,
+            stream_usage=True,  # token counts for metrics when streaming
+            **self.get_openai_client().client_kwargs(),
+        )
+
+    def get_openai_client(self):
+        """The OpenAIClientLayer (connection pool, limiter, retries, breaker) every OpenAI model of this loader uses."""
+        if self.openai_client is None:
+            from .openai_client import OpenAIClientLayer
+
+            self.openai_client = OpenAIClientLayer.from_config(self.config)
+        return self.openai_client
+
+    def attach_shared_index(self):
+        """
+        Attaches read-only to the snapshot CURRENT points to: index codes, ids and documents are
+        memory-mapped, so worker processes share one copy through the page cache.
+        """
+        from .shared_index import memory_usage, resolve_snapshot, snapshot_config
+
+        version, path = resolve_snapshot(self.source_config.SHARED_INDEX_PATH)
+        print(f"[INFO] ResourceLoader: Attaching to shared index snapshot {version}...")
+        self.shared_snapshot = {"version": version, "path": path, "manifest": read_manifest(os.path.join(path, MANIFEST_FILE))}
+        self.config = snapshot_config(self.source_config, path)
+        self.load_single_index()
+        usage = memory_usage()
+        if usage["rss_anon_mb"] is not None:
+            print(f"[INFO] ResourceLoader: Process memory after attach: {usage['rss_anon_mb']:.1f} MiB private, "
+                  f"{usage['rss_file_mb']:.1f} MiB shared file-backed.")
+
+    def load_single_index(self):
+        """Loads the one-document FAISS index, docstore, BM25 index and MultiVectorRetriever."""
         print(f"[INFO] ResourceLoader: Loading vector store from {self.config.DB_FAISS_PATH}...")
-        self.vectorstore = FAISS.load_local(
-            self.config.DB_FAISS_PATH, 
-            self.embedding_model, 
-            allow_dangerous_deserialization=True
+        with self._timed("vectorstore"):
+            if self.shared_snapshot:
+                from .shared_index import attach_vectorstore
+
+                self.vectorstore = attach_vectorstore(self.shared_snapshot["path"], self.embedding_model)
+            else:
+                self.vectorstore = FAISS.load_local(
+                    self.config.DB_FAISS_PATH, 
+                    self.embedding_model, 
+                    allow_dangerous_deserialization=True
+                )
+        applied = set_search_params(
+            self.vectorstore.index, nprobe=self.config.FAISS_NPROBE, ef_search=self.config.FAISS_EF_SEARCH
         )
+        print(f"[INFO] ResourceLoader: FAISS index is {index_type_of(self.vectorstore.index)} with "
+              f"{self.vectorstore.index.ntotal} vectors {applied or ''}".rstrip() + ".")
+        self.enable_rescoring()
         
-        print(f"[INFO] ResourceLoader: Loading document store from {self.config.DOCSTORE_PATH}...")
-        with open(self.config.DOCSTORE_PATH, "rb") as f:
-            self.docstore = pickle.load(f)
-            if not isinstance(self.docstore, InMemoryStore):
-                 print(f"[WARN] Loaded docstore is of type {type(self.docstore)}, not InMemoryStore. Ensure compatibility.")
+        with self._timed("docstore"):
+            self.load_docstore()
+
+        if self.config.RETRIEVAL_MODE == "hybrid":
+            with self._timed("bm25"):
+                self.lexical_index = self.load_lexical_index()
 
+        self.index_version = self.compute_index_version()
 
         print("[INFO] ResourceLoader: Initializing MultiVectorRetriever...")
-        self.retriever = MultiVectorRetriever(
-            vectorstore=self.vectorstore,
-            docstore=self.docstore,
-            id_key="doc_id", 
-        )
+        with self._timed("retriever"):
+            self.retriever = MultiVectorRetriever(
+                vectorstore=self.vectorstore,
+                docstore=self.docstore,
+                id_key="doc_id", 
+            )
         self.retriever.search_kwargs = self.config.RETRIEVER_SEARCH_KWARGS
-        
-        print(f"[INFO] ResourceLoader: Initializing LLM ({self.config.LLM_MODEL_NAME})...")
-        self.llm = ChatOpenAI(
-            model=self.config.LLM_MODEL_NAME, 
-            temperature=0, 
-            openai_api_key=self.config.OPENAI_API_KEY
+        manifest = self.shared_snapshot["manifest"] if self.shared_snapshot else read_manifest(manifest_path(self.config))
+        self.generation = IndexGeneration(
+            self.index_version, self.retriever, self.lexical_index, self.config, manifest, self.shared_snapshot
         )
-        print("[INFO] ResourceLoader: All resources loaded successfully.")
+
+    @contextmanager
+    def use_index(self) -> Iterator[Optional[IndexGeneration]]:
+        """
+        The current index generation, held for the duration of the block so a concurrent
+        reload cannot close it mid-query. None in collection mode.
+        """
+        with self._generation_lock:
+            generation = self.generation
+            if generation is not None:
+                generation.acquire()
+        try:
+            yield generation
+        finally:
+            if generation is not None:
+                generation.release()
+
+    def latest_index_version(self) -> Optional[str]:
+        """
+        The version a fresh load would get now: CURRENT for snapshots, a fingerprint of the
+        catalog and shard manifests for a collection, else the manifest (or file fingerprint).
+        """
+        if self.source_config.COLLECTION_PATH:
+            return self._file_fingerprint(self.source_config)
+        if self.source_config.SHARED_INDEX_PATH:
+            from .shared_index import current_version
+
+            return current_version(self.source_config.SHARED_INDEX_PATH)
+        manifest = read_manifest(manifest_path(self.source_config))
+        return manifest["version"] if manifest else self._file_fingerprint(self.source_config)
+
+    def load_generation(self) -> IndexGeneration:
+        """Loads the latest index version next to the current one, sharing this loader's embedding model."""
+        loader = ResourceLoader(self.source_config, self.openai_client)
+        loader.embedding_model = self.embedding_model
+        loader.load_index()
+        return loader.generation
+
+    def swap_generation(self, generation: IndexGeneration):
+        """Makes `generation` current for new retrievals; the old one is closed once its in-flight retrievals drain."""
+        with self._generation_lock:
+            old = self.generation
+            self.generation = generation
+            self.config = generation.config
+            self.retriever = generation.retriever
+            self.vectorstore = generation.retriever.vectorstore
+            self.docstore = generation.retriever.docstore
+            self.lexical_index = generation.lexical_index
+            self.index_version = generation.version
+            self.shared_snapshot = generation.snapshot
+        if old is not None:
+            print(f"[INFO] ResourceLoader: Now serving index version {generation.version}; "
+                  f"{old.version} closes after {old.in_flight} in-flight retrieval(s).")
+            old.retire()
+
+    def reload_if_changed(self) -> bool:
+        """
+        One watcher poll: if a new index version is on disk, loads it and swaps it in.
+        Stores without a manifest are only loaded once their fingerprint has held for two
+        polls, so a reload does not read files that ingestion is still writing.
+        """
+        if self.collection is not None:
+            return self._reload_collection_if_changed()
+        version = self.latest_index_version()
+        if version is None or version in (self.index_version, self._failed_version):
+            self._settling_version = None
+            return False
+        has_manifest = self.source_config.SHARED_INDEX_PATH or os.path.isfile(manifest_path(self.source_config))
+        if not has_manifest and version != self._settling_version:
+            self._settling_version = version
+            return False
+        print(f"[INFO] ResourceLoader: Index version {version} found; loading it in the background...")
+        started = time.perf_counter()
+        try:
+            generation = self.load_generation()
+            model = (generation.manifest or {}).get("embedding_model")
+            if model and model != embedding_model_name(self.source_config):
+                raise ValueError(f"it was built with embedding model {model}, but queries are embedded "
+                                 f"with {embedding_model_name(self.source_config)}")
+        except Exception as e:
+            self._failed_version = version
+            METRICS.inc("rag_index_reloads_total", 1, "Hot index reloads, by outcome.", outcome="failed")
+            print(f"[WARN] ResourceLoader: Not switching to index version {version}: {e}. "
+                  f"Still serving {self.index_version}.")
+            return False
+        self._settling_version = None
+        self.swap_generation(generation)
+        METRICS.inc("rag_index_reloads_total", 1, "Hot index reloads, by outcome.", outcome="swapped")
+        METRICS.observe("rag_index_reload_seconds", time.perf_counter() - started, "Time to load a new index version.")
+        return True
+
+    def _reload_collection_if_changed(self) -> bool:
+        """
+        Collection mode: when catalog.json or a shard manifest changed, re-reads the catalog.
+        Added documents become searchable, and rebuilt or removed shards are dropped (they
+        load again on next use). The new version invalidates the answer cache.
+        """
+        version = self.latest_index_version()
+        if version == self.index_version:
+            return False
+        dropped = self.collection.reload_catalog()
+        self.index_version = version
+        METRICS.inc("rag_index_reloads_total", 1, "Hot index reloads, by outcome.", outcome="swapped")
+        print(f"[INFO] ResourceLoader: Collection changed; now {len(self.collection.documents())} document(s), "
+              f"{len(dropped)} loaded shard(s) dropped.")
+        return True
+
+    def start_index_watcher(self, poll_seconds: Optional[float] = None):
+        """Polls for new index versions on a daemon thread and hot-swaps them in."""
+        if self._watcher is not None:
+            return
+        poll_seconds = poll_seconds or self.config.INDEX_RELOAD_POLL_SECONDS
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch_index, args=(poll_seconds,), name="index-watcher", daemon=True)
+        self._watcher.start()
+        print(f"[INFO] ResourceLoader: Watching for new index versions every {poll_seconds}s.")
+
+    def stop_index_watcher(self):
+        if self._watcher is not None:
+            self._stop_watching.set()
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch_index(self, poll_seconds: float):
+        while not self._stop_watching.wait(poll_seconds):
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                print(f"[WARN] ResourceLoader: Index watcher poll failed: {e}")
+
+    def enable_rescoring(self):
+        """For a compressed index, re-ranks candidates by exact distance against the memory-mapped float32 side file."""
+        index = self.vectorstore.index
+        index_type = index_type_of(index)
+        if index_type not in COMPRESSED_INDEX_TYPES:
+            return
+        compression = (read_index_meta(self.config.DB_FAISS_PATH) or {}).get("compression")
+        if compression:
+            print(f"[INFO] ResourceLoader: {index_type} index holds {compression['index_bytes'] / 2**20:.1f} MiB "
+                  f"({compression['memory_saved']:.0%} less than float32).")
+        if not self.config.FAISS_RESCORE_EXACT:
+            return
+        exact_vectors = load_exact_vectors(self.config.DB_FAISS_PATH, index.ntotal)
+        if exact_vectors is None:
+            print(f"[WARN] ResourceLoader: No {EXACT_VECTORS_FILE} next to the {index_type} index; results are not re-scored. "
+                  "Re-run vector_loader.py with FAISS_RESCORE_EXACT enabled to write it.")
+            return
+        self.vectorstore.index = RescoringIndex(index, exact_vectors, self.config.FAISS_RESCORE_FACTOR)
+        print(f"[INFO] ResourceLoader: Re-scoring the top {self.config.FAISS_RESCORE_FACTOR}x candidates "
+              f"against memory-mapped float32 vectors.")
+
+    def load_docstore(self):
+        if MmapDocStore.exists(self.config.MMAP_DOCSTORE_PATH):
+            print(f"[INFO] ResourceLoader: Opening memory-mapped document store at {self.config.MMAP_DOCSTORE_PATH}...")
+            self.docstore = MmapDocStore(self.config.MMAP_DOCSTORE_PATH)
+        else:
+            print(f"[INFO] ResourceLoader: Loading document store from {self.config.DOCSTORE_PATH}...")
+            print("[WARN] ResourceLoader: Pickled docstore is fully deserialized into memory. Convert it with "
+                  "`python -m rag_components.doc_store` for lazy, memory-mapped reads.")
+            with open(self.config.DOCSTORE_PATH, "rb") as f:
+                self.docstore = pickle.load(f)
+                if not isinstance(self.docstore, InMemoryStore):
+                     print(f"[WARN] Loaded docstore is of type {type(self.docstore)}, not InMemoryStore. Ensure compatibility.")
+
+    def compute_index_version(self) -> str:
+        """
+        Version of the loaded index: the snapshot or manifest version, else a fingerprint of
+        the on-disk index and docstore that changes whenever either is rebuilt.
+        """
+        if self.shared_snapshot:
+            return self.shared_snapshot["version"]  # snapshots are immutable
+        manifest = None if self.config.COLLECTION_PATH else read_manifest(manifest_path(self.config))
+        return manifest["version"] if manifest else self._file_fingerprint(self.config)
+
+    @staticmethod
+    def _file_fingerprint(config) -> str:
+        fingerprint = hashlib.sha256()
+        paths = [
+            config.DOCSTORE_PATH,
+            config.BM25_INDEX_PATH,
+            os.path.join(config.MMAP_DOCSTORE_PATH, MmapDocStore.INDEX_FILE),
+        ]
+        if config.COLLECTION_PATH:
+            # Registering a shard rewrites the catalog; rebuilding one rewrites its manifest.
+            shards_dir = os.path.join(config.COLLECTION_PATH, CollectionManager.SHARDS_DIR)
+            keys = sorted(os.listdir(shards_dir)) if os.path.isdir(shards_dir) else []
+            paths = [os.path.join(config.COLLECTION_PATH, CollectionManager.CATALOG_FILE)]
+            paths += [os.path.join(shards_dir, key, MANIFEST_FILE) for key in keys]
+        elif os.path.isdir(config.DB_FAISS_PATH):
+            paths += [os.path.join(config.DB_FAISS_PATH, name) for name in sorted(os.listdir(config.DB_FAISS_PATH))]
+        for path in paths:
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                fingerprint.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return fingerprint.hexdigest()[:16]
+
+    def load_lexical_index(self) -> BM25Index:
+        """BM25 index written at ingestion; built in memory from the FAISS child texts if the file is missing."""
+        if os.path.exists(self.config.BM25_INDEX_PATH):
+            print(f"[INFO] ResourceLoader: Loading BM25 index from {self.config.BM25_INDEX_PATH}...")
+            return BM25Index.load(self.config.BM25_INDEX_PATH)
+        print(f"[WARN] ResourceLoader: No BM25 index at {self.config.BM25_INDEX_PATH}; building it from the FAISS "
+              "child documents. Re-run vector_loader.py to persist it.")
+        return BM25Index.from_vectorstore(self.vectorstore, id_key="doc_id")
+
+    def build_embedding_model(self):
+        """Embedding model used for both queries and ingestion, wrapped in the disk cache when configured."""
+        model_name = self.config.EMBEDDING_MODEL_NAME
+        if self.config.EMBEDDING_PROVIDER == "fake":
+            model_name = "hashing-fake"
+            embedding_model = HashingFakeEmbeddings(size=self.config.FAKE_EMBEDDING_SIZE)
+        else:
+            from langchain_openai import OpenAIEmbeddings
+
+            embedding_model = OpenAIEmbeddings(
+                model=self.config.EMBEDDING_MODEL_NAME,
+                openai_api_key=self.config.OPENAI_API_KEY,
+                **self.get_openai_client().client_kwargs(),
+            )
+        if not self.config.EMBEDDING_CACHE_PATH:
+            return embedding_model
+        print(f"[INFO] ResourceLoader: Using embedding cache at {self.config.EMBEDDING_CACHE_PATH}...")
+        cache = SQLiteEmbeddingCache(
+            self.config.EMBEDDING_CACHE_PATH,
+            max_entries=self.config.EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+        return CachedEmbeddings(embedding_model, cache, model_name)
 
     def get_retriever(self):
-        if not self.retriever:
+        """The single-index retriever; None in collection mode, where RAGChainManager searches the shards."""
+        if not self.retriever and not self.collection:
             self.load_all()
         return self.retriever
 
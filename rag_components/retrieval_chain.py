@@ -1,39 +1,546 @@
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import faiss
+import numpy as np
+from langchain_core.runnables import Runnable, RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables.config import run_in_executor
+from .answer_cache import AnswerCache
+from .bm25_index import reciprocal_rank_fusion
+from .context_packer import ContextPacker, TokenCounter
 from .document_parser import DocumentParser
+from .embedding_cache import CachedEmbeddings
+from .image_captions import ImagePolicy
+from .metrics import METRICS, MetricsCallbackHandler, MetricsRegistry, SlowRequestProfiler
 from .prompt_builder import PromptBuilder
-from .resource_loader import ResourceLoader 
+from .reranker import Reranker
+from .resource_loader import ResourceLoader
 
 
 class RAGChainManager:
-    def __init__(self, resource_loader: ResourceLoader):
+    def __init__(self, resource_loader: ResourceLoader, metrics: Optional[MetricsRegistry] = None):
         self.resource_loader = resource_loader
-        self.retriever = resource_loader.get_retriever()
+        resource_loader.get_retriever()  # loads resources on first use
         self.llm = resource_loader.get_llm()
+        self.collection = resource_loader.collection
+        self.metrics = metrics or METRICS
+        self.answer_cache = self._build_answer_cache()
+        self.context_packer = self._build_context_packer()
+        self.reranker = Reranker.from_config(resource_loader.config)
+        self.image_policy = ImagePolicy(resource_loader.config.IMAGE_POLICY)
+        self.profiler = self._build_profiler()
         self._chain = self._build_chain()
+        self._generation_chain = self._build_generation().with_config(callbacks=[MetricsCallbackHandler(self.metrics)])
+        self._register_cache_gauges()
 
-    def _build_chain(self):
-        def prepare_context_and_question(input_dict):
-            parsed_docs = DocumentParser.parse_docs(input_dict["retrieved_docs"])
-            return {"context": parsed_docs, "question": input_dict["question"]}
+    @property
+    def retriever(self):
+        """The current single-index retriever; a hot reload may replace it between questions."""
+        return self.resource_loader.retriever
+
+    def _build_answer_cache(self):
+        config = self.resource_loader.config
+        if not config.ANSWER_CACHE_ENABLED:
+            return None
+        return AnswerCache(
+            max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=config.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            embedding_model=self.resource_loader.embedding_model,
+        )
+
+    def _build_context_packer(self):
+        config = self.resource_loader.config
+        return ContextPacker(
+            token_budget=config.CONTEXT_TOKEN_BUDGET,
+            max_images=config.CONTEXT_MAX_IMAGES,
+            near_duplicate_threshold=config.CONTEXT_NEAR_DUPLICATE_THRESHOLD,
+            image_detail=config.CONTEXT_IMAGE_DETAIL,
+            model_name=config.LLM_MODEL_NAME,
+            token_counter=TokenCounter(config.LLM_MODEL_NAME, estimate_only=config.LLM_PROVIDER == "fake"),
+        )
+
+    def _build_profiler(self):
+        config = self.resource_loader.config
+        return SlowRequestProfiler(
+            sample_rate=config.METRICS_PROFILE_SAMPLE_RATE,
+            threshold_seconds=config.METRICS_PROFILE_THRESHOLD_SECONDS,
+            output_dir=config.METRICS_PROFILE_DIR,
+            registry=self.metrics,
+        )
+
+    def _register_cache_gauges(self):
+        if self.answer_cache is not None:
+            self.metrics.register_gauge(
+                "rag_answer_cache_hit_rate", lambda: self.answer_cache.stats()["hit_rate"],
+                "Share of questions answered from the answer cache.",
+            )
+        embedding_model = self.resource_loader.embedding_model
+        if isinstance(embedding_model, CachedEmbeddings):
+            self.metrics.register_gauge(
+                "rag_embedding_cache_hit_rate", lambda: embedding_model.cache.stats()["hit_rate"],
+                "Share of embedding lookups served from the disk cache.",
+            )
+
+    def _cached_result(self, question: str, documents: Optional[Sequence[str]] = None, history: Optional[str] = None):
+        # Answers restricted to a subset of documents or shaped by a conversation's history are
+        # not cached: the cache is keyed by question alone.
+        if self.answer_cache is None or documents or history:
+            return None
+        cached = self.answer_cache.get(question, self.resource_loader.index_version)
+        return dict(cached) if cached is not None else None
+
+    def _remember_result(self, question: str, result: Dict[str, Any], documents: Optional[Sequence[str]] = None,
+                         history: Optional[str] = None):
+        if self.answer_cache is None or documents or history:
+            return
+        index_version = self.resource_loader.index_version
+        if (result.get("context") or {}).get("index_version", index_version) != index_version:
+            return  # retrieved from an index version that a reload has since replaced
+        self.answer_cache.put(question, result, index_version)
+
+    def _build_generation(self) -> Runnable:
+        """Prompt building, LLM call and output parsing for one prepared {"context", "question", "history"?}."""
         def build_prompt_from_prepared(input_dict):
-            return PromptBuilder.build_prompt(input_dict["context"], input_dict["question"])
+            with self.metrics.stage("build_prompt"):
+                return PromptBuilder.build_prompt(input_dict["context"], input_dict["question"], input_dict.get("history"))
+
+        return RunnableLambda(build_prompt_from_prepared) | self.llm | StrOutputParser()
 
+    def _build_chain(self):
+        # Retrieval runs exactly once per question; its parsed output is kept in the
+        # result next to the answer so callers never need a second retriever pass.
         chain = (
-            {
-                "retrieved_docs": self.retriever, 
-                "question": RunnablePassthrough() 
-            }
-            | RunnableLambda(prepare_context_and_question) # Output: {"context": {"images": [], "texts": []}, "question": ...}
-            | RunnableLambda(build_prompt_from_prepared) 
-            | self.llm
-            | StrOutputParser()
+            # Input: question, or {"question", "documents"?, "history"?} to search a subset of a collection
+            # or answer with conversation history in the prompt
+            RunnableLambda(self._prepare, afunc=self._aprepare) # Output: {"context": {"images": [], "texts": [], ...}, "question": ..., "history"?}
+            | RunnablePassthrough.assign(answer=self._build_generation())
+        )
+        # LLM latency, time to first token, token usage and output parsing are timed from callbacks.
+        return chain.with_config(callbacks=[MetricsCallbackHandler(self.metrics)])
+
+    @staticmethod
+    def _collect_doc_ids(sub_docs_and_scores, id_key: str) -> Tuple[List[str], List[float]]:
+        """Collapses child hits to parent doc_ids, keeping retrieval order and the best score per parent."""
+        doc_ids: List[str] = []
+        scores: List[float] = []
+        for sub_doc, score in sub_docs_and_scores:
+            doc_id = sub_doc.metadata.get(id_key)
+            if doc_id is None:
+                continue
+            if doc_id in doc_ids:
+                idx = doc_ids.index(doc_id)
+                scores[idx] = max(scores[idx], float(score))
+                continue
+            doc_ids.append(doc_id)
+            scores.append(float(score))
+        return doc_ids, scores
+
+    def _parse_retrieved(self, question: str, doc_ids: List[str], scores: List[float], docs: List[Any], started: float,
+                         index_version: Optional[str] = None) -> Dict[str, Any]:
+        found = [(doc_id, score, doc) for doc_id, score, doc in zip(doc_ids, scores, docs) if doc is not None]
+        rerank_report = None
+        if self.reranker is not None:
+            with self.metrics.stage("rerank"):
+                found, rerank_report = self.reranker.rerank(question, found)
+            self.metrics.inc("rag_rerank_candidates_total", rerank_report["candidates"], "Parents scored by the reranker.")
+            self.metrics.inc("rag_rerank_kept_total", rerank_report["kept"], "Parents kept after reranking.")
+        with self.metrics.stage("parse_docs"):
+            parsed_docs = DocumentParser.parse_docs(
+                [doc for _, _, doc in found],
+                doc_ids=[doc_id for doc_id, _, _ in found],
+                scores=[score for _, score, _ in found],
+            )
+        image_mode = self.image_policy.decide(question)
+        if parsed_docs["images"]:
+            self.metrics.inc("rag_image_mode_total", 1, "Questions with retrieved images, by how the images were sent.",
+                             mode=image_mode)
+        with self.metrics.stage("context_pack"):
+            context = self.context_packer.pack(parsed_docs, image_mode)
+        if rerank_report is not None:
+            context["rerank"] = rerank_report
+        if index_version is not None:
+            context["index_version"] = index_version
+        retrieval_seconds = time.perf_counter() - started
+        self.metrics.observe("rag_stage_duration_seconds", retrieval_seconds, stage="retrieval")
+        return {"context": context, "question": question, "retrieval_seconds": retrieval_seconds}
+
+    @staticmethod
+    def _relevance_scores(vectorstore, docs_and_distances, score_threshold: Optional[float]):
+        # Same conversion as similarity_search_with_relevance_scores, split out so that
+        # query embedding and the FAISS search can be timed separately.
+        relevance_score_fn = vectorstore._select_relevance_score_fn()
+        docs_and_scores = [(doc, relevance_score_fn(distance)) for doc, distance in docs_and_distances]
+        if score_threshold is not None:
+            docs_and_scores = [(doc, score) for doc, score in docs_and_scores if score >= score_threshold]
+        return docs_and_scores
+
+    def _search_kwargs(self, retriever) -> Tuple[Dict[str, Any], Optional[float]]:
+        """
+        The retriever's search kwargs (k raised to RERANK_CANDIDATES when reranking) and the
+        score threshold popped from them. Pass the retriever of the generation pinned by
+        use_index(), so a hot reload cannot pair one version's kwargs with another's index.
+        """
+        search_kwargs = dict(retriever.search_kwargs)
+        score_threshold = search_kwargs.pop("score_threshold", None)
+        if self.reranker is not None:
+            search_kwargs["k"] = max(search_kwargs.get("k", 4), self.resource_loader.config.RERANK_CANDIDATES)
+        return search_kwargs, score_threshold
+
+    def _candidate_limits(self) -> Tuple[int, Optional[int]]:
+        """(dense k, parents kept after hybrid fusion) for collection search and _fuse_lexical."""
+        config = self.resource_loader.config
+        k = config.RETRIEVER_SEARCH_KWARGS.get("k", 10)
+        top_k = config.HYBRID_TOP_K if config.RETRIEVAL_MODE == "hybrid" else None
+        if self.reranker is not None:
+            k = max(k, config.RERANK_CANDIDATES)
+            top_k = max(top_k, config.RERANK_CANDIDATES) if top_k is not None else None
+        return k, top_k
+
+    def _fuse_lexical(self, question: str, doc_ids: List[str], scores: List[float], lexical_index) -> Tuple[List[str], List[float]]:
+        """In hybrid mode, merges the dense ranking with BM25 by reciprocal-rank fusion; scores become RRF scores."""
+        if lexical_index is None:
+            return doc_ids, scores
+        config = self.resource_loader.config
+        with self.metrics.stage("lexical_search"):
+            lexical_hits = lexical_index.search(question, k=config.HYBRID_LEXICAL_K)
+        return reciprocal_rank_fusion(
+            [doc_ids, [doc_id for doc_id, _ in lexical_hits]],
+            k=config.HYBRID_RRF_K,
+            limit=self._candidate_limits()[1],
         )
-        return chain
 
-    def invoke(self, question: str):
-        return self._chain.invoke(question)
+    @staticmethod
+    def _chain_input(question: str, documents: Optional[Sequence[str]], history: Optional[str] = None) -> Union[str, Dict[str, Any]]:
+        if not documents and not history:
+            return question
+        return {"question": question, "documents": list(documents or []), "history": history}
+
+    def _check_documents(self, documents: Optional[Sequence[str]]):
+        if documents and self.collection is None:
+            raise ValueError("Restricting a question to documents needs a collection (set COLLECTION_PATH).")
+
+    def _unpack_input(self, inputs: Union[str, Dict[str, Any]]) -> Tuple[str, Optional[List[str]]]:
+        if isinstance(inputs, str):
+            return inputs, None
+        documents = inputs.get("documents") or None
+        self._check_documents(documents)
+        return inputs["question"], documents
+
+    def _retrieve_from_collection(self, question: str, documents: Optional[List[str]], started: float) -> Dict[str, Any]:
+        config = self.resource_loader.config
+        index_version = self.resource_loader.index_version
+        k, top_k = self._candidate_limits()
+        with self.collection.use_shards() as held:
+            hits = self.collection.search(
+                question,
+                documents,
+                k=k,
+                lexical_k=config.HYBRID_LEXICAL_K,
+                rrf_k=config.HYBRID_RRF_K,
+                top_k=top_k,
+                held=held,
+            )
+            with self.metrics.stage("docstore_mget"):
+                docs = self.collection.mget(hits)
+        return self._parse_retrieved(question, [doc_id for _, doc_id, _ in hits], [score for _, _, score in hits], docs, started,
+                                     index_version)
+
+    def _retrieve_context(self, inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        question, documents = self._unpack_input(inputs)
+        if self.collection is not None:
+            return self._retrieve_from_collection(question, documents, started)
+        with self.resource_loader.use_index() as index:
+            vectorstore = index.retriever.vectorstore
+            search_kwargs, score_threshold = self._search_kwargs(index.retriever)
+            with self.metrics.stage("embed_query"):
+                query_vector = vectorstore._embed_query(question)
+            with self.metrics.stage("vector_search"):
+                docs_and_distances = vectorstore.similarity_search_with_score_by_vector(query_vector, **search_kwargs)
+            doc_ids, scores = self._collect_doc_ids(
+                self._relevance_scores(vectorstore, docs_and_distances, score_threshold), index.retriever.id_key)
+            doc_ids, scores = self._fuse_lexical(question, doc_ids, scores, index.lexical_index)
+            with self.metrics.stage("docstore_mget"):
+                docs = index.retriever.docstore.mget(doc_ids)
+        return self._parse_retrieved(question, doc_ids, scores, docs, started, index.version)
+
+    async def _aretrieve_context(self, inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        question, documents = self._unpack_input(inputs)
+        if self.collection is not None:
+            # Shard searches already run on the collection's thread pool.
+            return await run_in_executor(None, self._retrieve_from_collection, question, documents, started)
+        with self.resource_loader.use_index() as index:
+            vectorstore = index.retriever.vectorstore
+            search_kwargs, score_threshold = self._search_kwargs(index.retriever)
+            with self.metrics.stage("embed_query"):
+                query_vector = await vectorstore._aembed_query(question)
+            with self.metrics.stage("vector_search"):
+                docs_and_distances = await vectorstore.asimilarity_search_with_score_by_vector(query_vector, **search_kwargs)
+            doc_ids, scores = self._collect_doc_ids(
+                self._relevance_scores(vectorstore, docs_and_distances, score_threshold), index.retriever.id_key)
+            doc_ids, scores = self._fuse_lexical(question, doc_ids, scores, index.lexical_index)
+            with self.metrics.stage("docstore_mget"):
+                docs = await index.retriever.docstore.amget(doc_ids)
+        return self._parse_retrieved(question, doc_ids, scores, docs, started, index.version)
+
+    @staticmethod
+    def _with_history(inputs: Union[str, Dict[str, Any]], prepared: Dict[str, Any]) -> Dict[str, Any]:
+        history = inputs.get("history") if isinstance(inputs, dict) else None
+        return {**prepared, "history": history} if history else prepared
+
+    def _prepare(self, inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        return self._with_history(inputs, self._retrieve_context(inputs))
+
+    async def _aprepare(self, inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        return self._with_history(inputs, await self._aretrieve_context(inputs))
+
+    @staticmethod
+    def _vector_search_batch(vectorstore, query_vectors: List[List[float]], search_kwargs: Dict[str, Any]):
+        """
+        similarity_search_with_score_by_vector for many queries as one FAISS matrix search.
+        Search kwargs other than k (filter, fetch_k) fall back to one search per query.
+        """
+        if set(search_kwargs) - {"k"}:
+            return [vectorstore.similarity_search_with_score_by_vector(vector, **search_kwargs) for vector in query_vectors]
+        matrix = np.asarray(query_vectors, dtype=np.float32)
+        if vectorstore._normalize_L2:
+            faiss.normalize_L2(matrix)
+        distances, indices = vectorstore.index.search(matrix, search_kwargs.get("k", 4))
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            results.append([
+                (vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]), float(distance))
+                for distance, i in zip(row_distances, row_indices) if i != -1
+            ])
+        return results
+
+    def _retrieve_batch(self, questions: List[str], documents: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """
+        Retrieval for many questions at once: one embedding call for all of them, one FAISS
+        matrix search (or per-question shard fan-out in collection mode) and one docstore
+        fetch for the union of their parents.
+        """
+        started = time.perf_counter()
+        with self.metrics.stage("batch_embed"):
+            query_vectors = self.resource_loader.embedding_model.embed_documents(questions)
+
+        if self.collection is not None:
+            config = self.resource_loader.config
+            index_version = self.resource_loader.index_version
+            k, top_k = self._candidate_limits()
+            with self.collection.use_shards() as held:
+                with self.metrics.stage("batch_shard_search"):
+                    ranked = [
+                        self.collection.search(
+                            question, documents, k=k, lexical_k=config.HYBRID_LEXICAL_K,
+                            rrf_k=config.HYBRID_RRF_K, top_k=top_k, query_vector=vector, held=held,
+                        )
+                        for question, vector in zip(questions, query_vectors)
+                    ]
+                unique_hits = {}
+                for hits in ranked:
+                    for shard, doc_id, score in hits:
+                        unique_hits.setdefault((shard.key, doc_id), (shard, doc_id, score))
+                with self.metrics.stage("batch_docstore_mget"):
+                    fetched = dict(zip(unique_hits, self.collection.mget(list(unique_hits.values()))))
+            return [
+                self._parse_retrieved(
+                    question, [doc_id for _, doc_id, _ in hits], [score for _, _, score in hits],
+                    [fetched[(shard.key, doc_id)] for shard, doc_id, _ in hits], started, index_version,
+                )
+                for question, hits in zip(questions, ranked)
+            ]
+
+        with self.resource_loader.use_index() as index:
+            vectorstore = index.retriever.vectorstore
+            search_kwargs, score_threshold = self._search_kwargs(index.retriever)
+            with self.metrics.stage("batch_vector_search"):
+                per_question = self._vector_search_batch(vectorstore, query_vectors, search_kwargs)
+            ranked = []
+            for question, docs_and_distances in zip(questions, per_question):
+                doc_ids, scores = self._collect_doc_ids(
+                    self._relevance_scores(vectorstore, docs_and_distances, score_threshold), index.retriever.id_key)
+                ranked.append(self._fuse_lexical(question, doc_ids, scores, index.lexical_index))
+            unique_ids = list(dict.fromkeys(doc_id for doc_ids, _ in ranked for doc_id in doc_ids))
+            with self.metrics.stage("batch_docstore_mget"):
+                fetched = dict(zip(unique_ids, index.retriever.docstore.mget(unique_ids)))
+        return [
+            self._parse_retrieved(question, doc_ids, scores, [fetched[doc_id] for doc_id in doc_ids], started, index.version)
+            for question, (doc_ids, scores) in zip(questions, ranked)
+        ]
+
+    def batch(self, questions: Sequence[str], documents: Optional[Sequence[str]] = None,
+              max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Answers many questions with batched retrieval and concurrent generation; results are
+        in input order and shaped like invoke_with_context. Cached and repeated questions
+        are answered once. A generation that still fails after its retries yields
+        {"answer": None, "error": ...} instead of failing the batch. Timings are batch-wide:
+        "retrieval" is when the question's context was ready, "total" when the batch finished.
+        """
+        started = time.perf_counter()
+        documents = list(documents) if documents else None
+        self._check_documents(documents)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        pending: Dict[str, List[int]] = {}
+        with self.metrics.stage("cache_lookup"):
+            for i, question in enumerate(questions):
+                cached = self._cached_result(question, documents)
+                if cached is not None:
+                    results[i] = self._cache_hit_result(cached, started)
+                    self._record_request("hit", started)
+                else:
+                    pending.setdefault(AnswerCache.normalize(question), []).append(i)
+        if not pending:
+            return results
+
+        unique_questions = [questions[positions[0]] for positions in pending.values()]
+        prepared = self._retrieve_batch(unique_questions, documents)
+        config = self.resource_loader.config
+        # Rate limits and transient API errors are retried once, in the OpenAI client layer.
+        answers = self._generation_chain.batch(
+            [{"context": item["context"], "question": item["question"]} for item in prepared],
+            config={"max_concurrency": max_concurrency or config.BATCH_MAX_CONCURRENCY},
+            return_exceptions=True,
+        )
+        for positions, question, item, answer in zip(pending.values(), unique_questions, prepared, answers):
+            if isinstance(answer, Exception):
+                print(f"[ERROR] RAGChainManager: Batch generation failed for {question!r}: {answer}")
+                self.metrics.inc("rag_batch_errors_total", 1, "Batch questions whose generation failed after retries.")
+                result = {"answer": None, "context": item["context"], "error": f"{type(answer).__name__}: {answer}",
+                          "timings": {"retrieval": item["retrieval_seconds"], "total": time.perf_counter() - started}}
+            else:
+                result = self._finish_result({**item, "answer": answer}, started)
+                self._remember_result(question, result, documents)
+            for i in positions:
+                results[i] = dict(result)
+                self._record_request("miss", started)
+        return results
+
+    def invoke(self, question: str, documents: Optional[Sequence[str]] = None):
+        return self.invoke_with_context(question, documents)["answer"]
+
+    async def ainvoke(self, question: str, documents: Optional[Sequence[str]] = None):
+        result = await self.ainvoke_with_context(question, documents)
+        return result["answer"]
+
+    def _record_request(self, cache: str, started: float):
+        self.metrics.inc("rag_requests_total", 1, "Questions answered, by answer-cache outcome.", cache=cache)
+        self.metrics.observe("rag_request_duration_seconds", time.perf_counter() - started,
+                             "End-to-end time to answer a question.", cache=cache)
+
+    @staticmethod
+    def _finish_result(result: Dict[str, Any], started: float) -> Dict[str, Any]:
+        total = time.perf_counter() - started
+        retrieval = result.get("retrieval_seconds", 0.0)
+        return {
+            "answer": result["answer"],
+            "context": result["context"],
+            "timings": {"retrieval": retrieval, "generation": total - retrieval, "total": total},
+        }
+
+    @staticmethod
+    def _cache_hit_result(cached: Dict[str, Any], started: float) -> Dict[str, Any]:
+        total = time.perf_counter() - started
+        return {**cached, "timings": {"cache_lookup": total, "total": total}}
+
+    def invoke_with_context(self, question: str, documents: Optional[Sequence[str]] = None,
+                            history: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Answers the question and returns the parsed context used to produce it:
+        {"answer": str, "context": {"texts", "images", "doc_ids", "scores", "packing"},
+        "timings": {stage: seconds}}. doc_ids and scores line up with texts + images.
+        In collection mode, `documents` limits the search to those catalog keys.
+        `history` (a rendered conversation) goes into the prompt; such answers skip the cache.
+        Repeat questions are served from the answer cache when it is enabled.
+        """
+        started = time.perf_counter()
+        with self.profiler.profile("invoke"):
+            with self.metrics.stage("cache_lookup"):
+                cached = self._cached_result(question, documents, history)
+            if cached is not None:
+                self._record_request("hit", started)
+                return self._cache_hit_result(cached, started)
+            result = self._finish_result(self._chain.invoke(self._chain_input(question, documents, history)), started)
+            self._remember_result(question, result, documents, history)
+        self._record_request("miss", started)
+        return result
+
+    async def ainvoke_with_context(self, question: str, documents: Optional[Sequence[str]] = None,
+                                   history: Optional[str] = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # The semantic lookup may embed the question, so keep it off the event loop.
+        with self.metrics.stage("cache_lookup"):
+            cached = await run_in_executor(None, self._cached_result, question, documents, history)
+        if cached is not None:
+            self._record_request("hit", started)
+            return self._cache_hit_result(cached, started)
+        result = self._finish_result(await self._chain.ainvoke(self._chain_input(question, documents, history)), started)
+        await run_in_executor(None, self._remember_result, question, result, documents, history)
+        self._record_request("miss", started)
+        return result
+
+    def stream(self, question: str, documents: Optional[Sequence[str]] = None,
+               history: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the chain output. The first event is {"context": ...} with the parsed
+        retrieval results, followed by one {"answer": token} event per LLM token.
+        A cached answer arrives as a single answer event.
+        """
+        started = time.perf_counter()
+        cached = self._cached_result(question, documents, history)
+        if cached is not None:
+            self._record_request("hit", started)
+            yield {"context": cached["context"]}
+            yield {"answer": cached["answer"]}
+            return
+        result = {"answer": "", "context": None}
+        for chunk in self._chain.stream(self._chain_input(question, documents, history)):
+            if "context" in chunk:
+                result["context"] = chunk["context"]
+                yield {"context": chunk["context"]}
+            if chunk.get("answer"):
+                result["answer"] += chunk["answer"]
+                yield {"answer": chunk["answer"]}
+        self._remember_result(question, result, documents, history)
+        self._record_request("miss", started)
+
+    async def astream(self, question: str, documents: Optional[Sequence[str]] = None,
+                      history: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        cached = await run_in_executor(None, self._cached_result, question, documents, history)
+        if cached is not None:
+            self._record_request("hit", started)
+            yield {"context": cached["context"]}
+            yield {"answer": cached["answer"]}
+            return
+        result = {"answer": "", "context": None}
+        async for chunk in self._chain.astream(self._chain_input(question, documents, history)):
+            if "context" in chunk:
+                result["context"] = chunk["context"]
+                yield {"context": chunk["context"]}
+            if chunk.get("answer"):
+                result["answer"] += chunk["answer"]
+                yield {"answer": chunk["answer"]}
+        await run_in_executor(None, self._remember_result, question, result, documents, history)
+        self._record_request("miss", started)
+
+    def stream_from_context(self, question: str, context: Dict[str, Any], history: Optional[str] = None) -> Iterator[str]:
+        """Answer tokens for a question over an already retrieved context (no retrieval, no answer cache)."""
+        started = time.perf_counter()
+        yield from self._generation_chain.stream({"context": context, "question": question, "history": history})
+        self._record_request("reused_context", started)
+
+    async def astream_from_context(self, question: str, context: Dict[str, Any], history: Optional[str] = None) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        async for token in self._generation_chain.astream({"context": context, "question": question, "history": history}):
+            yield token
+        self._record_request("reused_context", started)
+
+    def retrieve_documents(self, question: str, documents: Optional[Sequence[str]] = None):
+        return self._retrieve_context(self._chain_input(question, documents))["context"]
 
-    def retrieve_documents(self, question: str):
-        raw_docs = self.retriever.invoke(question)
-        return DocumentParser.parse_docs(raw_docs)
\ No newline at end of file
+    async def aretrieve_documents(self, question: str, documents: Optional[Sequence[str]] = None):
+        return (await self._aretrieve_context(self._chain_input(question, documents)))["context"]
@@ -0,0 +1,283 @@
+"""
+Read-only serving snapshots that many worker processes share through the page cache.
+
+    python -m rag_components.shared_index publish            # snapshot vectorstore/ into vectorstore/serving/
+    python -m rag_components.shared_index publish --watch 30 # ... and republish whenever ingestion changes it
+    python -m rag_components.shared_index status
+
+A snapshot is an immutable directory laid out like vectorstore/, plus a manifest. The
+FAISS codes are memory-mapped (IO_FLAG_MMAP_IFC), the id map is a memory-mapped
+fixed-width array, and child and parent documents live in MmapDocStores. Workers that
+set SHARED_INDEX_PATH attach to it without unpickling or copying anything. Publishing
+writes a new directory and then atomically replaces the CURRENT pointer, so a worker
+always sees one complete version.
+"""
+import argparse
+import os
+import pickle
+import shutil
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain.schema.document import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+
+from .doc_store import MmapDocStore, convert_pickle_docstore
+from .index_factory import EXACT_VECTORS_FILE, INDEX_META_FILE
+from .index_manifest import MANIFEST_FILE, read_manifest, update_manifest, write_manifest
+
+CURRENT_FILE = "CURRENT"
+IDS_FILE = "ids.npy"
+CHILDREN_DIR = "children"
+
+
+class MappedIds(Mapping):
+    """index_to_docstore_id over a memory-mapped array of fixed-width ASCII ids (position -> id)."""
+
+    def __init__(self, path: str):
+        self._ids = np.load(path, mmap_mode="r")
+
+    def __getitem__(self, position) -> str:
+        position = int(position)
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("ascii")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._ids)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class ChildDocstore(Docstore):
+    """The FAISS child documents, read lazily from an MmapDocStore instead of the unpickled index.pkl."""
+
+    def __init__(self, store: MmapDocStore):
+        self.store = store
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self.store.mget([search])[0]
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError("Serving snapshots are read-only; ingest into vectorstore/ and publish again.")
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("Serving snapshots are read-only; ingest into vectorstore/ and publish again.")
+
+
+def snapshot_config(base_config, snapshot_dir: str):
+    """The config with its index, docstore and BM25 paths pointing into a snapshot (instance settings are kept)."""
+    base_class = base_config if isinstance(base_config, type) else type(base_config)
+    config_class = type(f"{base_class.__name__}Snapshot", (base_class,), {
+        "DB_FAISS_PATH": os.path.join(snapshot_dir, "db_faiss"),
+        "MMAP_DOCSTORE_PATH": os.path.join(snapshot_dir, "docstore"),
+        "DOCSTORE_PATH": os.path.join(snapshot_dir, "docstore.pkl"),  # never written
+        "BM25_INDEX_PATH": os.path.join(snapshot_dir, "bm25_index.json"),
+    })
+    if isinstance(base_config, type):
+        return config_class
+    config = config_class()
+    config.__dict__.update(base_config.__dict__)
+    return config
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_snapshot(root: str) -> Tuple[str, str]:
+    """(version, directory) that CURRENT points to."""
+    version = current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No published index in {root}. Run `python -m rag_components.shared_index publish`.")
+    return version, os.path.join(root, version)
+
+
+def list_versions(root: str) -> List[str]:
+    """Published snapshot versions, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    versions = [name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, MANIFEST_FILE))]
+    return sorted(versions)
+
+
+def _link_or_copy(src: str, dst: str):
+    # Hard links suit files that are only ever appended to or atomically replaced (values.bin,
+    # vectors.npy): the snapshot keeps the old inode. Anything else is copied.
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _write_current(root: str, version: str):
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def publish_snapshot(config, root: Optional[str] = None, keep: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Builds a snapshot of the single-index vectorstore (DB_FAISS_PATH, docstore, BM25 index)
+    under `root` and points CURRENT at it. The snapshot takes the version of the source
+    manifest. Returns the snapshot manifest; when that version is already current, returns
+    the current one instead.
+    """
+    root = root or config.SHARED_INDEX_PATH
+    os.makedirs(root, exist_ok=True)
+    source_manifest = update_manifest(config)
+    version = source_manifest["version"]
+    existing = current_version(root)
+    if existing and existing.split(".")[0] == version and not force:
+        print(f"[INFO] shared_index.py: {existing} is already current.")
+        return read_manifest(os.path.join(root, existing, MANIFEST_FILE))
+
+    started = time.perf_counter()
+    suffix = 1
+    while os.path.exists(os.path.join(root, version)):  # --force twice within a second
+        version, suffix = f"{version.rsplit('.', 1)[0]}.{suffix}", suffix + 1
+    tmp_dir = os.path.join(root, f".tmp-{version}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    faiss_dir = os.path.join(tmp_dir, "db_faiss")
+    os.makedirs(faiss_dir)
+
+    # FAISS.save_local rewrites index.faiss in place, so it is copied, never linked.
+    shutil.copyfile(os.path.join(config.DB_FAISS_PATH, "index.faiss"), os.path.join(faiss_dir, "index.faiss"))
+    for name, link in ((INDEX_META_FILE, False), (EXACT_VECTORS_FILE, True)):
+        src = os.path.join(config.DB_FAISS_PATH, name)
+        if os.path.isfile(src):
+            (_link_or_copy if link else shutil.copyfile)(src, os.path.join(faiss_dir, name))
+
+    with open(os.path.join(config.DB_FAISS_PATH, "index.pkl"), "rb") as f:
+        child_docstore, index_to_docstore_id = pickle.load(f)
+    ids = [index_to_docstore_id[position] for position in range(len(index_to_docstore_id))]
+    np.save(os.path.join(faiss_dir, IDS_FILE), np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}"))
+    children = MmapDocStore(os.path.join(tmp_dir, CHILDREN_DIR))
+    children.mset([(child_id, child_docstore.search(child_id)) for child_id in ids])
+    children.close()
+
+    docstore_dir = os.path.join(tmp_dir, "docstore")
+    if MmapDocStore.exists(config.MMAP_DOCSTORE_PATH):
+        os.makedirs(docstore_dir)
+        _link_or_copy(os.path.join(config.MMAP_DOCSTORE_PATH, MmapDocStore.VALUES_FILE),
+                      os.path.join(docstore_dir, MmapDocStore.VALUES_FILE))
+        shutil.copyfile(os.path.join(config.MMAP_DOCSTORE_PATH, MmapDocStore.INDEX_FILE),
+                        os.path.join(docstore_dir, MmapDocStore.INDEX_FILE))
+    else:
+        convert_pickle_docstore(config.DOCSTORE_PATH, docstore_dir, thumbnail_max_side=config.THUMBNAIL_MAX_SIDE).close()
+    if os.path.isfile(config.BM25_INDEX_PATH):
+        shutil.copyfile(config.BM25_INDEX_PATH, os.path.join(tmp_dir, "bm25_index.json"))
+
+    manifest = {
+        **source_manifest,
+        "version": version,
+        "published_at": time.time(),
+        "files": {
+            os.path.relpath(os.path.join(dirpath, name), tmp_dir): os.path.getsize(os.path.join(dirpath, name))
+            for dirpath, _, names in os.walk(tmp_dir) for name in names
+        },
+    }
+    write_manifest(os.path.join(tmp_dir, MANIFEST_FILE), manifest)
+    os.rename(tmp_dir, os.path.join(root, version))
+    _write_current(root, version)
+    print(f"[INFO] shared_index.py: Published {version} ({manifest['ntotal']} vectors, {manifest['index_type']}) "
+          f"in {time.perf_counter() - started:.2f}s.")
+    gc_snapshots(root, keep if keep is not None else config.SHARED_INDEX_KEEP_VERSIONS)
+    return manifest
+
+
+def gc_snapshots(root: str, keep: int) -> List[str]:
+    """
+    Deletes all but the newest `keep` snapshots (never CURRENT). Workers still attached to a
+    deleted one keep working: their mappings hold the files until they re-attach or exit.
+    """
+    current = current_version(root)
+    removable = [version for version in list_versions(root) if version != current]
+    removed = removable[:max(0, len(removable) - max(0, keep - 1))]
+    for version in removed:
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+    if removed:
+        print(f"[INFO] shared_index.py: Removed {len(removed)} old snapshot(s).")
+    return removed
+
+
+def attach_vectorstore(snapshot_dir: str, embedding_model) -> FAISS:
+    """A read-only FAISS vectorstore over a snapshot: codes, ids and child documents all stay on disk."""
+    faiss_dir = os.path.join(snapshot_dir, "db_faiss")
+    try:
+        index = faiss.read_index(os.path.join(faiss_dir, "index.faiss"), faiss.IO_FLAG_MMAP_IFC)
+    except RuntimeError as e:
+        print(f"[WARN] shared_index.py: Cannot memory-map this index type ({e}); reading it into memory.")
+        index = faiss.read_index(os.path.join(faiss_dir, "index.faiss"), faiss.IO_FLAG_READ_ONLY)
+    return FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=ChildDocstore(MmapDocStore(os.path.join(snapshot_dir, CHILDREN_DIR))),
+        index_to_docstore_id=MappedIds(os.path.join(faiss_dir, IDS_FILE)),
+    )
+
+
+def memory_usage() -> Dict[str, Optional[float]]:
+    """
+    Resident memory of this process in MiB, split into private (anonymous) pages and
+    file-backed pages, which processes mapping the same snapshot share. None off Linux.
+    """
+    usage = {"rss_anon_mb": None, "rss_file_mb": None}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    key = "rss_anon_mb" if line.startswith("RssAnon") else "rss_file_mb"
+                    usage[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def main():
+    from config import AppConfig
+
+    parser = argparse.ArgumentParser(description="Publish and inspect shared read-only serving snapshots.")
+    parser.add_argument("command", choices=["publish", "status", "gc"])
+    parser.add_argument("--root", default=AppConfig.SHARED_INDEX_PATH or "vectorstore/serving")
+    parser.add_argument("--keep", type=int, default=AppConfig.SHARED_INDEX_KEEP_VERSIONS, help="Snapshots to keep")
+    parser.add_argument("--force", action="store_true", help="Publish even if the source is unchanged")
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                        help="Keep running and republish whenever the source changes")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        current = current_version(args.root)
+        for version in list_versions(args.root):
+            manifest = read_manifest(os.path.join(args.root, version, MANIFEST_FILE))
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  {manifest['index_type']:<8} {manifest['ntotal']:>9} vectors  "
+                  f"{sum(manifest['files'].values()) / 2**20:8.1f} MiB")
+    elif args.command == "gc":
+        gc_snapshots(args.root, args.keep)
+    else:
+        publish_snapshot(AppConfig(), args.root, args.keep, args.force)
+        while args.watch:
+            time.sleep(args.watch)
+            try:
+                publish_snapshot(AppConfig(), args.root, args.keep)
+            except Exception as e:
+                # Ingestion may be mid-write; the next poll retries.
+                print(f"[WARN] shared_index.py: Publishing failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import importlib
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+# Imported by the background thread, in this order, so their cost shows up separately in
+# the startup report instead of inside whichever module happens to import them first.
+HEAVY_MODULES = [
+    "numpy",
+    "faiss",
+    "langchain_core.runnables",
+    "langchain_community.vectorstores",
+    "langchain.retrievers.multi_vector",
+    "langchain_openai",
+    "rag_components.resource_loader",
+    "rag_components.retrieval_chain",
+]
+
+
+def heavy_modules(config) -> List[str]:
+    """HEAVY_MODULES minus the OpenAI SDK when neither provider uses it."""
+    needs_openai = "openai" in (config.LLM_PROVIDER, config.EMBEDDING_PROVIDER)
+    return [name for name in HEAVY_MODULES if needs_openai or name != "langchain_openai"]
+
+
+class BackgroundLoader:
+    """
+    Imports the heavy modules and builds the RAGChainManager on a daemon thread, so the
+    UI can render immediately and poll `status()` until the manager is ready. Import and
+    load durations are kept in `report()`; `mark()` adds UI milestones such as first paint.
+    """
+
+    PENDING, IMPORTING, LOADING, READY, FAILED = "pending", "importing", "loading", "ready", "failed"
+
+    def __init__(self, config, modules: Optional[List[str]] = None, shell_import_seconds: float = 0.0):
+        self.config = config
+        self.shell_import_seconds = shell_import_seconds  # imports done before the loader existed (streamlit, config)
+        self.modules = modules if modules is not None else heavy_modules(config)
+        self.state = self.PENDING
+        self.detail = ""
+        self.manager = None
+        self.error: Optional[str] = None
+        self.created_at = time.perf_counter()
+        self.import_seconds: Dict[str, float] = {}
+        self.load_seconds: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "BackgroundLoader":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rag-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _timed(self, bucket: Dict[str, float], name: str, fn: Callable[[], Any]) -> Any:
+        self.detail = name
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            bucket[name] = time.perf_counter() - started
+
+    def _run(self):
+        try:
+            self.state = self.IMPORTING
+            for name in self.modules:
+                self._timed(self.import_seconds, name, lambda: importlib.import_module(name))
+
+            self.state = self.LOADING
+            from .resource_loader import ResourceLoader
+            from .retrieval_chain import RAGChainManager
+
+            resource_loader = ResourceLoader(self.config)
+            self._timed(self.load_seconds, "load_all", resource_loader.load_all)
+            self.load_seconds.update({f"load_all.{step}": seconds for step, seconds in resource_loader.load_timings.items()})
+            self.manager = self._timed(self.load_seconds, "chain_manager", lambda: RAGChainManager(resource_loader))
+            self.state = self.READY
+            self.detail = ""
+            self.mark("ready")
+            self._publish()
+            print(f"[INFO] BackgroundLoader: Ready in {self.marks['ready']:.2f}s. {self.format_report()}")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = self.FAILED
+            print(f"[ERROR] BackgroundLoader: Startup failed while {self.detail}: {self.error}")
+            print(traceback.format_exc())
+        finally:
+            self._ready.set()
+
+    def _publish(self):
+        from .metrics import METRICS
+
+        METRICS.set_gauge("rag_startup_import_seconds", self.shell_import_seconds, "Import time of heavy modules at startup.", module="shell")
+        for name, seconds in self.import_seconds.items():
+            METRICS.set_gauge("rag_startup_import_seconds", seconds, "Import time of heavy modules at startup.", module=name)
+        for name, seconds in self.load_seconds.items():
+            METRICS.set_gauge("rag_startup_load_seconds", seconds, "Resource loading steps at startup.", step=name)
+        for name, seconds in self.marks.items():
+            METRICS.set_gauge("rag_startup_milestone_seconds", seconds, "Seconds from loader start to milestone.", milestone=name)
+
+    def mark(self, milestone: str):
+        """Records the first time a milestone (e.g. "first_paint") is reached, relative to loader creation."""
+        if milestone not in self.marks:
+            self.marks[milestone] = time.perf_counter() - self.created_at
+            if self.state == self.READY and milestone != "ready":
+                self._publish()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "detail": self.detail,
+            "error": self.error,
+            "elapsed_seconds": time.perf_counter() - self.created_at,
+            "progress": self._progress(),
+        }
+
+    def _progress(self) -> float:
+        if self.state in (self.READY, self.FAILED):
+            return 1.0
+        # Imports count for the first half, loading for the second.
+        imported = len(self.import_seconds) / max(1, len(self.modules))
+        return 0.5 * imported + (0.25 if self.state == self.LOADING else 0.0)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "shell_imports": self.shell_import_seconds,
+            "imports": dict(self.import_seconds),
+            "load": dict(self.load_seconds),
+            "marks": dict(self.marks),
+            "import_total": sum(self.import_seconds.values()),
+        }
+
+    def format_report(self) -> str:
+        parts = [f"shell imports {self.shell_import_seconds:.2f}s", f"imports {sum(self.import_seconds.values()):.2f}s"]
+        parts += [f"{name} {seconds:.2f}s" for name, seconds in self.load_seconds.items() if "." not in name]
+        parts += [f"{name} at {seconds:.2f}s" for name, seconds in self.marks.items()]
+        return ", ".join(parts)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from config import AppConfig
+
+SECTION_TEXT = {
+    "intro": "Concept learning infers a boolean-valued function from training examples. "
+             "Each hypothesis is a conjunction of constraints on the instance attributes. ",
+    "trees": "Decision tree learning approximates discrete-valued target functions. "
+             "Each internal node tests one attribute and each leaf assigns a classification. ",
+    "bayes": "Bayesian learning weighs the evidence for each hypothesis by its posterior probability. "
+             "The maximum a posteriori hypothesis is the most probable one given the data. ",
+}
+
+
+def make_pages(*sections):
+    """One page per section, under a heading numbered by the section (not the page), with enough body to stand alone."""
+    pages = []
+    for page, name in enumerate(sections, start=1):
+        number = list(SECTION_TEXT).index(name) + 1
+        pages.append({"page": page, "text": f"{number}. {name.title()}\n{SECTION_TEXT[name] * 6}", "images": []})
+    return pages
+
+
+@pytest.fixture
+def store_config(tmp_path):
+    """An offline AppConfig whose vectorstore lives under tmp_path."""
+    root = str(tmp_path / "vectorstore")
+
+    class TestConfig(AppConfig):
+        DB_FAISS_PATH = os.path.join(root, "db_faiss")
+        DOCSTORE_PATH = os.path.join(root, "docstore.pkl")
+        MMAP_DOCSTORE_PATH = os.path.join(root, "docstore")
+        BM25_INDEX_PATH = os.path.join(root, "bm25_index.json")
+        EMBEDDING_CACHE_PATH = None
+        IMAGE_CAPTIONS_ENABLED = False
+        CHUNK_SUMMARIES_ENABLED = False
+        COLLECTION_PATH = None
+        SHARED_INDEX_PATH = None
+        LLM_PROVIDER = "fake"
+        EMBEDDING_PROVIDER = "fake"
+        FAKE_EMBEDDING_SIZE = 64
+        INDEX_RELOAD_ENABLED = False
+        ANSWER_CACHE_ENABLED = False
+        RERANKER = "none"
+        CHUNK_MIN_CHARS = 100
+
+    return TestConfig()
+
+
+@pytest.fixture
+def ingest(store_config, monkeypatch):
+    """ingest(*sections, source=..., **run_kwargs): runs PDFIngestionPipeline on synthetic pages instead of a PDF."""
+    from vector_loader import PDFIngestionPipeline
+
+    def run(*sections, source="notes.pdf", config=None, **kwargs):
+        pipeline = PDFIngestionPipeline(config or store_config, max_workers=1)
+        monkeypatch.setattr(pipeline, "extract", lambda pdf_path: make_pages(*sections))
+        return pipeline.run(source, **kwargs)
+
+    return run
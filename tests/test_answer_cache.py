@@ -0,0 +1,109 @@
+import pytest
+
+from rag_components import answer_cache
+from rag_components.answer_cache import AnswerCache
+
+
+class TableEmbeddings:
+    """Embeds known (normalized) questions to fixed vectors; anything else is orthogonal to them all."""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.table.get(text, [0.0, 0.0, 1.0])
+
+
+def result(answer):
+    return {"answer": answer, "context": {"texts": []}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_exact_hits_ignore_case_spacing_and_punctuation():
+    cache = AnswerCache()
+    cache.put("What is  ID3?", result("a tree learner"), "v1")
+    assert cache.get("what is id3", "v1")["answer"] == "a tree learner"
+    assert cache.get("What is C4.5?", "v1") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_similar_questions_hit_only_above_the_threshold():
+    embeddings = TableEmbeddings({
+        "what is id3": [1.0, 0.0, 0.0],
+        "explain id3": [0.99, 0.14, 0.0],  # cosine ~0.99
+        "how does id3 split": [0.8, 0.6, 0.0],  # cosine 0.8
+    })
+    cache = AnswerCache(similarity_threshold=0.95, embedding_model=embeddings)
+    cache.put("What is ID3?", result("a tree learner"), "v1")
+    assert cache.get("Explain ID3", "v1")["answer"] == "a tree learner"
+    assert cache.get("How does ID3 split?", "v1") is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_exact_hits_do_not_embed_the_question():
+    embeddings = TableEmbeddings({})
+    cache = AnswerCache(similarity_threshold=0.95, embedding_model=embeddings)
+    cache.put("What is ID3?", result("a tree learner"))
+    calls = embeddings.calls
+    assert cache.get("what is id3") is not None
+    assert embeddings.calls == calls
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60)
+    cache.put("q", result("a"), "v1")
+    clock[0] += 59
+    assert cache.get("q", "v1") is not None
+    clock[0] += 2
+    assert cache.get("q", "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_at_capacity():
+    cache = AnswerCache(max_entries=2)
+    cache.put("first", result("1"))
+    cache.put("second", result("2"))
+    assert cache.get("first") is not None  # now more recent than "second"
+    cache.put("third", result("3"))
+    assert cache.get("second") is None
+    assert cache.get("first")["answer"] == "1" and cache.get("third")["answer"] == "3"
+
+
+def test_a_new_index_version_drops_everything():
+    cache = AnswerCache()
+    cache.put("q", result("old"), "v1")
+    assert cache.get("q", "v2") is None
+    assert cache.stats() == {**cache.stats(), "entries": 0, "index_version": "v2"}
+    cache.put("q", result("new"), "v2")
+    assert cache.get("q", "v2")["answer"] == "new"
+    cache.invalidate()
+    assert cache.get("q", "v2") is None
+
+
+def test_manager_misses_and_refuses_stale_answers_after_a_reload(store_config, ingest):
+    from rag_components.resource_loader import ResourceLoader
+    from rag_components.retrieval_chain import RAGChainManager
+
+    ingest("intro")
+    store_config.ANSWER_CACHE_ENABLED = True
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    manager = RAGChainManager(loader)
+    question = "What is concept learning?"
+    stale = manager.invoke_with_context(question)
+    assert manager.answer_cache.stats()["entries"] == 1
+
+    ingest("intro", "trees")
+    assert loader.reload_if_changed()
+    assert manager.answer_cache.get(question, loader.index_version) is None
+    manager._remember_result(question, stale)  # finished against the old generation
+    assert manager.answer_cache.stats()["entries"] == 0
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api_server import Overloaded, RAGService, create_app
+
+QUESTION = "What is concept learning?"
+
+
+def sse_events(body):
+    """[(event, data)] from a server-sent event stream."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def wait_ready(client):
+    for _ in range(200):
+        if client.get("/readyz").status_code == 200:
+            return
+        time.sleep(0.05)
+    raise AssertionError(client.get("/readyz").json())
+
+
+@pytest.fixture
+def client(store_config, ingest):
+    ingest("intro", "trees")
+    with TestClient(create_app(store_config)) as client:
+        wait_ready(client)
+        yield client
+
+
+class StubManager:
+    """Stands in for RAGChainManager: answers after `delay` seconds, or streams `events` and then raises `error`."""
+
+    def __init__(self, delay=0.0, events=(), error=None):
+        self.delay = delay
+        self.events = list(events)
+        self.error = error
+        self.calls = 0
+
+    async def ainvoke_with_context(self, question, documents=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"answer": f"answer to {question}", "context": {}, "timings": {}}
+
+    async def astream(self, question, documents=None):
+        for event in self.events:
+            await asyncio.sleep(self.delay)
+            yield event
+        if self.error is not None:
+            raise self.error
+
+
+def test_readiness_follows_loading(store_config, ingest):
+    ingest("intro")
+    app = create_app(store_config)
+    unstarted = TestClient(app)  # no lifespan, so resources never load
+    assert unstarted.get("/healthz").json() == {"status": "ok"}
+    assert unstarted.get("/readyz").status_code == 503
+    assert unstarted.post("/query", json={"question": QUESTION}).status_code == 503
+    with TestClient(app) as client:
+        wait_ready(client)
+        status = client.get("/readyz").json()
+        assert status["ready"] and status["error"] is None
+
+
+def test_identical_questions_in_flight_share_one_run(store_config):
+    async def scenario():
+        service = RAGService(store_config)
+        await service.start()
+        service.manager = StubManager(delay=0.05)
+        results = await asyncio.gather(
+            service.query("What is ID3?", None), service.query("what is id3", None), service.query("What is C4.5?", None),
+        )
+        return service, results
+
+    service, results = asyncio.run(scenario())
+    assert service.manager.calls == 2
+    assert [coalesced for _, coalesced in results] == [False, True, False]
+    assert results[0][0] is results[1][0]
+    assert service.status()["in_flight"] == 0
+
+
+def test_requests_beyond_the_queue_are_rejected(store_config):
+    async def scenario():
+        service = RAGService(store_config, max_concurrency=1, max_queue=1)
+        await service.start()
+        service.manager = StubManager(delay=0.1)
+        running = asyncio.ensure_future(service.query("first", None))
+        await asyncio.sleep(0.01)
+        assert not service.saturated()
+        queued = asyncio.ensure_future(service.query("second", None))
+        await asyncio.sleep(0.01)
+        assert service.saturated()
+        with pytest.raises(Overloaded):
+            await service.query("third", None)
+        await asyncio.gather(running, queued)
+        assert not service.saturated()
+
+    asyncio.run(scenario())
+
+
+def test_saturated_service_answers_429(client, monkeypatch):
+    monkeypatch.setattr(client.app.state.service, "saturated", lambda: True)
+    for path in ("/query", "/query/stream"):
+        response = client.post(path, json={"question": QUESTION})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+
+
+def test_query_returns_the_answer_and_its_context(client):
+    body = client.post("/query", json={"question": QUESTION}).json()
+    assert body["answer"] and not body["coalesced"]
+    assert len(body["context"]["doc_ids"]) == len(body["context"]["texts"]) + len(body["context"]["images"])
+
+
+def test_stream_sends_context_then_tokens_then_done(client):
+    response = client.post("/query/stream", json={"question": QUESTION})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "context" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+    answer = "".join(data for name, data in events if name == "token")
+    assert answer == client.post("/query", json={"question": QUESTION}).json()["answer"]
+
+
+def test_stream_that_outlives_the_timeout_ends_with_504(client):
+    service = client.app.state.service
+    service.request_timeout = 0.05
+    service.manager = StubManager(delay=0.03, events=[{"answer": "a"}, {"answer": "b"}, {"answer": "c"}])
+    events = sse_events(client.post("/query/stream", json={"question": QUESTION}).text)
+    assert events[0] == ("token", "a")
+    assert events[-2][0] == "error" and events[-2][1]["status"] == 504
+    assert events[-1] == ("done", {})
+
+
+def test_unexpected_stream_failure_sends_500_then_done(client):
+    client.app.state.service.manager = StubManager(events=[{"answer": "a"}], error=RuntimeError("model went away"))
+    events = sse_events(client.post("/query/stream", json={"question": QUESTION}).text)
+    assert events == [
+        ("token", "a"),
+        ("error", {"status": 500, "detail": "RuntimeError: model went away"}),
+        ("done", {}),
+    ]
@@ -0,0 +1,77 @@
+import pytest
+
+from rag_components.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+CHILDREN = [
+    ("trees", "Decision trees split on information gain. Entropy measures impurity of a split."),
+    ("trees", "Pruning a decision tree reduces overfitting."),
+    ("bayes", "Naive Bayes assumes conditional independence between features."),
+    ("kmeans", "k-means assigns each point to the nearest centroid."),
+]
+
+
+def test_tokenize_drops_stopwords_and_keeps_hyphenated_terms_and_their_parts():
+    assert tokenize("What is the k-means loss?") == ["k-means", "k", "means", "loss"]
+
+
+def test_search_ranks_parents_by_their_best_child():
+    index = BM25Index.build(CHILDREN)
+    hits = index.search("decision tree entropy split", k=10)
+    assert [doc_id for doc_id, _ in hits] == ["trees"]
+    scores = dict(index.search("decision independence", k=10))
+    assert set(scores) == {"trees", "bayes"}
+    assert index.search("independence between features", k=10)[0][0] == "bayes"
+    assert index.search("means", k=10)[0][0] == "kmeans"
+    assert index.search("quantum", k=10) == []
+
+
+def test_rarer_terms_weigh_more():
+    index = BM25Index.build([("a", "common common rare"), ("b", "common filler words"), ("c", "common other words")])
+    hits = index.search("common rare", k=3)
+    assert hits[0][0] == "a"
+    assert hits[0][1] > hits[1][1]
+
+
+def test_search_keeps_the_top_k():
+    index = BM25Index.build([(f"doc-{n}", "shared term " + "pad " * n) for n in range(5)])
+    hits = index.search("shared", k=3)
+    # Shorter children score higher under length normalisation.
+    assert [doc_id for doc_id, _ in hits] == ["doc-0", "doc-1", "doc-2"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(CHILDREN)
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.search("decision entropy", k=5) == index.search("decision entropy", k=5)
+
+
+def test_reciprocal_rank_fusion_merges_and_deduplicates():
+    doc_ids, scores = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]], k=60)
+    assert doc_ids == ["a", "c", "b", "d"]
+    assert scores[0] == pytest.approx(1 / 61 + 1 / 63)
+    assert scores[1] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores[2] == pytest.approx(1 / 62)
+    assert len(set(doc_ids)) == len(doc_ids)
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]], k=60, limit=2)[0] == ["a", "c"]
+
+
+def test_hybrid_retrieval_keeps_hybrid_top_k_parents(store_config, ingest):
+    ingest("intro", "trees", "bayes")
+    store_config.RETRIEVAL_MODE = "hybrid"
+    store_config.HYBRID_TOP_K = 2
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    manager = RAGChainManager(loader)
+    question = "How does a decision tree choose a split?"
+    packed = manager._retrieve_context(question)["context"]
+    assert len(packed["doc_ids"]) + packed["packing"]["duplicates_dropped"] == 2
+    assert packed["scores"] == sorted(packed["scores"], reverse=True)
+
+    store_config.RETRIEVAL_MODE = "dense"
+    dense = manager._retrieve_context(question)["context"]
+    assert len(dense["doc_ids"]) + dense["packing"]["duplicates_dropped"] > 2
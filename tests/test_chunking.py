@@ -0,0 +1,97 @@
+from rag_components.chunking import RecursiveChunker, StructuredChunker, content_hash, heading_level
+
+NOTES = """UNIT I INTRODUCTION
+1. Learning Problems
+Machine learning studies programs that improve with experience. A program learns from experience E with respect to tasks T and measure P. This holds when performance at T improves with E.
+1.1 Designing a Learning System
+Choosing the training experience is the first design choice. The target function and its representation come next.
+Table 1.1: Results by algorithm
+Algorithm  Accuracy  Recall
+ID3  0.81  0.77
+CART  0.84  0.80
+Naive Bayes  0.79  0.83
+2. Decision Trees
+Decision trees classify instances by sorting them down the tree. Each node tests an attribute.
+"""
+
+
+def split(text, **settings):
+    settings = {"child_max_chars": 300, "parent_max_chars": 3000, "min_chars": 50, **settings}
+    return StructuredChunker(**settings).split([{"page": 1, "text": text, "images": []}], "notes.pdf")
+
+
+def test_heading_levels():
+    assert heading_level("UNIT I INTRODUCTION") == 1
+    assert heading_level("1. Learning Problems") == 2
+    assert heading_level("1.1 Designing a Learning System") == 3
+    assert heading_level("APPENDIX") == 2
+    assert heading_level("1. Task T: To play checkers") is None  # a list item
+    assert heading_level("This is body text.") is None
+    assert heading_level("CART  0.84  0.80") is None  # an upper-case table row
+
+
+def test_sections_become_parents_under_their_heading_path():
+    parents, children = split(NOTES)
+    assert [parent.metadata["section"] for parent in parents.values()] == [
+        "UNIT I INTRODUCTION > 1. Learning Problems",
+        "UNIT I INTRODUCTION > 1. Learning Problems > 1.1 Designing a Learning System",
+        "UNIT I INTRODUCTION > 2. Decision Trees",
+    ]
+    for parent in parents.values():
+        assert parent.page_content.startswith(parent.metadata["section"])
+    # Every child points at a parent and carries the innermost two headings.
+    for child in children.values():
+        parent = parents[child.metadata["doc_id"]]
+        assert child.page_content.split("\n")[0] == " > ".join(parent.metadata["section"].split(" > ")[-2:])
+        assert child.metadata["source"] == "notes.pdf"
+
+
+def test_tables_stay_whole_with_their_caption():
+    _, children = split(NOTES)
+    by_type = {}
+    for child in children.values():
+        by_type.setdefault(child.metadata["type"], []).append(child.page_content)
+    assert by_type["caption"] == ["1. Learning Problems > 1.1 Designing a Learning System\nTable 1.1: Results by algorithm"]
+    [table] = by_type["table"]
+    assert table.endswith("Table 1.1: Results by algorithm\nAlgorithm Accuracy Recall\n"
+                          "ID3 0.81 0.77\nCART 0.84 0.80\nNaive Bayes 0.79 0.83")
+    assert not any("0.81" in text for text in by_type["text"])
+
+
+def test_long_tables_split_between_rows_and_repeat_the_header():
+    rows = "\n".join(f"Model{n}  0.{n:02d}  0.{99 - n:02d}" for n in range(40))
+    _, children = split(f"1. Results\nMetric  Accuracy  Recall\n{rows}\n", child_max_chars=200)
+    tables = [child.page_content for child in children.values() if child.metadata["type"] == "table"]
+    assert len(tables) > 1
+    for table in tables:
+        lines = table.split("\n")
+        assert lines[1] == "Metric Accuracy Recall"
+        assert len("\n".join(lines[1:])) <= 200
+    body_rows = [line for table in tables for line in table.split("\n")[2:]]
+    assert body_rows == [f"Model{n} 0.{n:02d} 0.{99 - n:02d}" for n in range(40)]
+
+
+def test_children_do_not_exceed_the_size_limit_or_overlap():
+    text = " ".join(f"Step {n} follows the negative gradient of the error surface." for n in range(40))
+    parents, children = split(f"1. Optimisation\n{text}\n", child_max_chars=300)
+    assert len(parents) == 1 and len(children) > 1
+    bodies = [child.page_content.split("\n", 1)[1] for child in children.values()]
+    assert all(len(body) <= 300 for body in bodies)
+    assert " ".join(bodies) == text
+
+
+def test_ids_are_stable_content_hashes():
+    first_parents, first_children = split(NOTES)
+    second_parents, second_children = split(NOTES)
+    assert list(first_parents) == list(second_parents) and list(first_children) == list(second_children)
+    edited_parents, _ = split(NOTES.replace("Each node tests an attribute.", "Each node tests one attribute."))
+    assert len(set(edited_parents) & set(first_parents)) == 2
+    assert content_hash("chunk", "a.pdf", "text") != content_hash("chunk", "b.pdf", "text")
+
+
+def test_recursive_chunker_makes_each_chunk_its_own_parent():
+    parents, children = RecursiveChunker(chunk_size=200, chunk_overlap=20).split(
+        [{"page": 1, "text": NOTES, "images": []}], "notes.pdf")
+    assert len(parents) == len(children) > 1
+    for child_id, child in children.items():
+        assert child.metadata["doc_id"] in parents
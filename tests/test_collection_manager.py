@@ -0,0 +1,99 @@
+import pytest
+
+from rag_components.collection_manager import CollectionManager, document_key
+from rag_components.resource_loader import ResourceLoader
+
+QUESTION = "How does a decision tree classify an instance?"
+
+
+@pytest.fixture
+def build(store_config, ingest, tmp_path):
+    """build(**manager_kwargs): a collection with one shard per section ("intro", "trees", "bayes")."""
+    root = str(tmp_path / "collection")
+    registrar = CollectionManager(root)
+    for key in ("intro", "trees", "bayes"):
+        config = registrar.shard_config(store_config, key)()
+        registrar.register(key, f"{key}.pdf", ingest(key, source=f"{key}.pdf", config=config))
+    embedding_model = ResourceLoader(store_config).build_embedding_model()
+
+    def make(**kwargs):
+        return CollectionManager(root, embedding_model, **kwargs)
+
+    return make
+
+
+def test_document_key():
+    assert document_key("papers/Mitchell ML (1997).pdf") == "mitchell-ml-1997"
+    assert document_key("___.pdf") == "document"
+
+
+def test_search_fans_out_to_every_shard_and_merges_one_ranking(build):
+    collection = build()
+    with collection.use_shards() as held:
+        hits = collection.search(QUESTION, k=10, held=held)
+        docs = collection.mget(hits)
+    assert {shard.key for shard, _, _ in hits} == {"intro", "trees", "bayes"}
+    scores = [score for _, _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+    assert len({(shard.key, doc_id) for shard, doc_id, _ in hits}) == len(hits)
+    assert all(doc is not None for doc in docs)
+    assert sorted(collection.loaded_keys()) == ["bayes", "intro", "trees"]
+
+
+def test_search_is_limited_to_the_requested_documents(build):
+    collection = build()
+    hits = collection.search(QUESTION, documents=["intro", "bayes"], k=10)
+    assert hits and {shard.key for shard, _, _ in hits} <= {"intro", "bayes"}
+    assert sorted(collection.loaded_keys()) == ["bayes", "intro"]
+    assert collection.search(QUESTION, documents=[], k=10) == []
+    with pytest.raises(KeyError, match="nope"):
+        collection.search(QUESTION, documents=["intro", "nope"])
+
+
+def test_least_recently_used_shards_are_evicted_by_count(build):
+    collection = build(max_loaded_shards=2)
+    intro = collection.get_shard("intro")
+    collection.get_shard("trees")
+    collection.get_shard("intro")  # now more recent than "trees"
+    collection.get_shard("bayes")
+    assert collection.loaded_keys() == ["intro", "bayes"]
+    assert not intro.closed
+    assert collection.get_shard("intro") is intro
+
+
+def test_shards_are_evicted_by_memory(build):
+    probe = build()
+    size = probe.get_shard("intro").size_bytes
+    collection = build(max_memory_mb=1.5 * size / 2**20)
+    collection.get_shard("intro")
+    collection.get_shard("trees")
+    assert collection.loaded_keys() == ["trees"]
+    # The shard just loaded stays even when it alone exceeds the budget.
+    tiny = build(max_memory_mb=1 / 2**20)
+    tiny.get_shard("intro")
+    assert tiny.loaded_keys() == ["intro"]
+
+
+def test_evicted_shards_close_once_released(build):
+    collection = build(max_loaded_shards=1)
+    with collection.use_shards() as held:
+        hits = collection.search(QUESTION, documents=["trees"], k=5, held=held)
+        trees = hits[0][0]
+        collection.get_shard("intro")  # evicts "trees" while the search still holds it
+        assert collection.loaded_keys() == ["intro"]
+        assert not trees.closed
+        assert all(doc is not None for doc in collection.mget(hits))
+    assert trees.closed and trees.in_flight == 0
+
+    intro = collection.get_shard("intro")
+    collection.get_shard("bayes")  # nothing holds "intro", so it closes straight away
+    assert intro.closed
+
+
+def test_reregistering_a_document_closes_its_loaded_shard(build, store_config, ingest):
+    collection = build()
+    trees = collection.get_shard("trees")
+    config = collection.shard_config(store_config, "trees")()
+    collection.register("trees", "trees.pdf", ingest("trees", "bayes", source="trees.pdf", config=config))
+    assert trees.closed
+    assert collection.get_shard("trees") is not trees
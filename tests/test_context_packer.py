@@ -0,0 +1,64 @@
+from langchain.schema.document import Document
+
+from rag_components.context_packer import ContextPacker, TokenCounter
+from rag_components.document_parser import DocumentParser
+from rag_components.image_record import ImageRecord
+
+
+def image(caption=None):
+    metadata = {"caption": caption, "page": 2, "source": "notes.pdf"} if caption else {}
+    return ImageRecord(b"\x89PNG\r\n\x1a\nfake", "image/png", metadata=metadata)
+
+
+def packer(**overrides):
+    settings = dict(token_budget=4000, token_counter=TokenCounter("gpt-4o-mini", estimate_only=True))
+    settings.update(overrides)
+    return ContextPacker(**settings)
+
+
+def test_pack_ranks_texts_and_images_together_by_score():
+    parsed = DocumentParser.parse_docs(
+        [Document(page_content="low scoring text " * 20), image(), Document(page_content="high scoring text")],
+        ["t-low", "img", "t-high"], [0.1, 0.5, 0.9],
+    )
+    # Room for the best text and the image, not for the long low-scoring text.
+    packed = packer(token_budget=110, max_images=1).pack(parsed)
+    assert [doc.page_content for doc in packed["texts"]] == ["high scoring text"]
+    assert len(packed["images"]) == 1
+    assert packed["doc_ids"] == ["t-high", "img"]
+    assert packed["scores"] == [0.9, 0.5]
+    assert packed["packing"]["texts_dropped"] == 1
+
+
+def test_pack_filters_ids_to_kept_items():
+    texts = [Document(page_content=f"Distinct passage number {n} about topic {n}.") for n in range(3)]
+    duplicate = Document(page_content=texts[0].page_content)
+    parsed = DocumentParser.parse_docs(
+        texts + [duplicate, image(), image()], ["a", "b", "c", "dup", "i1", "i2"], [0.9, 0.8, 0.7, 0.6, 0.5, 0.4],
+    )
+    packed = packer(max_images=1).pack(parsed)
+    assert packed["doc_ids"] == ["a", "b", "c", "i1"]
+    assert packed["scores"] == [0.9, 0.8, 0.7, 0.5]
+    assert packed["packing"]["duplicates_dropped"] == 1
+    assert packed["packing"]["images_dropped"] == 1
+
+
+def test_pack_sends_captioned_images_as_text_in_caption_mode():
+    parsed = DocumentParser.parse_docs([image("A confusion matrix"), image()], ["cap", "raw"], [0.9, 0.8])
+    packed = packer(max_images=0).pack(parsed, image_mode="caption")
+    assert packed["doc_ids"] == ["cap"]
+    assert packed["packing"]["images_as_captions"] == 1
+    assert packed["image_mode"] == "caption"
+
+
+def test_pack_charges_auto_detail_images_as_high_detail():
+    parsed = DocumentParser.parse_docs(
+        [Document(page_content="A short passage about decision trees."), image(), image()],
+        ["text", "i1", "i2"], [0.9, 0.8, 0.7],
+    )
+    packed = packer(token_budget=1000, image_detail="auto").pack(parsed)
+    # One 765-token image fits beside the text; a second one does not.
+    assert packed["doc_ids"] == ["text", "i1"]
+    assert packed["packing"]["images_dropped"] == 1
+    assert packed["packing"]["tokens_used"] > 765
+    assert packed["packing"]["image_detail"] == "auto"
@@ -0,0 +1,53 @@
+import pytest
+
+from rag_components import prompt_builder
+from rag_components.context_packer import TokenCounter
+from rag_components.conversation import REUSE, REWRITE, STANDALONE, ConversationalRAG, ConversationMemory
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """The history passed to every prompt that gets built."""
+    seen = []
+    build_prompt = prompt_builder.PromptBuilder.build_prompt
+
+    def recording(context, question, history=None):
+        seen.append(history)
+        return build_prompt(context, question, history)
+
+    monkeypatch.setattr(prompt_builder.PromptBuilder, "build_prompt", staticmethod(recording))
+    return seen
+
+
+@pytest.fixture
+def conversation(store_config, ingest):
+    ingest("intro", "trees")
+    store_config.ANSWER_CACHE_ENABLED = True
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    memory = ConversationMemory(token_budget=200, token_counter=TokenCounter("gpt-4o-mini", estimate_only=True))
+    return ConversationalRAG(RAGChainManager(loader), memory, rewrite_mode="heuristic")
+
+
+def test_history_reaches_the_prompt_on_every_route(conversation, prompts):
+    routes = []
+    for question in ["What is concept learning?", "What about its hypothesis space?", "Explain that further",
+                     "How do decision trees classify instances?"]:
+        routes.append(conversation.invoke_with_context(question)["conversation"]["route"])
+    assert routes == [STANDALONE, REWRITE, REUSE, STANDALONE]
+    assert prompts[0] is None
+    assert all(history and "concept learning" in history for history in prompts[1:])
+    assert len(prompts) == 4
+
+
+def test_answers_with_history_skip_the_answer_cache(conversation, prompts):
+    manager = conversation.manager
+    conversation.invoke_with_context("What is concept learning?")
+    events = list(conversation.stream("How do decision trees classify instances?"))
+    assert events[0]["conversation"]["route"] == STANDALONE
+    assert prompts[-1] and "concept learning" in prompts[-1]
+    # Only the first turn, asked without history, was cached.
+    assert manager.answer_cache.stats()["entries"] == 1
+    assert manager.invoke_with_context("What is concept learning?")["timings"].get("cache_lookup") is not None
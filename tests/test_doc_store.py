@@ -0,0 +1,65 @@
+import os
+
+from langchain.schema.document import Document
+
+from rag_components.doc_store import MmapDocStore
+from rag_components.image_record import ImageRecord
+
+
+def values_size(store):
+    return os.path.getsize(os.path.join(store.path, MmapDocStore.VALUES_FILE))
+
+
+def test_round_trip_survives_reopening(tmp_path):
+    path = str(tmp_path / "docstore")
+    store = MmapDocStore(path)
+    image = ImageRecord(b"\x89PNG\r\n\x1a\nfake", "image/png", metadata={"page": 3})
+    store.mset([("text", Document(page_content="alpha", metadata={"page": 1})), ("image", image)])
+    store.close()
+
+    assert MmapDocStore.exists(path)
+    reopened = MmapDocStore(path)
+    text, restored, missing = reopened.mget(["text", "image", "missing"])
+    assert text.page_content == "alpha" and text.metadata == {"page": 1}
+    assert restored.data == image.data and restored.metadata == {"page": 3}
+    assert missing is None
+    assert sorted(reopened.yield_keys()) == ["image", "text"]
+    assert list(reopened.yield_keys(prefix="im")) == ["image"]
+    assert len(reopened) == 2
+    reopened.close()
+
+
+def test_overwrite_and_delete(tmp_path):
+    store = MmapDocStore(str(tmp_path / "docstore"))
+    store.mset([("a", "first"), ("b", "kept")])
+    store.mset([("a", "second")])
+    store.mdelete(["b", "never-stored"])
+    assert store.mget(["a", "b"]) == ["second", None]
+    assert len(store) == 1
+    store.close()
+
+
+def test_compact_reclaims_dead_space_and_keeps_live_records(tmp_path):
+    path = str(tmp_path / "docstore")
+    store = MmapDocStore(path)
+    store.mset([(f"doc-{n}", "x" * 1000) for n in range(10)])
+    store.mdelete([f"doc-{n}" for n in range(8)])
+    store.mset([("doc-9", "replaced")])
+    before = values_size(store)
+    store.compact()
+    assert values_size(store) < before / 4
+    assert store.mget(["doc-8", "doc-9", "doc-0"]) == ["x" * 1000, "replaced", None]
+    store.close()
+
+    reopened = MmapDocStore(path)
+    assert sorted(reopened.yield_keys()) == ["doc-8", "doc-9"]
+    assert reopened.mget(["doc-9"]) == ["replaced"]
+    reopened.close()
+
+
+def test_empty_store_opens_and_compacts(tmp_path):
+    store = MmapDocStore(str(tmp_path / "docstore"))
+    assert store.mget(["a"]) == [None]
+    store.compact()
+    assert len(store) == 0
+    store.close()
@@ -0,0 +1,26 @@
+from langchain.schema.document import Document
+
+from rag_components.document_parser import DocumentParser
+from rag_components.image_record import ImageRecord
+
+
+def image():
+    return ImageRecord(b"\x89PNG\r\n\x1a\nfake", "image/png")
+
+
+def test_parse_docs_aligns_ids_and_scores_with_texts_then_images():
+    docs = [image(), Document(page_content="alpha"), "plain text", image()]
+    parsed = DocumentParser.parse_docs(docs, ["i1", "t1", "t2", "i2"], [0.9, 0.8, 0.7, 0.6])
+    assert [doc.page_content for doc in parsed["texts"]] == ["alpha", "plain text"]
+    assert len(parsed["images"]) == 2
+    assert parsed["doc_ids"] == ["t1", "t2", "i1", "i2"]
+    assert parsed["scores"] == [0.8, 0.7, 0.9, 0.6]
+    items = parsed["texts"] + parsed["images"]
+    assert [item.metadata["doc_id"] for item in items] == parsed["doc_ids"]
+
+
+def test_parse_docs_does_not_mutate_shared_documents():
+    doc = Document(page_content="alpha", metadata={"source": "notes.pdf"})
+    parsed = DocumentParser.parse_docs([doc], ["t1"], [0.5])
+    assert parsed["texts"][0].metadata == {"source": "notes.pdf", "doc_id": "t1", "score": 0.5}
+    assert doc.metadata == {"source": "notes.pdf"}
@@ -0,0 +1,47 @@
+from rag_components.embedding_cache import CachedEmbeddings, SQLiteEmbeddingCache
+from rag_components.fake_models import HashingFakeEmbeddings
+
+
+class CountingEmbeddings(HashingFakeEmbeddings):
+    def __init__(self):
+        super().__init__(size=8)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_repeated_texts_are_embedded_and_counted_once(tmp_path):
+    underlying = CountingEmbeddings()
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"))
+    embeddings = CachedEmbeddings(underlying, cache, "model")
+    first = embeddings.embed_documents(["a", "b", "a"])
+    assert underlying.embedded == ["a", "b"]
+    assert first[0] == first[2]
+    assert cache.stats()["misses"] == 2
+
+    second = embeddings.embed_documents(["a", "a", "c"])
+    assert second[:2] == [first[0], first[0]]
+    assert underlying.embedded == ["a", "b", "c"]
+    assert cache.hits == 1 and cache.misses == 3
+
+
+def test_lookups_do_not_commit(tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"), flush_seconds=3600)
+    cache.put_many("model", ["a"], [[1.0, 2.0]])
+    changes = cache._conn.total_changes
+    for _ in range(5):
+        assert cache.get_many("model", ["a"]) == [[1.0, 2.0]]
+    assert cache._conn.total_changes == changes
+    cache.flush()
+    assert cache._conn.total_changes == changes + 1
+
+
+def test_eviction_sees_buffered_access_times(tmp_path):
+    cache = SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=2, flush_seconds=3600)
+    cache.put_many("model", ["old"], [[1.0]])
+    cache.put_many("model", ["newer"], [[2.0]])
+    cache.get_many("model", ["old"])  # now the most recently used
+    cache.put_many("model", ["newest"], [[3.0]])
+    assert cache.get_many("model", ["old", "newer", "newest"]) == [[1.0], None, [3.0]]
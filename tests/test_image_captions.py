@@ -0,0 +1,114 @@
+import hashlib
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from conftest import make_pages
+from rag_components.image_captions import ImageCaptioner, ImagePolicy, SQLiteCaptionCache
+from rag_components.image_record import ImageRecord
+
+
+def image(tag, width=400, height=300):
+    return ImageRecord(b"\x89PNG\r\n\x1a\n" + tag.encode(), "image/png", width=width, height=height)
+
+
+class CaptioningModel:
+    """Chat model stand-in: captions an image by a hash of its data URL, failing for the image `failing`."""
+
+    def __init__(self, failing=None):
+        self.failing_url = failing.thumbnail_data_url() if failing is not None else None
+        self.calls = 0
+
+    def __call__(self, messages):
+        self.calls += 1
+        url = messages[0].content[1]["image_url"]["url"]
+        if url == self.failing_url:
+            raise RuntimeError("vision call failed")
+        return f"A figure  {hashlib.sha1(url.encode()).hexdigest()[:8]}\n"
+
+    def captioner(self, cache=None, **kwargs):
+        return ImageCaptioner(RunnableLambda(self), "test-model", cache, **kwargs)
+
+
+@pytest.mark.parametrize("question, mode", [
+    ("What colour is the decision boundary?", "pixels"),
+    ("What does the learning curve look like?", "pixels"),
+    ("Read the exact values off the plot in figure 3", "pixels"),
+    ("Which label is highest in the bar chart?", "pixels"),
+    ("What does figure 3 show?", "caption"),
+    ("Explain the bias-variance trade-off", "caption"),
+])
+def test_auto_policy_sends_pixels_only_for_visual_questions(question, mode):
+    assert ImagePolicy("auto").decide(question) == mode
+
+
+def test_fixed_policies_ignore_the_question():
+    assert ImagePolicy("caption").decide("What colour is the boundary?") == "caption"
+    assert ImagePolicy("pixels").decide("Explain the bias-variance trade-off") == "pixels"
+
+
+def test_small_and_stretched_images_are_not_worth_captioning():
+    captioner = CaptioningModel().captioner(min_side=32, max_aspect=10.0)
+    assert captioner.worth_captioning(image("figure", 400, 300))
+    assert not captioner.worth_captioning(image("bullet", 16, 16))
+    assert not captioner.worth_captioning(image("rule", 800, 40))  # 20:1
+    assert captioner.worth_captioning(image("tall figure", 60, 500))
+    assert captioner.worth_captioning(ImageRecord(b"\x89PNG\r\n\x1a\nunknown", "image/png"))  # no size known
+
+
+def test_captions_are_made_once_per_distinct_image_and_skip_decorations():
+    model = CaptioningModel()
+    captions = model.captioner(min_side=32, max_aspect=10.0).caption(
+        [image("a"), image("b"), image("a"), image("rule", 800, 40)])
+    assert model.calls == 2
+    assert captions[0] == captions[2] and captions[0] != captions[1]
+    assert captions[0].startswith("A figure ") and "  " not in captions[0] and not captions[0].endswith("\n")
+    assert captions[3] is None
+
+
+def test_failed_captions_leave_the_image_uncaptioned_and_are_retried(tmp_path):
+    cache = SQLiteCaptionCache(str(tmp_path / "captions.sqlite"))
+    failing = CaptioningModel(failing=image("bad"))
+    captions = failing.captioner(cache).caption([image("good"), image("bad")])
+    assert captions[0] is not None and captions[1] is None
+    assert len(cache) == 1
+    retry = CaptioningModel()
+    assert retry.captioner(cache).caption([image("good"), image("bad")])[1] is not None
+    assert retry.calls == 1
+
+
+def test_caption_cache_survives_reopening_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "captions.sqlite")
+    first = CaptioningModel()
+    captions = first.captioner(SQLiteCaptionCache(path)).caption([image("a"), image("b")])
+    second = CaptioningModel()
+    assert second.captioner(SQLiteCaptionCache(path)).caption([image("b"), image("a")]) == captions[::-1]
+    assert second.calls == 0
+    other_model = ImageCaptioner(RunnableLambda(second), "other-model", SQLiteCaptionCache(path))
+    other_model.caption([image("a")])
+    assert second.calls == 1
+
+
+def test_reingestion_reuses_cached_captions(store_config, monkeypatch, tmp_path):
+    from vector_loader import PDFIngestionPipeline
+
+    def pages():
+        result = make_pages("intro", "trees")
+        for n, page in enumerate(result):
+            record = image(f"figure {n}")
+            page["images"] = [{"name": f"figure-{n}.png", "data": record.data, "record": record}]
+        return result
+
+    cache_path = str(tmp_path / "captions.sqlite")
+    model = CaptioningModel()
+
+    def ingest(**kwargs):
+        pipeline = PDFIngestionPipeline(store_config, max_workers=1,
+                                        captioner=model.captioner(SQLiteCaptionCache(cache_path)))
+        monkeypatch.setattr(pipeline, "extract", lambda pdf_path: pages())
+        return pipeline.run("notes.pdf", **kwargs)
+
+    first = ingest()
+    assert first["images_captioned"] == 2 and model.calls == 2
+    rebuilt = ingest(rebuild=True)
+    assert rebuilt["images_captioned"] == 2 and model.calls == 2
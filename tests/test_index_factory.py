@@ -0,0 +1,96 @@
+import faiss
+import numpy as np
+
+from rag_components.index_factory import (MIN_POINTS_PER_CENTROID, RescoringIndex, build_index, compression_report,
+                                          factory_string, index_type_of, load_exact_vectors, reconstruct_vectors,
+                                          set_search_params, write_exact_vectors)
+
+
+def vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_small_corpora_fall_back_to_a_flat_index():
+    built = build_index(vectors(50), "hnsw", {"min_vectors": 100})
+    assert built["meta"]["index_type"] == "flat"
+    assert built["meta"]["requested_index_type"] == "hnsw"
+    assert built["meta"]["trained_on"] == 0
+    assert index_type_of(built["index"]) == "flat"
+    assert built["index"].ntotal == 50
+
+
+def test_nlist_is_clamped_to_the_training_set():
+    assert factory_string("ivf_flat", 16, 10 * MIN_POINTS_PER_CENTROID, {"nlist": 1024}) == "IVF10,Flat"
+    assert factory_string("ivf_flat", 16, 5, {"nlist": 1024}) == "IVF1,Flat"
+    assert factory_string("ivf_flat", 16, 100_000, {"nlist": 64}) == "IVF64,Flat"
+    # PQ sub-quantizers divide the dimension; code bits shrink with the training set.
+    assert factory_string("pq", 48, 4 * MIN_POINTS_PER_CENTROID, {"pq_m": 64, "pq_nbits": 8}) == "PQ48x2"
+
+
+def test_ivf_index_trains_on_a_sample_and_clamps_nprobe():
+    built = build_index(vectors(400), "ivf_flat", {"nlist": 1024, "train_sample_size": 200, "min_vectors": 100})
+    index = built["index"]
+    assert built["meta"]["factory"] == f"IVF{200 // MIN_POINTS_PER_CENTROID},Flat"
+    assert built["meta"]["trained_on"] == 200
+    assert index.ntotal == 400
+    assert set_search_params(index, nprobe=100) == {"nprobe": faiss.downcast_index(index).nlist}
+    assert set_search_params(index, nprobe=2, ef_search=64) == {"nprobe": 2}
+
+
+def test_ef_search_applies_only_to_hnsw():
+    built = build_index(vectors(200), "hnsw", {"hnsw_m": 8, "ef_construction": 40, "min_vectors": 100})
+    index = built["index"]
+    assert index_type_of(index) == "hnsw"
+    assert set_search_params(index, nprobe=8, ef_search=128) == {"efSearch": 128}
+    assert faiss.downcast_index(index).hnsw.efSearch == 128
+    assert set_search_params(build_index(vectors(10), "flat", {})["index"], nprobe=8, ef_search=128) == {}
+
+
+def test_rescoring_orders_candidates_by_exact_distance():
+    data = vectors(1000, dim=32)
+    index = build_index(data, "pq", {"pq_m": 4, "pq_nbits": 4, "min_vectors": 0})["index"]
+    queries = data[:20]
+    exact = faiss.IndexFlatL2(32)
+    exact.add(data)
+    _, truth = exact.search(queries, 5)
+
+    distances, labels = RescoringIndex(index, data, factor=8).search(queries, 5)
+    assert (np.diff(distances, axis=1) >= 0).all()
+    expected = ((data[labels] - queries[:, None, :]) ** 2).sum(axis=2)
+    assert np.allclose(distances, expected, rtol=1e-4)
+    # Each stored vector is its own nearest neighbour once the codes are re-scored.
+    assert (labels[:, 0] == np.arange(20)).all()
+
+    def recall(found):
+        return sum(len(set(a) & set(b)) for a, b in zip(found.tolist(), truth.tolist())) / truth.size
+
+    assert recall(labels) > recall(index.search(queries, 5)[1])
+
+
+def test_rescoring_pads_when_fewer_than_k_vectors_exist():
+    data = vectors(3)
+    index = build_index(data, "fp16", {})["index"]
+    distances, labels = RescoringIndex(index, data).search(data[:1], 5)
+    assert labels[0, 0] == 0 and sorted(labels[0].tolist()[:3]) == [0, 1, 2]
+    assert labels[0].tolist()[3:] == [-1, -1]
+    assert np.isinf(distances[0, 3:]).all()
+
+
+def test_compression_report_fields():
+    data = vectors(600, dim=32)
+    index = build_index(data, "sq8", {})["index"]
+    report = compression_report(index, data, k=10, queries=50, rescore_factor=4)
+    assert set(report) == {"float32_bytes", "index_bytes", "memory_saved", "recall@10", "rescored_recall@10"}
+    assert report["float32_bytes"] == 600 * 32 * 4
+    assert 0.6 < report["memory_saved"] < 0.8  # one byte per dimension instead of four
+    assert 0 < report["recall@10"] <= report["rescored_recall@10"] <= 1
+    assert set(compression_report(index, data[:5], k=10)) == {"float32_bytes", "index_bytes", "memory_saved", "recall@5"}
+
+
+def test_lossy_codes_need_the_exact_side_file(tmp_path):
+    data = vectors(200)
+    assert reconstruct_vectors(build_index(data, "sq8", {})["index"]) is None
+    assert np.allclose(reconstruct_vectors(build_index(data, "fp16", {})["index"]), data, atol=1e-2)
+    write_exact_vectors(str(tmp_path), data)
+    assert np.array_equal(load_exact_vectors(str(tmp_path), ntotal=200), data)
+    assert load_exact_vectors(str(tmp_path), ntotal=199) is None
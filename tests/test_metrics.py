@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+from rag_components.metrics import Histogram, MetricsCallbackHandler, MetricsRegistry
+
+
+def series(text, name):
+    """{sample line name+labels: value} for one metric family in Prometheus text."""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line.startswith(name) and not line.startswith("#")}
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.1, 0.5, 5.0, 50.0):
+        histogram.observe(value)
+    assert histogram.bucket_counts == [2, 3, 4]
+    assert histogram.count == 5 and histogram.sum == 55.65
+    assert histogram.percentile(50) == 0.5
+    assert Histogram().percentile(99) == 0.0
+
+
+def test_counters_are_kept_per_label_set():
+    registry = MetricsRegistry()
+    registry.inc("rag_errors_total", error="Timeout")
+    registry.inc("rag_errors_total", 2, error="Timeout")
+    registry.inc("rag_errors_total", error="RateLimit")
+    registry.inc("rag_requests_total", route="ask", method="POST")
+    registry.inc("rag_requests_total", method="POST", route="ask")  # label order does not matter
+    counters = registry.to_dict()["counters"]
+    assert counters == {
+        'rag_errors_total{error="Timeout"}': 3.0,
+        'rag_errors_total{error="RateLimit"}': 1.0,
+        'rag_requests_total{method="POST",route="ask"}': 2.0,
+    }
+
+
+def test_prometheus_exposition():
+    registry = MetricsRegistry()
+    registry.observe("rag_stage_duration_seconds", 0.02, "Duration of each RAG pipeline stage.", stage="retrieval")
+    registry.observe("rag_stage_duration_seconds", 3.0, stage="retrieval")
+    registry.inc("rag_llm_errors_total", 1, "LLM calls that raised.", error="Timeout")
+    registry.set_gauge("rag_index_chunks", 42, "Chunks in the index.")
+    registry.register_gauge("rag_answer_cache_hit_rate", lambda: 0.25, "Answer cache hit rate.")
+    text = registry.render_prometheus()
+
+    assert "# HELP rag_stage_duration_seconds Duration of each RAG pipeline stage.\n" in text
+    assert "# TYPE rag_stage_duration_seconds histogram\n" in text
+    buckets = series(text, "rag_stage_duration_seconds_bucket")
+    assert buckets['rag_stage_duration_seconds_bucket{stage="retrieval",le="0.01"}'] == 0
+    assert buckets['rag_stage_duration_seconds_bucket{stage="retrieval",le="0.025"}'] == 1
+    assert buckets['rag_stage_duration_seconds_bucket{stage="retrieval",le="5.0"}'] == 2
+    assert buckets['rag_stage_duration_seconds_bucket{stage="retrieval",le="+Inf"}'] == 2
+    assert series(text, "rag_stage_duration_seconds_count") == {'rag_stage_duration_seconds_count{stage="retrieval"}': 2}
+    assert series(text, "rag_stage_duration_seconds_sum") == {'rag_stage_duration_seconds_sum{stage="retrieval"}': 3.02}
+
+    assert "# TYPE rag_llm_errors_total counter\n" in text
+    assert series(text, "rag_llm_errors_total") == {'rag_llm_errors_total{error="Timeout"}': 1}
+    assert "# TYPE rag_index_chunks gauge\n" in text
+    assert series(text, "rag_index_chunks") == {"rag_index_chunks": 42}
+    assert series(text, "rag_answer_cache_hit_rate") == {"rag_answer_cache_hit_rate": 0.25}
+    assert text.endswith("\n")
+
+
+def test_a_failing_gauge_callback_does_not_break_the_scrape():
+    registry = MetricsRegistry()
+    registry.register_gauge("rag_broken", lambda: 1 / 0)
+    registry.set_gauge("rag_fine", 1)
+    text = registry.render_prometheus()
+    assert series(text, "rag_fine") == {"rag_fine": 1}
+    assert not series(text, "rag_broken")
+
+
+def test_callback_handler_records_llm_latency_and_usage():
+    registry = MetricsRegistry()
+    handler = MetricsCallbackHandler(registry)
+    run_id = uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id)
+    handler.on_llm_new_token("a", run_id=run_id)
+    handler.on_llm_new_token("b", run_id=run_id)
+    handler.on_llm_end(SimpleNamespace(llm_output={"token_usage": {"prompt_tokens": 10, "completion_tokens": 2}},
+                                       generations=[]), run_id=run_id)
+    metrics = registry.to_dict()
+    assert metrics["histograms"]["rag_llm_time_to_first_token_seconds"]["count"] == 1
+    assert metrics["histograms"]['rag_stage_duration_seconds{stage="llm"}']["count"] == 1
+    assert metrics["counters"] == {"rag_llm_prompt_tokens_total": 10, "rag_llm_completion_tokens_total": 2}
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from rag_components import openai_client
+from rag_components.metrics import MetricsRegistry
+from rag_components.openai_client import CircuitBreaker, CircuitOpenError, OpenAIClientLayer, TokenBucket, backoff_delay
+
+URL = "https://api.test/v1/chat/completions"
+# The fixture below replaces time.sleep module-wide; tests that must really wait use this.
+real_sleep = time.sleep
+
+
+def chat_body(content="hi", **extra):
+    return {"model": "gpt-test", "messages": [{"role": "user", "content": content}], **extra}
+
+
+def ok(request, text="ok"):
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}], "usage": {"total_tokens": 7}})
+
+
+def make_layer(handler, **overrides):
+    settings = dict(
+        max_retries=3, backoff_base_seconds=0.001, backoff_max_seconds=0.002,
+        circuit_failure_threshold=2, circuit_reset_seconds=0.05, metrics=MetricsRegistry(),
+    )
+    settings.update(overrides)
+    transport = httpx.MockTransport(handler)
+    return OpenAIClientLayer(transport=transport, async_transport=transport, **settings)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the transport's sleeps instead of waiting them out."""
+    recorded = []
+    monkeypatch.setattr(openai_client.time, "sleep", recorded.append)
+    return recorded
+
+
+def test_retries_retryable_status_then_succeeds(sleeps):
+    statuses = iter([500, 503, 200])
+
+    def handler(request):
+        status = next(statuses)
+        return ok(request) if status == 200 else httpx.Response(status)
+
+    layer = make_layer(handler, circuit_failure_threshold=5)
+    response = layer.http_client.post(URL, json=chat_body())
+    assert response.status_code == 200
+    stats = layer.stats()
+    assert stats["requests"] == 3 and stats["retries"] == 2 and stats["circuit"] == CircuitBreaker.CLOSED
+    assert len(sleeps) == 2
+
+
+def test_gives_up_after_max_retries_and_returns_last_response(sleeps):
+    layer = make_layer(lambda request: httpx.Response(502), max_retries=2, circuit_failure_threshold=10)
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 502
+    assert layer.stats()["requests"] == 3
+    assert layer.stats()["failures"] == 1
+
+
+def test_client_errors_are_not_retried(sleeps):
+    calls = []
+    layer = make_layer(lambda request: calls.append(1) or httpx.Response(400))
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 400
+    assert len(calls) == 1 and not sleeps
+
+
+def test_retry_after_header_sets_the_minimum_delay(sleeps):
+    responses = iter([httpx.Response(429, headers={"retry-after": "3"}), None])
+    layer = make_layer(lambda request: next(responses) or ok(request))
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 200
+    assert sleeps == [3.0]
+
+
+def test_retry_after_ms_header_and_backoff_cap():
+    assert backoff_delay(10, base=0.5, cap=2.0) <= 2.0
+    assert backoff_delay(0, base=0.5, cap=2.0, retry_after=5.0) == 5.0
+    response = httpx.Response(429, headers={"retry-after-ms": "250"})
+    assert openai_client.retry_after_seconds(response) == pytest.approx(0.25)
+
+
+def test_network_errors_are_retried(sleeps):
+    attempts = []
+
+    def handler(request):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return ok(request)
+
+    layer = make_layer(handler)
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 200
+    assert layer.stats()["retries"] == 1
+
+
+def test_identical_requests_in_flight_are_coalesced():
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        return ok(request, text="shared")
+
+    layer = make_layer(handler)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(layer.http_client.post(URL, json=chat_body()).json()))
+               for _ in range(3)]
+    threads[0].start()
+    assert entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while layer.stats()["coalesced"] < 2 and time.monotonic() < deadline:
+        real_sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert layer.stats()["coalesced"] == 2
+    assert [result["choices"][0]["message"]["content"] for result in results] == ["shared"] * 3
+
+
+def test_different_or_streaming_requests_are_not_coalesced():
+    calls = []
+    layer = make_layer(lambda request: calls.append(1) or ok(request))
+    layer.http_client.post(URL, json=chat_body("a"))
+    layer.http_client.post(URL, json=chat_body("b"))
+    layer.http_client.post(URL, json=chat_body("a", stream=True))
+    assert len(calls) == 3 and layer.stats()["coalesced"] == 0
+
+
+def test_async_requests_are_coalesced_within_a_loop():
+    calls = []
+
+    async def handler(request):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ok(request, text="async")
+
+    layer = make_layer(handler)
+
+    async def main():
+        return await asyncio.gather(*[layer.http_async_client.post(URL, json=chat_body()) for _ in range(4)])
+
+    responses = asyncio.run(main())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len(calls) == 1 and layer.stats()["coalesced"] == 3
+
+
+def test_token_bucket_waits_for_the_debt_to_refill():
+    bucket = TokenBucket(per_minute=2)
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == pytest.approx(30.0, abs=0.5)
+    # A reservation larger than the bucket waits for a full bucket, not forever.
+    assert TokenBucket(per_minute=60).reserve(1000) == pytest.approx(0.0, abs=0.01)
+
+
+def test_limiter_delays_requests_beyond_the_rpm_limit(sleeps):
+    layer = make_layer(ok, rpm=1, coalesce=False)
+    layer.http_client.post(URL, json=chat_body())
+    layer.http_client.post(URL, json=chat_body())
+    assert len(sleeps) == 1 and sleeps[0] == pytest.approx(60.0, abs=1.0)
+    assert layer.stats()["rate_limit_wait_seconds"] == pytest.approx(60.0, abs=1.0)
+
+
+def test_limiter_buckets_are_per_model(sleeps):
+    layer = make_layer(ok, rpm=1, coalesce=False)
+    layer.http_client.post(URL, json=chat_body())
+    layer.http_client.post(URL, json={**chat_body(), "model": "other-model"})
+    assert not sleeps
+
+
+def test_token_usage_replaces_the_estimate():
+    layer = make_layer(ok, tpm=1000, coalesce=False)
+    layer.http_client.post(URL, json={**chat_body(), "max_tokens": 500})
+    _, tokens = layer.limiter._buckets_for("gpt-test")
+    # 500 + a few prompt tokens were reserved; the response reported 7.
+    assert tokens.tokens == pytest.approx(1000 - 7, abs=1)
+
+
+def open_circuit(layer):
+    for _ in range(2):
+        layer.http_client.post(URL, json=chat_body())
+    assert layer.breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_good_trial(sleeps):
+    healthy = threading.Event()
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return ok(request) if healthy.is_set() else httpx.Response(500)
+
+    layer = make_layer(handler, max_retries=0)
+    open_circuit(layer)
+    with pytest.raises(CircuitOpenError):
+        layer.http_client.post(URL, json=chat_body())
+    assert len(calls) == 2
+    healthy.set()
+    real_sleep(0.06)
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 200
+    assert layer.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_the_circuit(sleeps):
+    layer = make_layer(lambda request: httpx.Response(500), max_retries=0)
+    open_circuit(layer)
+    real_sleep(0.06)
+    layer.http_client.post(URL, json=chat_body())
+    assert layer.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        layer.http_client.post(URL, json=chat_body())
+
+
+def test_rate_limited_trial_does_not_wedge_the_circuit(sleeps):
+    outcomes = iter([500, 500, 429, 200])
+    layer = make_layer(lambda request: httpx.Response(next(outcomes)), max_retries=0)
+    open_circuit(layer)
+    real_sleep(0.06)
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 429
+    assert layer.breaker.state == CircuitBreaker.HALF_OPEN
+    # The next request becomes the trial instead of being rejected forever.
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 200
+    assert layer.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_trial_that_raises_unexpectedly_is_released(sleeps):
+    outcomes = iter(["500", "500", "boom", "200"])
+
+    def handler(request):
+        outcome = next(outcomes)
+        if outcome == "boom":
+            raise ValueError("handler bug")
+        return httpx.Response(int(outcome), json={})
+
+    layer = make_layer(handler, max_retries=0)
+    open_circuit(layer)
+    real_sleep(0.06)
+    with pytest.raises(ValueError):
+        layer.http_client.post(URL, json=chat_body())
+    assert layer.http_client.post(URL, json=chat_body()).status_code == 200
+    assert layer.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_cancelled_trial_is_released():
+    async def handler(request):
+        await asyncio.sleep(10)
+        return ok(request)
+
+    layer = make_layer(handler, max_retries=0)
+    breaker = layer.breaker
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - 1
+
+    async def main():
+        task = asyncio.ensure_future(layer.http_async_client.post(URL, content=json.dumps(chat_body())))
+        await asyncio.sleep(0.02)
+        assert breaker._trial_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.state == CircuitBreaker.HALF_OPEN and not breaker._trial_in_flight
+    breaker.before_request()  # admitted as the next trial
@@ -0,0 +1,95 @@
+from langchain.schema.document import Document
+
+from config import AppConfig
+from rag_components.image_record import ImageRecord
+from rag_components.reranker import LexicalOverlapScorer, Reranker
+
+
+class FixedScorer:
+    """Scores each text by a table lookup."""
+
+    name = "fixed"
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score(self, question, texts):
+        return [self.scores[text] for text in texts]
+
+
+def candidates(*texts):
+    """(doc_id, retrieval score, doc) in retrieval order, with falling retrieval scores."""
+    return [(f"id-{text}", 1.0 - n / 10, Document(page_content=text)) for n, text in enumerate(texts)]
+
+
+def kept_ids(kept):
+    return [doc_id for doc_id, _, _ in kept]
+
+
+def test_min_k_are_kept_even_below_the_cutoffs():
+    reranker = Reranker(FixedScorer({"a": 0.05, "b": 0.01, "c": 0.001}), min_k=2, max_k=6)
+    kept, report = reranker.rerank("q", candidates("a", "b", "c"))
+    assert kept_ids(kept) == ["id-a", "id-b"]
+    assert report["kept"] == 2 and report["candidates"] == 3
+
+
+def test_max_k_bounds_what_is_kept():
+    scores = {text: 0.9 for text in "abcdefgh"}
+    kept, report = Reranker(FixedScorer(scores), min_k=2, max_k=4).rerank("q", candidates(*"abcdefgh"))
+    assert len(kept) == 4 and report["kept"] == 4
+
+
+def test_candidates_are_reordered_by_reranker_score():
+    reranker = Reranker(FixedScorer({"a": 0.3, "b": 0.9, "c": 0.6}), min_k=1, max_k=6, relative_cutoff=0.0)
+    kept, report = reranker.rerank("q", candidates("a", "b", "c"))
+    assert kept_ids(kept) == ["id-b", "id-c", "id-a"]
+    assert [score for _, score, _ in kept] == [0.9, 0.6, 0.3]
+    assert report["top_score"] == 0.9 and report["cutoff_score"] == 0.3
+
+
+def test_relative_cutoff_drops_parents_far_below_the_best():
+    scores = {"a": 0.9, "b": 0.8, "c": 0.5, "d": 0.4, "e": 0.3}
+    kept, _ = Reranker(FixedScorer(scores), min_k=2, max_k=6, score_cutoff=0.2, relative_cutoff=0.5).rerank(
+        "q", candidates(*"abcde"))
+    # 0.4 < 0.5 * 0.9, so ranking stops there even though 0.4 clears the absolute cutoff.
+    assert kept_ids(kept) == ["id-a", "id-b", "id-c"]
+
+
+def test_absolute_cutoff_applies_beyond_min_k():
+    scores = {"a": 0.3, "b": 0.25, "c": 0.19}
+    kept, _ = Reranker(FixedScorer(scores), min_k=1, max_k=6, score_cutoff=0.2, relative_cutoff=0.5).rerank(
+        "q", candidates(*"abc"))
+    assert kept_ids(kept) == ["id-a", "id-b"]
+
+
+def test_uncaptioned_images_pass_through_when_ranked_within_max_k():
+    early = ImageRecord(b"\x89PNG\r\n\x1a\nearly", "image/png")
+    late = ImageRecord(b"\x89PNG\r\n\x1a\nlate", "image/png")
+    captioned = ImageRecord(b"\x89PNG\r\n\x1a\ncap", "image/png", metadata={"caption": "a bar chart"})
+    items = [
+        ("img-early", 0.95, early),
+        ("id-a", 0.9, Document(page_content="a")),
+        ("img-cap", 0.85, captioned),
+        ("id-b", 0.8, Document(page_content="b")),
+        ("img-late", 0.7, late),
+    ]
+    scorer = FixedScorer({"a": 0.9, "a bar chart": 0.2, "b": 0.8})
+    kept, report = Reranker(scorer, min_k=1, max_k=4, relative_cutoff=0.5).rerank("q", items)
+    # The early image keeps its retrieval score; the late one is beyond max_k; the captioned one is scored.
+    assert kept_ids(kept) == ["id-a", "id-b", "img-early"]
+    assert kept[-1][1] == 0.95
+    assert report["kept"] == 3
+
+
+def test_lexical_scorer_prefers_rare_matching_terms():
+    scores = LexicalOverlapScorer().score(
+        "entropy of a split", ["entropy measures impurity of a split", "each split tests one attribute", "priors"])
+    assert scores[0] == 1.0
+    assert 0 < scores[1] < scores[0]
+    assert scores[2] == 0.0
+
+
+def test_lexical_is_the_default_and_needs_no_model():
+    assert AppConfig.RERANKER == "lexical"
+    reranker = Reranker.from_config(AppConfig)
+    assert reranker.scorer.name == "lexical"
@@ -0,0 +1,105 @@
+import os
+
+from rag_components.collection_manager import CollectionManager
+from rag_components.index_manifest import manifest_path, read_manifest, write_manifest
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+
+def loaded(config):
+    loader = ResourceLoader(config)
+    loader.load_all()
+    return loader
+
+
+def test_reload_swaps_generations_and_closes_the_old_one_once_drained(store_config, ingest):
+    ingest("intro", "trees")
+    loader = loaded(store_config)
+    old = loader.generation
+    assert not loader.reload_if_changed()
+
+    with loader.use_index() as held:
+        assert held is old and old.in_flight == 1
+        version = ingest("intro", "trees", "bayes")["version"]
+        assert loader.reload_if_changed()
+        assert loader.index_version == version and loader.generation is not old
+        # The retrieval holding the old generation can still read from it.
+        assert not old.closed
+        assert held.retriever.docstore.mget([next(held.retriever.docstore.yield_keys())])[0] is not None
+    assert old.closed and old.in_flight == 0
+    assert not loader.generation.closed
+
+    with loader.use_index() as current:
+        assert current.version == version
+        assert current.retriever.vectorstore.index.ntotal > old.retriever.vectorstore.index.ntotal
+
+
+def test_idle_generation_closes_when_retired(store_config, ingest):
+    ingest("intro")
+    loader = loaded(store_config)
+    generation = loader.generation
+    assert generation.wait_drained(timeout=0)
+    generation.acquire()
+    assert not generation.wait_drained(timeout=0.01)
+    generation.retire()
+    assert not generation.closed
+    generation.release()
+    assert generation.closed
+
+
+def test_answers_come_from_the_swapped_in_version(store_config, ingest):
+    ingest("intro")
+    loader = loaded(store_config)
+    manager = RAGChainManager(loader)
+    first = manager.invoke_with_context("What is concept learning?")
+    version = ingest("intro", "trees")["version"]
+    assert loader.reload_if_changed()
+    second = manager.invoke_with_context("How do decision trees classify instances?")
+    assert first["context"]["index_version"] != version
+    assert second["context"]["index_version"] == version
+    assert any("Decision tree" in doc.page_content for doc in second["context"]["texts"])
+
+
+def test_version_built_with_another_embedding_model_is_refused(store_config, ingest):
+    ingest("intro")
+    loader = loaded(store_config)
+    serving = loader.index_version
+    ingest("intro", "trees")
+    path = manifest_path(store_config)
+    write_manifest(path, {**read_manifest(path), "embedding_model": "some-other-model"})
+    assert not loader.reload_if_changed()
+    assert loader.index_version == serving
+    # A refused version is not retried on every poll.
+    assert not loader.reload_if_changed()
+
+
+def test_collection_picks_up_new_and_rebuilt_documents(store_config, ingest, tmp_path):
+    root = str(tmp_path / "collection")
+    collection = CollectionManager(root)
+
+    def add(key, *sections):
+        config = collection.shard_config(store_config, key)()
+        collection.register(key, f"{key}.pdf", ingest(*sections, source=f"{key}.pdf", config=config))
+
+    add("ml", "intro")
+    config_class = type("CollectionConfig", (type(store_config),), {"COLLECTION_PATH": root})
+    loader = loaded(config_class())
+    manager = RAGChainManager(loader)
+    manager.invoke_with_context("What is concept learning?")
+    assert loader.collection.loaded_keys() == ["ml"]
+    serving = loader.index_version
+    assert not loader.reload_if_changed()
+
+    add("trees", "trees")
+    assert loader.reload_if_changed()
+    assert set(loader.collection.documents()) == {"ml", "trees"}
+    assert loader.collection.loaded_keys() == ["ml"]  # unchanged shards stay loaded
+    assert loader.index_version != serving
+
+    add("ml", "intro", "bayes")
+    assert loader.reload_if_changed()
+    assert "ml" not in loader.collection.loaded_keys()
+    result = manager.invoke_with_context("What is the maximum a posteriori hypothesis?", documents=["ml"])
+    assert result["context"]["index_version"] == loader.index_version
+    assert any("posteriori" in doc.page_content for doc in result["context"]["texts"])
+    assert os.path.isfile(os.path.join(root, "catalog.json"))
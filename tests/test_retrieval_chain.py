@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from rag_components.fake_models import FakeStreamingChatModel
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+
+QUESTION = "What is concept learning?"
+
+
+@pytest.fixture
+def manager(store_config, ingest):
+    ingest("intro", "trees")
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    return RAGChainManager(loader)
+
+
+def split_events(events):
+    assert "context" in events[0] and "answer" not in events[0]
+    assert all(list(event) == ["answer"] for event in events[1:])
+    return events[0]["context"], [event["answer"] for event in events[1:]]
+
+
+def test_fake_model_streams_the_answer_it_invokes():
+    model = FakeStreamingChatModel()
+    messages = [HumanMessage(content="Context: gradient descent minimises error Question: what?")]
+    tokens = [chunk.content for chunk in model.stream(messages)]
+    assert len(tokens) > 1
+    assert "".join(tokens) == model.invoke(messages).content == "Based on the provided context: gradient descent minimises error"
+
+
+def test_stream_yields_the_context_first_then_the_answer_tokens(manager):
+    context, tokens = split_events(list(manager.stream(QUESTION)))
+    assert context["texts"] and len(context["doc_ids"]) == len(context["texts"]) + len(context["images"])
+    assert len(tokens) > 1
+    assert "".join(tokens) == manager.invoke(QUESTION)
+    assert "".join(tokens).startswith(FakeStreamingChatModel().answer_prefix)
+
+
+def test_astream_matches_stream(manager):
+    async def collect():
+        return [event async for event in manager.astream(QUESTION)]
+
+    context, tokens = split_events(asyncio.run(collect()))
+    streamed_context, streamed_tokens = split_events(list(manager.stream(QUESTION)))
+    assert tokens == streamed_tokens
+    assert context["doc_ids"] == streamed_context["doc_ids"]
+    assert "".join(tokens) == asyncio.run(manager.ainvoke(QUESTION))
+
+
+def test_cached_answer_streams_as_one_event(store_config, ingest):
+    ingest("intro")
+    store_config.ANSWER_CACHE_ENABLED = True
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    manager = RAGChainManager(loader)
+    _, tokens = split_events(list(manager.stream(QUESTION)))
+    cached = list(manager.stream(QUESTION))
+    assert len(cached) == 2 and cached[1]["answer"] == "".join(tokens)
+
+
+def test_invoke_with_context_retrieves_once_and_returns_what_it_used(manager, monkeypatch):
+    calls = []
+    retrieve = manager._retrieve_context
+    monkeypatch.setattr(manager, "_retrieve_context", lambda inputs: calls.append(inputs) or retrieve(inputs))
+    result = manager.invoke_with_context(QUESTION)
+    assert len(calls) == 1
+    context = result["context"]
+    assert result["answer"] and context["texts"]
+    assert context["doc_ids"] == [doc.metadata["doc_id"] for doc in context["texts"] + context["images"]]
+    assert set(result["timings"]) == {"retrieval", "generation", "total"}
+
+
+def test_vector_search_batch_matches_one_search_per_question(manager):
+    vectorstore = manager.retriever.vectorstore
+    questions = [QUESTION, "How are decision trees built?", "Which attribute does a node test?"]
+    vectors = [vectorstore._embed_query(question) for question in questions]
+    batched = manager._vector_search_batch(vectorstore, vectors, {"k": 4})
+    for vector, hits in zip(vectors, batched):
+        single = vectorstore.similarity_search_with_score_by_vector(vector, k=4)
+        assert [doc.page_content for doc, _ in hits] == [doc.page_content for doc, _ in single]
+        assert [score for _, score in hits] == pytest.approx([score for _, score in single], rel=1e-5)
+
+
+def counting_generation(calls, failing=()):
+    """A generation step that records its questions, answers "answer: <question>" and raises for `failing`."""
+    def generate(inputs):
+        calls.append(inputs["question"])
+        if inputs["question"] in failing:
+            raise RuntimeError("rate limited")
+        return f"answer: {inputs['question']}"
+
+    return RunnableLambda(generate)
+
+
+def test_batch_answers_in_input_order_and_deduplicates(manager, monkeypatch):
+    calls = []
+    monkeypatch.setattr(manager, "_generation_chain", counting_generation(calls))
+    questions = ["What is ID3?", "What is concept learning?", "what is id3", "What is ID3?"]
+    results = manager.batch(questions)
+    assert [result["answer"] for result in results] == [
+        "answer: What is ID3?", "answer: What is concept learning?", "answer: What is ID3?", "answer: What is ID3?",
+    ]
+    assert sorted(calls) == ["What is ID3?", "What is concept learning?"]
+    assert all(result["context"]["texts"] and set(result["timings"]) == {"retrieval", "generation", "total"}
+               for result in results)
+
+
+def test_batch_serves_cached_questions_without_generating(store_config, ingest, monkeypatch):
+    ingest("intro", "trees")
+    store_config.ANSWER_CACHE_ENABLED = True
+    loader = ResourceLoader(store_config)
+    loader.load_all()
+    manager = RAGChainManager(loader)
+    cached_answer = manager.invoke(QUESTION)
+    calls = []
+    monkeypatch.setattr(manager, "_generation_chain", counting_generation(calls))
+    results = manager.batch([QUESTION, "How are decision trees built?"])
+    assert calls == ["How are decision trees built?"]
+    assert results[0]["answer"] == cached_answer
+    assert manager.batch([QUESTION, "How are decision trees built?"])[1]["answer"] == "answer: How are decision trees built?"
+    assert len(calls) == 1
+
+
+def test_batch_isolates_a_failing_question(manager, monkeypatch):
+    calls = []
+    monkeypatch.setattr(manager, "_generation_chain", counting_generation(calls, failing={"How are decision trees built?"}))
+    results = manager.batch([QUESTION, "How are decision trees built?", "Which attribute does a node test?"])
+    assert results[0]["answer"] == f"answer: {QUESTION}"
+    assert results[1]["answer"] is None and results[1]["error"] == "RuntimeError: rate limited"
+    assert results[1]["context"]["texts"]
+    assert results[2]["answer"] == "answer: Which attribute does a node test?"
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from rag_components.doc_store import MmapDocStore
+from rag_components.resource_loader import ResourceLoader
+from rag_components.retrieval_chain import RAGChainManager
+from rag_components.shared_index import (
+    CURRENT_FILE, attach_vectorstore, current_version, list_versions, publish_snapshot, resolve_snapshot,
+)
+
+
+@pytest.fixture
+def serving_root(tmp_path):
+    return str(tmp_path / "serving")
+
+
+def shared_config(store_config, serving_root):
+    return type("SharedConfig", (type(store_config),), {"SHARED_INDEX_PATH": serving_root})()
+
+
+def test_publish_then_attach_round_trips_the_index(store_config, ingest, serving_root):
+    ingest("intro", "trees", "bayes")
+    manifest = publish_snapshot(store_config, serving_root)
+    version, path = resolve_snapshot(serving_root)
+    assert version == manifest["version"]
+    assert os.path.isfile(os.path.join(path, "bm25_index.json"))
+    assert MmapDocStore.exists(os.path.join(path, "docstore"))
+
+    embeddings = ResourceLoader(store_config).build_embedding_model()
+    source = FAISS.load_local(store_config.DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
+    attached = attach_vectorstore(path, embeddings)
+    assert attached.index.ntotal == source.index.ntotal == manifest["ntotal"]
+    assert list(attached.index_to_docstore_id.values()) == list(source.index_to_docstore_id.values())
+    query = "Which hypothesis is the most probable given the data?"
+    expected = source.similarity_search_with_score(query, k=3)
+    found = attached.similarity_search_with_score(query, k=3)
+    assert [(doc.page_content, doc.metadata) for doc, _ in found] == [(doc.page_content, doc.metadata) for doc, _ in expected]
+    assert [score for _, score in found] == pytest.approx([score for _, score in expected])
+    with pytest.raises(NotImplementedError):
+        attached.docstore.add({})
+
+
+def test_publishing_unchanged_content_keeps_current(store_config, ingest, serving_root):
+    ingest("intro")
+    first = publish_snapshot(store_config, serving_root)
+    again = publish_snapshot(store_config, serving_root)
+    assert again["version"] == first["version"]
+    assert list_versions(serving_root) == [first["version"]]
+    forced = publish_snapshot(store_config, serving_root, force=True)
+    assert forced["version"] != first["version"]
+    assert current_version(serving_root) == forced["version"]
+
+
+def test_old_snapshots_are_garbage_collected(store_config, ingest, serving_root):
+    published = []
+    for sections in (("intro",), ("intro", "trees"), ("intro", "trees", "bayes")):
+        ingest(*sections)
+        published.append(publish_snapshot(store_config, serving_root, keep=2)["version"])
+    assert list_versions(serving_root) == published[1:]
+    assert current_version(serving_root) == published[-1]
+    assert not os.path.exists(os.path.join(serving_root, CURRENT_FILE + ".tmp"))
+
+
+def test_workers_attach_answer_and_follow_new_snapshots(store_config, ingest, serving_root):
+    ingest("intro")
+    first = publish_snapshot(store_config, serving_root)["version"]
+    loader = ResourceLoader(shared_config(store_config, serving_root))
+    loader.load_all()
+    assert loader.shared_snapshot["version"] == first
+    manager = RAGChainManager(loader)
+    result = manager.invoke_with_context("What is concept learning?")
+    assert result["context"]["texts"] and result["context"]["index_version"] == loader.index_version
+
+    ingest("intro", "trees")
+    second = publish_snapshot(store_config, serving_root)["version"]
+    assert loader.reload_if_changed()
+    assert loader.shared_snapshot["version"] == second
+    result = manager.invoke_with_context("How do decision trees classify instances?")
+    assert any("Decision tree" in doc.page_content for doc in result["context"]["texts"])
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+from langchain.schema.document import Document
+from langchain_community.vectorstores import FAISS
+
+from rag_components.doc_store import MmapDocStore
+from rag_components.index_manifest import manifest_path, read_manifest
+from rag_components.resource_loader import ResourceLoader
+
+
+def load_store(config):
+    """(children by id, parent ids in the docstore) as a fresh load would see them."""
+    vectorstore = FAISS.load_local(config.DB_FAISS_PATH, ResourceLoader(config).build_embedding_model(),
+                                   allow_dangerous_deserialization=True)
+    children = {child_id: vectorstore.docstore.search(child_id) for child_id in vectorstore.index_to_docstore_id.values()}
+    assert vectorstore.index.ntotal == len(children)
+    docstore = MmapDocStore(config.MMAP_DOCSTORE_PATH)
+    parent_ids = set(docstore.yield_keys())
+    docstore.close()
+    return children, parent_ids
+
+
+def sections_of(children):
+    return {child.page_content.split("\n")[0] for child in children.values()}
+
+
+def test_first_run_indexes_every_chunk_and_writes_a_manifest(store_config, ingest):
+    stats = ingest("intro", "trees")
+    children, parent_ids = load_store(store_config)
+    assert stats["embedded"] == stats["chunks"] == len(children)
+    assert stats["removed"] == 0
+    assert {child.metadata["doc_id"] for child in children.values()} == parent_ids
+    assert all(child.metadata["source"] == "notes.pdf" for child in children.values())
+    assert read_manifest(manifest_path(store_config))["version"] == stats["version"]
+    assert os.path.isfile(store_config.BM25_INDEX_PATH)
+
+
+def test_unchanged_rerun_embeds_nothing_and_keeps_the_version(store_config, ingest):
+    first = ingest("intro", "trees")
+    second = ingest("intro", "trees")
+    assert second["embedded"] == 0 and second["removed"] == 0
+    assert second["version"] == first["version"]
+
+
+def test_rerun_removes_chunks_and_parents_of_deleted_sections(store_config, ingest):
+    ingest("intro", "trees", "bayes")
+    before, parents_before = load_store(store_config)
+    stats = ingest("intro", "bayes")
+    after, parents_after = load_store(store_config)
+
+    removed = {child_id for child_id, child in before.items() if "Trees" in child.page_content.split("\n")[0]}
+    assert removed and stats["removed"] == len(removed)
+    assert stats["embedded"] == 0
+    assert set(after) == set(before) - removed
+    assert parents_after == parents_before - {before[child_id].metadata["doc_id"] for child_id in removed}
+    assert not any("Trees" in section for section in sections_of(after))
+
+
+def test_other_sources_are_left_alone(store_config, ingest):
+    ingest("intro", source="a.pdf")
+    ingest("trees", source="b.pdf")
+    ingest("bayes", source="a.pdf")
+    children, _ = load_store(store_config)
+    by_source = {}
+    for child in children.values():
+        by_source.setdefault(child.metadata["source"], set()).update(sections_of({0: child}))
+    assert by_source == {"a.pdf": {"3. Bayes"}, "b.pdf": {"2. Trees"}}
+
+
+def test_rebuild_starts_from_scratch(store_config, ingest):
+    ingest("intro", source="a.pdf")
+    ingest("trees", source="b.pdf")
+    stats = ingest("trees", source="b.pdf", rebuild=True)
+    children, parent_ids = load_store(store_config)
+    assert stats["embedded"] == len(children)
+    assert {child.metadata["source"] for child in children.values()} == {"b.pdf"}
+    assert {child.metadata["doc_id"] for child in children.values()} == parent_ids
+
+
+def write_legacy_store(config):
+    # Stores built before incremental ingestion only recorded doc_id on their children.
+    embeddings = ResourceLoader(config).build_embedding_model()
+    legacy = FAISS.from_documents(
+        [Document(page_content=f"old chunk {n}", metadata={"doc_id": f"old-{n}"}) for n in range(5)], embeddings)
+    legacy.save_local(config.DB_FAISS_PATH)
+
+
+def test_a_store_with_chunks_without_a_source_is_left_untouched(store_config, ingest):
+    write_legacy_store(store_config)
+    with open(os.path.join(store_config.DB_FAISS_PATH, "index.faiss"), "rb") as f:
+        before = f.read()
+    with pytest.raises(ValueError, match="--drop-legacy"):
+        ingest("intro")
+    with open(os.path.join(store_config.DB_FAISS_PATH, "index.faiss"), "rb") as f:
+        assert f.read() == before
+    assert not os.path.exists(manifest_path(store_config))
+
+
+def test_chunks_without_a_source_are_removed_on_request(store_config, ingest):
+    write_legacy_store(store_config)
+    stats = ingest("intro", drop_legacy=True)
+    children, _ = load_store(store_config)
+    assert stats["removed"] == 5
+    assert len(children) == stats["chunks"]
+    assert all(child.metadata.get("source") == "notes.pdf" for child in children.values())
+    assert ingest("intro")["removed"] == 0
+
+
+def test_deletes_rebuild_a_compressed_index(store_config, ingest):
+    store_config.FAISS_INDEX_TYPE = "fp16"
+    ingest("intro", "trees", "bayes")
+    stats = ingest("intro", "bayes")
+    children, parent_ids = load_store(store_config)
+    assert stats["index_rebuilt"] and stats["removed"] > 0
+    assert len(children) == stats["chunks"]
+    assert not any("Trees" in section for section in sections_of(children))
+    assert {child.metadata["doc_id"] for child in children.values()} == parent_ids
@@ -1,12 +1,21 @@
 import streamlit as st
-from typing import Optional, List, Dict
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Optional, List, Dict
 
-from rag_components.retrieval_chain import RAGChainManager 
+from rag_components.image_record import ImageRecord
+
+if TYPE_CHECKING:
+    # Only for annotations: importing the chain pulls in LangChain and FAISS, which app.py defers.
+    from rag_components.retrieval_chain import RAGChainManager
 
 
 class MainUI:
-    def __init__(self, rag_chain_manager: RAGChainManager):
+    TITLE = "📘 Pdf ChatBot"
+    CHAT_PLACEHOLDER = "Ask a question about the document"
+
+    def __init__(self, rag_chain_manager: "RAGChainManager", startup_report: Optional[Dict[str, Any]] = None):
         self.rag_chain_manager = rag_chain_manager
+        self.startup_report = startup_report
         self._initialize_session_state()
 
     def _initialize_session_state(self):
@@ -17,6 +26,20 @@ class MainUI:
             st.session_state.retrieved_texts_for_display = []
         if "retrieved_images_for_display" not in st.session_state:
             st.session_state.retrieved_images_for_display = []
+        if "last_conversation_plan" not in st.session_state:
+            st.session_state.last_conversation_plan = None
+        if "conversation" not in st.session_state:
+            # Imported here, like RAGChainManager: MainUI is part of app.py's fast startup shell.
+            from rag_components.context_packer import TokenCounter
+            from rag_components.conversation import ConversationMemory
+
+            config = self.rag_chain_manager.resource_loader.config
+            st.session_state.conversation = ConversationMemory(
+                token_budget=config.CONVERSATION_HISTORY_TOKEN_BUDGET,
+                recent_turns=config.CONVERSATION_RECENT_TURNS,
+                model_name=config.LLM_MODEL_NAME,
+                token_counter=TokenCounter(config.LLM_MODEL_NAME, estimate_only=config.LLM_PROVIDER == "fake"),
+            )
 
 
     def display_chat_history(self):
@@ -29,6 +52,16 @@ class MainUI:
         """Displays retrieved text and images in the sidebar."""
         with st.sidebar:
             st.subheader("📄 Retrieved Context (for last query)")
+            plan = st.session_state.last_conversation_plan
+            if plan and plan["route"] == "reuse":
+                st.caption("🔁 Follow-up answered from the previous context.")
+            elif plan and plan["route"] == "rewrite":
+                st.caption(f"🔎 Searched for: {plan['query']}")
+            if st.session_state.messages and st.button("Clear conversation"):
+                st.session_state.messages = []
+                st.session_state.conversation.clear()
+                st.session_state.last_conversation_plan = None
+                st.rerun()
             
             if not st.session_state.retrieved_texts_for_display and not st.session_state.retrieved_images_for_display:
                  st.info("No content retrieved yet, or retrieval was empty.")
@@ -41,40 +74,113 @@ class MainUI:
 
             if st.session_state.retrieved_images_for_display:
                 st.markdown("**Images:**")
-                for i, img_b64 in enumerate(st.session_state.retrieved_images_for_display):
-                     st.image(f"data:image/jpeg;base64,{img_b64}", caption=f"Image {i+1}")
+                for i, (image, caption) in enumerate(st.session_state.retrieved_images_for_display):
+                     st.image(image, caption=caption or f"Image {i+1}")
 
 
     def run(self):
         """Runs the Streamlit UI application."""
-        st.title("📘 Pdf ChatBot")
+        st.title(self.TITLE)
 
         self.display_chat_history()
 
+        documents = self._select_documents()
         self.display_retrieved_content_sidebar() 
+        if self.startup_report:
+            self.display_startup_report(self.startup_report)
 
-        if prompt := st.chat_input("Ask a question about the document"):
+        if prompt := st.chat_input(self.CHAT_PLACEHOLDER):
             st.session_state.messages.append({"role": "user", "content": prompt})
             with st.chat_message("user"):
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    try:
-                       
-                        parsed_docs_for_sidebar = self.rag_chain_manager.retrieve_documents(prompt)
-                        
-                        st.session_state.retrieved_texts_for_display = [
-                            doc.page_content for doc in parsed_docs_for_sidebar.get("texts", [])
-                        ]
-                        st.session_state.retrieved_images_for_display = parsed_docs_for_sidebar.get("images", [])
-                        
-            
-                        response = self.rag_chain_manager.invoke(prompt)
-                        st.markdown(response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        
-                        st.rerun()
-
-                    except Exception as e:
-                        st.error(f"An error occurred: {e}")
+                try:
+                    response = st.write_stream(self._stream_answer(prompt, documents))
+                    st.session_state.messages.append({"role": "assistant", "content": response})
+
+                    st.rerun()
+
+                except Exception as e:
+                    st.error(f"An error occurred: {e}")
+
+    def _select_documents(self) -> Optional[List[str]]:
+        """In collection mode, lets the user restrict questions to some documents (none selected = all)."""
+        collection = self.rag_chain_manager.collection
+        if collection is None:
+            return None
+        catalog = collection.documents()
+        with st.sidebar:
+            selected = st.multiselect(
+                "📚 Documents", options=list(catalog),
+                format_func=lambda key: catalog[key].get("source", key),
+                help="Leave empty to search every document.",
+            )
+        return selected or None
+
+    def _stream_answer(self, prompt: str, documents: Optional[List[str]] = None):
+        """Yields answer tokens for st.write_stream and stores the retrieved context for the sidebar."""
+        config = self.rag_chain_manager.resource_loader.config
+        with st.spinner("Thinking..."):
+            # Retrieval finishes before the first event, so the spinner covers it.
+            if config.CONVERSATION_ENABLED:
+                from rag_components.conversation import ConversationalRAG
+
+                conversation = ConversationalRAG(
+                    self.rag_chain_manager, st.session_state.conversation, config.CONVERSATION_REWRITE_MODE
+                )
+                events = conversation.stream(prompt, documents)
+            else:
+                events = self.rag_chain_manager.stream(prompt, documents)
+            head = []
+            for event in events:
+                head.append(event)
+                if "conversation" not in event:
+                    break
+        if not head:
+            return
+        for event in chain(head, events):
+            if "conversation" in event:
+                st.session_state.last_conversation_plan = event["conversation"]
+            elif "context" in event:
+                parsed_docs_for_sidebar = event["context"]
+                st.session_state.retrieved_texts_for_display = [
+                    doc.page_content for doc in parsed_docs_for_sidebar.get("texts", [])
+                ]
+                # Only thumbnails (and captions) are kept per session; legacy base64 strings become data URLs.
+                st.session_state.retrieved_images_for_display = [
+                    (image.thumbnail, image.caption) if isinstance(image, ImageRecord) else (f"data:image/jpeg;base64,{image}", None)
+                    for image in parsed_docs_for_sidebar.get("images", [])
+                ]
+            elif "answer" in event:
+                yield event["answer"]
+
+    @staticmethod
+    def render_startup(status: Dict[str, Any], report: Optional[Dict[str, Any]] = None):
+        """
+        The shell shown while resources load in the background: title, progress, a disabled
+        chat input and, once known, the startup timing breakdown.
+        """
+        st.title(MainUI.TITLE)
+        if status["state"] == "failed":
+            st.error(f"Initialization Error: {status['error']}. Reload the page to retry.")
+        else:
+            label = {"pending": "Starting...", "importing": "Importing libraries", "loading": "Loading the index and models"}
+            text = label.get(status["state"], status["state"])
+            if status.get("detail"):
+                text += f" ({status['detail']})"
+            st.progress(status["progress"], text=f"{text} · {status['elapsed_seconds']:.1f}s")
+        st.chat_input(MainUI.CHAT_PLACEHOLDER, disabled=True)
+        if report:
+            MainUI.display_startup_report(report)
+
+    @staticmethod
+    def display_startup_report(report: Dict[str, Any]):
+        """Import and load durations collected by BackgroundLoader, slowest first."""
+        with st.sidebar.expander("⏱️ Startup timings"):
+            st.caption(f"Shell imports (streamlit, config): {report['shell_imports']:.3f}s")
+            for title, timings in (("Imports", report["imports"]), ("Loading", report["load"]), ("Milestones", report["marks"])):
+                if timings:
+                    st.markdown(f"**{title}**")
+                    rows = sorted(timings.items(), key=lambda item: item[1], reverse=title != "Milestones")
+                    st.table({"step": [name for name, _ in rows], "seconds": [round(seconds, 3) for _, seconds in rows]})
@@ -0,0 +1,451 @@
+import argparse
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from config import AppConfig
+from rag_components.bm25_index import BM25Index
+from rag_components.chunking import SectionSummarizer, build_chunker, content_hash
+from rag_components.collection_manager import CollectionManager, document_key
+from rag_components.doc_store import MmapDocStore, convert_pickle_docstore
+from rag_components.image_captions import ImageCaptioner
+from rag_components.image_record import ImageRecord
+from rag_components.index_factory import (
+    COMPRESSED_INDEX_TYPES, build_index, compression_report, index_params_from_config, index_type_of, load_exact_vectors,
+    read_index_meta, reconstruct_vectors, remove_exact_vectors, write_exact_vectors, write_index_meta,
+)
+from rag_components.index_manifest import update_manifest
+from rag_components.resource_loader import ResourceLoader
+
+
+def page_ranges(num_pages: int, workers: int) -> List[Tuple[int, int]]:
+    """Splits [0, num_pages) into at most `workers` contiguous (start, end) ranges."""
+    if num_pages <= 0:
+        return []
+    per_worker = math.ceil(num_pages / max(1, workers))
+    return [(start, min(start + per_worker, num_pages)) for start in range(0, num_pages, per_worker)]
+
+
+def extract_page_range(pdf_path: str, start: int, end: int, thumbnail_max_side: int = 512) -> List[Dict[str, Any]]:
+    """
+    Worker entry point: extracts text and embedded images for pages [start, end) and
+    builds each image's thumbnail. Each worker opens its own reader, so nothing
+    unpicklable crosses the process boundary.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_number in range(start, end):
+        page = reader.pages[page_number]
+        images = []
+        try:
+            for image in page.images:
+                record = ImageRecord.from_bytes(
+                    image.data,
+                    max_side=thumbnail_max_side,
+                    metadata={"source": os.path.basename(pdf_path), "page": page_number + 1},
+                )
+                images.append({"name": image.name, "data": image.data, "record": record})
+        except Exception as e:
+            print(f"[WARN] vector_loader.py: Could not extract images from page {page_number + 1}: {e}")
+        pages.append({
+            "page": page_number + 1,
+            "text": page.extract_text() or "",
+            "images": images,
+        })
+    return pages
+
+
+class PDFIngestionPipeline:
+    """
+    Extracts a PDF in parallel, chunks it (see rag_components/chunking.py), and writes child
+    vectors to FAISS and parent documents to the MmapDocStore under content-hash ids. Images
+    are captioned and indexed by their caption. Re-running on the same or an edited PDF only embeds chunks
+    whose content changed and drops the ones that disappeared.
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        embedding_model=None,
+        max_workers: Optional[int] = None,
+        embed_batch_size: int = 64,
+        max_concurrent_batches: int = 4,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        image_dir: Optional[str] = None,
+        captioner: Optional[ImageCaptioner] = None,
+        summarizer: Optional[SectionSummarizer] = None,
+    ):
+        self.config = config
+        # One loader, so embeddings and captioning share its OpenAI connection pool and rate limits.
+        resource_loader = ResourceLoader(config)
+        self.embedding_model = embedding_model or resource_loader.build_embedding_model()
+        needs_captioner = captioner is None and config.IMAGE_CAPTIONS_ENABLED
+        needs_summarizer = summarizer is None and config.CHUNK_SUMMARIES_ENABLED
+        llm = resource_loader.build_llm() if needs_captioner or needs_summarizer else None
+        if needs_captioner:
+            captioner = ImageCaptioner.from_config(config, llm)
+        if needs_summarizer:
+            summarizer = SectionSummarizer.from_config(config, llm)
+        self.captioner = captioner
+        self.summarizer = summarizer
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.chunker = build_chunker(config, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.image_dir = image_dir
+        self.index_meta = None
+        self.exact_vectors = None  # float32 side file contents for a rebuilt compressed index
+
+    def extract(self, pdf_path: str) -> List[Dict[str, Any]]:
+        from pypdf import PdfReader
+
+        num_pages = len(PdfReader(pdf_path).pages)
+        thumbnail_max_side = self.config.THUMBNAIL_MAX_SIDE
+        ranges = page_ranges(num_pages, self.max_workers)
+        print(f"[INFO] PDFIngestionPipeline: Extracting {num_pages} pages from {pdf_path} in {len(ranges)} worker(s)...")
+        if len(ranges) <= 1:
+            return [page for start, end in ranges for page in extract_page_range(pdf_path, start, end, thumbnail_max_side)]
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(extract_page_range, pdf_path, start, end, thumbnail_max_side)
+                for start, end in ranges
+            ]
+            return [page for future in futures for page in future.result()]
+
+    def caption_images(self, pages: List[Dict[str, Any]]) -> int:
+        """Puts a caption into each image record's metadata; returns how many images got one."""
+        images = [image for page in pages for image in page["images"]]
+        if self.captioner is None or not images:
+            return 0
+        captions = self.captioner.caption([image["record"] for image in images])
+        for image, caption in zip(images, captions):
+            if caption:
+                image["record"] = image["record"].with_metadata(caption=caption)
+        return sum(1 for caption in captions if caption)
+
+    def build_records(self, pdf_path: str, pages: List[Dict[str, Any]]) -> Tuple[Dict[str, Document], Dict[str, Any]]:
+        """
+        Returns ({child id: child document to embed}, {doc_id: parent}) for every section,
+        summary and image. A child points at its parent through metadata["doc_id"]; an image
+        is its own child's id.
+        """
+        source = os.path.basename(pdf_path)
+        parents: Dict[str, Any]
+        children: Dict[str, Document]
+        parents, children = self.chunker.split(pages, source)
+        if self.summarizer is not None:
+            for doc_id, summary in self.summarizer.summarize(parents).items():
+                section = parents[doc_id].metadata.get("section", "")
+                child_id = content_hash("summary", source, f"{doc_id}\x00{summary}")
+                children[child_id] = Document(
+                    page_content=f"{section}\nSummary: {summary}" if section else f"Summary: {summary}",
+                    metadata={"doc_id": doc_id, "source": source, "page": parents[doc_id].metadata["page"], "type": "summary"},
+                )
+        for page in pages:
+            for image in page["images"]:
+                doc_id = content_hash("image", source, image["data"])
+                self._export_image(doc_id, image)
+                parents[doc_id] = image["record"]
+                # Images are found through their caption, or else the text of the page they appear on.
+                child_text = image["record"].caption_text() or f"Image on page {page['page']} of {source}. {page['text'][:500]}"
+                children[doc_id] = Document(
+                    page_content=child_text,
+                    metadata={"doc_id": doc_id, "source": source, "page": page["page"], "type": "image"},
+                )
+        return children, parents
+
+    def _export_image(self, doc_id: str, image: Dict[str, Any]):
+        if not self.image_dir:
+            return
+        os.makedirs(self.image_dir, exist_ok=True)
+        extension = os.path.splitext(image["name"])[1] or ".bin"
+        with open(os.path.join(self.image_dir, f"{doc_id}{extension}"), "wb") as f:
+            f.write(image["data"])
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts in fixed-size batches with at most `max_concurrent_batches` requests in flight."""
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+        if not batches:
+            return []
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as executor:
+            results = executor.map(self.embedding_model.embed_documents, batches)
+            return [vector for batch in results for vector in batch]
+
+    def load_existing(self, rebuild: bool = False) -> Tuple[Optional[FAISS], MmapDocStore]:
+        docstore_path = self.config.MMAP_DOCSTORE_PATH
+        if rebuild:
+            if os.path.isdir(docstore_path):
+                shutil.rmtree(docstore_path)
+            return None, MmapDocStore(docstore_path)
+        vectorstore = None
+        if os.path.exists(self.config.DB_FAISS_PATH):
+            vectorstore = FAISS.load_local(
+                self.config.DB_FAISS_PATH,
+                self.embedding_model,
+                allow_dangerous_deserialization=True,
+            )
+        if not MmapDocStore.exists(docstore_path) and os.path.exists(self.config.DOCSTORE_PATH):
+            return vectorstore, convert_pickle_docstore(
+                self.config.DOCSTORE_PATH, docstore_path, thumbnail_max_side=self.config.THUMBNAIL_MAX_SIDE
+            )
+        return vectorstore, MmapDocStore(docstore_path)
+
+    def run(self, pdf_path: str, rebuild: bool = False, drop_legacy: bool = False) -> Dict[str, Any]:
+        """
+        Ingests one PDF into the store. A store built before incremental ingestion has
+        chunks that do not record their PDF; the run refuses to touch it unless `rebuild`
+        starts over or `drop_legacy` deletes those chunks.
+        """
+        started = time.perf_counter()
+        pages = self.extract(pdf_path)
+        extracted = time.perf_counter()
+        captioned = self.caption_images(pages)
+        captioned_at = time.perf_counter()
+
+        children, parents = self.build_records(pdf_path, pages)
+        vectorstore, docstore = self.load_existing(rebuild)
+
+        source = os.path.basename(pdf_path)
+        new_texts = {child_id: child.page_content for child_id, child in children.items()}
+        existing_ids = set()
+        stale_ids = []
+        stale_parent_ids = set()
+        # Same id, different child text: an image that gained (or changed) its caption.
+        changed_ids = []
+        legacy_ids = []
+        if vectorstore is not None:
+            for child_id in vectorstore.index_to_docstore_id.values():
+                existing_ids.add(child_id)
+                child = vectorstore.docstore.search(child_id)
+                if not isinstance(child, Document):
+                    continue
+                if "source" not in child.metadata:
+                    # Built before incremental ingestion: nothing says which PDF the chunk came
+                    # from, and its parent is not in the MmapDocStore, so it cannot be kept.
+                    legacy_ids.append(child_id)
+                    stale_ids.append(child_id)
+                    stale_parent_ids.add(child.metadata.get("doc_id", child_id))
+                    continue
+                if child.metadata["source"] != source:
+                    continue
+                if child_id not in new_texts:
+                    stale_ids.append(child_id)
+                    stale_parent_ids.add(child.metadata.get("doc_id", child_id))
+                elif child.page_content != new_texts[child_id]:
+                    changed_ids.append(child_id)
+        existing_ids.difference_update(changed_ids)
+        if legacy_ids:
+            if not drop_legacy:
+                raise ValueError(
+                    f"{self.config.DB_FAISS_PATH} has {len(legacy_ids)} chunks without a source, from before incremental "
+                    "ingestion; they may belong to other PDFs. Re-run with --rebuild and re-ingest every PDF, or with "
+                    "--drop-legacy to delete them."
+                )
+            print(f"[WARN] PDFIngestionPipeline: Removing {len(legacy_ids)} chunks without a source from a store built "
+                  "before incremental ingestion. Re-ingest any other PDFs they came from.")
+        # A parent goes once none of the current children point at it (re-chunked sections get new ids).
+        stale_parent_ids.difference_update(parents)
+
+        to_embed = [(child_id, child) for child_id, child in children.items() if child_id not in existing_ids]
+        print(f"[INFO] PDFIngestionPipeline: {len(children)} chunks in {len(parents)} parents, {len(to_embed)} new "
+              f"({len(changed_ids)} changed), {len(stale_ids)} stale.")
+
+        vectors = self.embed([child.page_content for _, child in to_embed])
+        embedded = time.perf_counter()
+
+        rebuild_index = self._needs_index_rebuild(vectorstore, changed=bool(to_embed or stale_ids))
+        if rebuild_index:
+            vectorstore = self.rebuild_index(vectorstore, to_embed, vectors, stale_ids + changed_ids)
+        elif to_embed:
+            if changed_ids:
+                vectorstore.delete(changed_ids)
+            text_embeddings = [(child.page_content, vector) for (_, child), vector in zip(to_embed, vectors)]
+            metadatas = [child.metadata for _, child in to_embed]
+            ids = [child_id for child_id, _ in to_embed]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, self.embedding_model, metadatas=metadatas, ids=ids)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        # Parents are written before the index that points at them.
+        stored_ids = set(docstore.yield_keys()).difference(changed_ids)
+        docstore.mset([(doc_id, parent) for doc_id, parent in parents.items() if doc_id not in stored_ids])
+        if stale_ids and not rebuild_index:
+            vectorstore.delete(stale_ids)
+        self.save(vectorstore)
+        if stale_parent_ids:
+            docstore.mdelete(list(stale_parent_ids))
+        if stale_ids or changed_ids:
+            docstore.compact()
+        # Written last: a new manifest version tells running apps the whole build is on disk.
+        version = update_manifest(self.config)["version"] if vectorstore is not None else None
+        finished = time.perf_counter()
+        stats = {
+            "pages": len(pages),
+            "chunks": len(children),
+            "parents": len(parents),
+            "summaries": sum(1 for child in children.values() if child.metadata.get("type") == "summary"),
+            "embedded": len(to_embed),
+            "removed": len(stale_ids),
+            "images": sum(len(page["images"]) for page in pages),
+            "images_captioned": captioned,
+            "index_rebuilt": rebuild_index,
+            "version": version,
+            "extract_seconds": round(extracted - started, 3),
+            "caption_seconds": round(captioned_at - extracted, 3),
+            "embed_seconds": round(embedded - captioned_at, 3),
+            "total_seconds": round(finished - started, 3),
+        }
+        print(f"[INFO] PDFIngestionPipeline: Done. {stats}")
+        return stats
+
+    def _needs_index_rebuild(self, vectorstore: Optional[FAISS], changed: bool) -> bool:
+        """
+        Flat indexes are updated in place. IVF/HNSW/PQ indexes are rebuilt (and retrained)
+        whenever their contents change or the configured index type differs from the stored one.
+        """
+        configured = self.config.FAISS_INDEX_TYPE
+        if vectorstore is None:
+            return configured != "flat"
+        existing = index_type_of(vectorstore.index)
+        if configured == "flat" and existing == "flat":
+            return False
+        meta = read_index_meta(self.config.DB_FAISS_PATH) or {}
+        return changed or meta.get("requested_index_type", existing) != configured
+
+    def rebuild_index(self, vectorstore: Optional[FAISS], new_children: List[Tuple[str, Document]],
+                      new_vectors: List[List[float]], stale_ids: List[str]) -> FAISS:
+        """Builds a fresh index of FAISS_INDEX_TYPE from the retained children plus the new ones."""
+        stale = set(stale_ids)
+        children: List[Tuple[str, Document]] = []
+        retained_vectors = None
+        if vectorstore is not None:
+            positions = sorted(vectorstore.index_to_docstore_id)
+            children = [(vectorstore.index_to_docstore_id[pos], vectorstore.docstore.search(vectorstore.index_to_docstore_id[pos]))
+                        for pos in positions]
+            # Exact vectors come from the side file when there is one, not from lossy codes.
+            stored = load_exact_vectors(self.config.DB_FAISS_PATH, vectorstore.index.ntotal)
+            if stored is None:
+                stored = reconstruct_vectors(vectorstore.index)
+            keep = [i for i, (child_id, _) in enumerate(children) if child_id not in stale]
+            children = [children[i] for i in keep]
+            if stored is not None:
+                retained_vectors = np.asarray(stored[keep], dtype=np.float32)
+            else:
+                # PQ / SQ8 codes cannot be retrained on; re-embed, which the embedding cache makes cheap.
+                print(f"[INFO] PDFIngestionPipeline: Re-embedding {len(children)} retained chunks to retrain the index...")
+                retained_vectors = np.array(self.embed([child.page_content for _, child in children]), dtype=np.float32)
+        children += new_children
+        parts = [vectors for vectors in (retained_vectors, np.array(new_vectors, dtype=np.float32)) if vectors is not None and len(vectors)]
+        if not parts:
+            return vectorstore
+        all_vectors = np.concatenate(parts)
+        built = build_index(all_vectors, self.config.FAISS_INDEX_TYPE, index_params_from_config(self.config))
+        self.index_meta = built["meta"]
+        if built["meta"]["index_type"] in COMPRESSED_INDEX_TYPES:
+            rescore_factor = self.config.FAISS_RESCORE_FACTOR if self.config.FAISS_RESCORE_EXACT else None
+            report = compression_report(built["index"], all_vectors, rescore_factor=rescore_factor)
+            self.index_meta["compression"] = report
+            print(f"[INFO] PDFIngestionPipeline: {built['meta']['factory']} uses {report['index_bytes'] / 2**20:.1f} MiB "
+                  f"instead of {report['float32_bytes'] / 2**20:.1f} MiB ({report['memory_saved']:.0%} saved); "
+                  + ", ".join(f"{key} {value:.3f}" for key, value in report.items() if "recall" in key) + ".")
+            if self.config.FAISS_RESCORE_EXACT:
+                self.exact_vectors = all_vectors
+        return FAISS(
+            embedding_function=self.embedding_model,
+            index=built["index"],
+            docstore=InMemoryDocstore({child_id: child for child_id, child in children}),
+            index_to_docstore_id={i: child_id for i, (child_id, _) in enumerate(children)},
+        )
+
+    def save(self, vectorstore: Optional[FAISS]):
+        if vectorstore is None:
+            print("[WARN] PDFIngestionPipeline: Nothing to save, no chunks were extracted.")
+            return
+        vectorstore.save_local(self.config.DB_FAISS_PATH)
+        existing_meta = read_index_meta(self.config.DB_FAISS_PATH) or {}
+        if self.index_meta is None and existing_meta.get("ntotal") == vectorstore.index.ntotal:
+            # Unchanged index: keep what the build recorded (factory, compression report).
+            self.index_meta = existing_meta
+        meta = self.index_meta or {
+            "index_type": index_type_of(vectorstore.index),
+            "requested_index_type": self.config.FAISS_INDEX_TYPE,
+            "dim": vectorstore.index.d,
+            "ntotal": int(vectorstore.index.ntotal),
+            "built_at": time.time(),
+        }
+        write_index_meta(self.config.DB_FAISS_PATH, meta)
+        if self.exact_vectors is not None:
+            write_exact_vectors(self.config.DB_FAISS_PATH, self.exact_vectors)
+        elif index_type_of(vectorstore.index) not in COMPRESSED_INDEX_TYPES or not self.config.FAISS_RESCORE_EXACT:
+            remove_exact_vectors(self.config.DB_FAISS_PATH)
+        BM25Index.from_vectorstore(vectorstore, id_key="doc_id").save(self.config.BM25_INDEX_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a PDF into the FAISS vector store and docstore.")
+    parser.add_argument("pdf_path", help="Path to the PDF to ingest")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per embedding request")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--image-dir", default=None, help="Also write extracted images to this directory")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the existing index and build from scratch")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="Delete chunks without a source left by a store built before incremental ingestion")
+    parser.add_argument("--captions", action="store_true",
+                        help="Caption images with the chat model and index them by their caption (IMAGE_CAPTIONS_ENABLED)")
+    parser.add_argument("--chunking", choices=("structured", "recursive"), default=None,
+                        help="Chunking strategy (default: CHUNKING_STRATEGY)")
+    parser.add_argument("--summaries", action="store_true", help="Also embed an LLM summary of each long section")
+    parser.add_argument("--collection", nargs="?", const=AppConfig.COLLECTION_PATH or "vectorstore/collection", default=None,
+                        help="Ingest into this document collection (one shard per PDF) instead of the single index")
+    parser.add_argument("--document-key", default=None, help="Catalog key for the PDF (default: derived from the file name)")
+    parser.add_argument("--publish", nargs="?", const=AppConfig.SHARED_INDEX_PATH or "vectorstore/serving", default=None,
+                        help="Afterwards, publish a read-only snapshot here for multi-process serving")
+    args = parser.parse_args()
+    if args.publish and args.collection:
+        parser.error("--publish covers the single index; it cannot be combined with --collection")
+
+    if AppConfig.EMBEDDING_PROVIDER == "openai" and not AppConfig.OPENAI_API_KEY:
+        raise ValueError("OpenAI API key not found. Please set it in the .env file or as an environment variable.")
+    config_class = AppConfig
+    collection = None
+    if args.collection:
+        collection = CollectionManager(args.collection)
+        key = args.document_key or document_key(args.pdf_path)
+        config_class = collection.shard_config(AppConfig, key)
+    config = config_class()
+    if args.captions:
+        config.IMAGE_CAPTIONS_ENABLED = True
+    if args.chunking:
+        config.CHUNKING_STRATEGY = args.chunking
+    if args.summaries:
+        config.CHUNK_SUMMARIES_ENABLED = True
+    pipeline = PDFIngestionPipeline(
+        config,
+        max_workers=args.workers,
+        embed_batch_size=args.batch_size,
+        max_concurrent_batches=args.max_concurrency,
+        image_dir=args.image_dir,
+    )
+    stats = pipeline.run(args.pdf_path, rebuild=args.rebuild, drop_legacy=args.drop_legacy)
+    if collection is not None:
+        collection.register(key, os.path.basename(args.pdf_path), stats)
+    if args.publish:
+        from rag_components.shared_index import publish_snapshot
+
+        publish_snapshot(config, args.publish)
+
+
+if __name__ == "__main__":
+    main()